@@ -0,0 +1,126 @@
+"""
+Order retention: move old orders out of the live tables.
+
+    python -m app.archive [--days 365] [--batch-size 1000] [--max-batches N]
+
+Orders older than `ARCHIVE_AFTER_DAYS` are moved, with their items, to
+`orders_archive` / `order_items_archive`. Each batch is one short
+transaction: copy with INSERT ... SELECT, then delete from the live tables.
+Live tables and their indexes stay roughly the size of the horizon.
+On Postgres the archive tables are range-partitioned by month; the
+partitions are created as needed, and dropping a month is a `DROP TABLE`.
+
+Only orders already folded into the sales rollups and the recommendation
+counts are moved. Both are caught up first, so all-time sales numbers (which
+read the rollups) stay exact after archival.
+"""
+import argparse
+import os
+import time
+from datetime import datetime, timedelta
+
+from sqlalchemy import delete, insert, select, text
+
+from . import models, recommendations, rollups
+from .database import SessionLocal
+
+AFTER_DAYS = int(os.getenv("ARCHIVE_AFTER_DAYS", 365))
+BATCH_SIZE = int(os.getenv("ARCHIVE_BATCH_SIZE", 1000))
+
+_ORDER_COLUMNS = ("id", "created_at", "user_id", "total_amount", "store_id")
+_ITEM_COLUMNS = ("id", "order_id", "product_id", "quantity", "price_at_purchase")
+
+
+def _month_start(dt: datetime) -> datetime:
+    return datetime(dt.year, dt.month, 1)
+
+
+def _next_month(dt: datetime) -> datetime:
+    return datetime(dt.year + dt.month // 12, dt.month % 12 + 1, 1)
+
+
+def ensure_partitions(db, first: datetime, last: datetime):
+    """Create the monthly archive partitions covering [first, last] (Postgres only)."""
+    if db.bind.dialect.name != "postgresql":
+        return
+    month = _month_start(first)
+    while month <= last:
+        upper = _next_month(month)
+        for table in ("orders_archive", "order_items_archive"):
+            db.execute(text(
+                f"CREATE TABLE IF NOT EXISTS {table}_{month:%Y_%m} PARTITION OF {table} "
+                f"FOR VALUES FROM ('{month:%Y-%m-%d}') TO ('{upper:%Y-%m-%d}')"
+            ))
+        month = upper
+
+
+def archive_batch(db, cutoff: datetime, batch_size: int = BATCH_SIZE) -> int:
+    """Move up to `batch_size` orders created before `cutoff`. Caller commits."""
+    Order, OI = models.Order, models.OrderItem
+    q = (
+        select(Order.id, Order.created_at)
+        .where(Order.created_at < cutoff, Order.rolled_up == True, Order.recs_indexed == True)  # noqa: E712
+        .order_by(Order.id)
+        .limit(batch_size)
+    )
+    if db.bind.dialect.name == "postgresql":
+        q = q.with_for_update(skip_locked=True)
+    rows = db.execute(q).all()
+    if not rows:
+        return 0
+    ids = [r.id for r in rows]
+    ensure_partitions(db, min(r.created_at for r in rows), max(r.created_at for r in rows))
+
+    db.execute(
+        insert(models.OrderArchive).from_select(
+            _ORDER_COLUMNS, select(*[Order.__table__.c[c] for c in _ORDER_COLUMNS]).where(Order.id.in_(ids))
+        )
+    )
+    db.execute(
+        insert(models.OrderItemArchive).from_select(
+            (*_ITEM_COLUMNS, "created_at"),
+            select(*[OI.__table__.c[c] for c in _ITEM_COLUMNS], Order.created_at)
+            .join(Order, Order.id == OI.order_id)
+            .where(OI.order_id.in_(ids)),
+        )
+    )
+    db.execute(delete(OI).where(OI.order_id.in_(ids)))
+    db.execute(delete(Order).where(Order.id.in_(ids)))
+    return len(ids)
+
+
+def run(days: int = AFTER_DAYS, batch_size: int = BATCH_SIZE, max_batches: int = None, pause: float = 0.0) -> int:
+    """Archive everything older than `days`, one committed batch at a time."""
+    rollups.catch_up()
+    recommendations.catch_up()
+    cutoff = datetime.utcnow() - timedelta(days=days)
+    total = batches = 0
+    while max_batches is None or batches < max_batches:
+        db = SessionLocal()
+        try:
+            moved = archive_batch(db, cutoff, batch_size)
+            db.commit()
+        finally:
+            db.close()
+        if not moved:
+            break
+        total += moved
+        batches += 1
+        if pause:
+            time.sleep(pause)  # let foreground traffic through between batches
+    return total
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Move old orders into the archive tables.")
+    parser.add_argument("--days", type=int, default=AFTER_DAYS, help="archive orders older than this many days")
+    parser.add_argument("--batch-size", type=int, default=BATCH_SIZE)
+    parser.add_argument("--max-batches", type=int, default=None)
+    parser.add_argument("--pause", type=float, default=0.0, help="seconds to sleep between batches")
+    args = parser.parse_args(argv)
+    moved = run(args.days, args.batch_size, args.max_batches, args.pause)
+    print(f"archived {moved} orders")
+
+
+if __name__ == "__main__":
+    main()
@@ -3,6 +3,7 @@ from datetime import datetime, timedelta
 from jose import jwt
 import os
 from dotenv import load_dotenv
+from .metrics import BCRYPT_IN_PROGRESS
 
 load_dotenv()
 
@@ -15,7 +16,11 @@ def hash_password(password: str) -> str:
     """Hash password using bcrypt directly"""
     password_bytes = password.encode('utf-8')[:72]  # Truncate to 72 bytes
     salt = bcrypt.gensalt()
-    hashed = bcrypt.hashpw(password_bytes, salt)
+    BCRYPT_IN_PROGRESS.inc()
+    try:
+        hashed = bcrypt.hashpw(password_bytes, salt)
+    finally:
+        BCRYPT_IN_PROGRESS.dec()
     return hashed.decode('utf-8')
 
 
@@ -23,7 +28,11 @@ def verify_password(plain_password: str, hashed_password: str) -> bool:
     """Verify password using bcrypt directly"""
     password_bytes = plain_password.encode('utf-8')[:72]
     hashed_bytes = hashed_password.encode('utf-8')
-    return bcrypt.checkpw(password_bytes, hashed_bytes)
+    BCRYPT_IN_PROGRESS.inc()
+    try:
+        return bcrypt.checkpw(password_bytes, hashed_bytes)
+    finally:
+        BCRYPT_IN_PROGRESS.dec()
 
 
 def create_access_token(data: dict, expires_delta: timedelta | None = None) -> str:
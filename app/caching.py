@@ -0,0 +1,160 @@
+"""
+HTTP conditional caching for catalog reads (ETag / Last-Modified / 304).
+
+Single products are versioned by `(id, updated_at)`. List pages share one
+catalog-wide version, `(count, max(updated_at))` over `products`, which is kept
+in process memory for `CATALOG_VERSION_TTL` seconds. Within that window a
+matching `If-None-Match` is answered without touching the database. Product
+writes committed through the ORM in this process drop the cached version
+immediately; writes made by other workers show up once the TTL expires.
+
+List pages carry no `Last-Modified`: `max(updated_at)` doesn't move when a
+product is deleted, so `If-Modified-Since` would keep serving the deleted
+product. The ETag includes the count and does change.
+"""
+import hashlib
+import os
+import threading
+import time
+from collections import OrderedDict
+from email.utils import format_datetime, parsedate_to_datetime
+from datetime import timezone
+
+from fastapi import Request, Response
+from sqlalchemy import event, func
+
+from . import models
+from .compression import strip_etag_encoding
+from .database import SessionLocal
+from .metrics import record_cache
+
+# Cache-Control per route, overridable from the environment
+CACHE_CONTROL = {
+    "products.list": os.getenv("CACHE_CONTROL_PRODUCTS_LIST", "public, max-age=0, must-revalidate"),
+    "products.detail": os.getenv("CACHE_CONTROL_PRODUCTS_DETAIL", "public, max-age=0, must-revalidate"),
+    "products.facets": os.getenv("CACHE_CONTROL_PRODUCTS_FACETS", "public, max-age=0, must-revalidate"),
+}
+CATALOG_VERSION_TTL = float(os.getenv("CATALOG_VERSION_TTL", 1.0))
+CATALOG_MEMO_SIZE = int(os.getenv("CATALOG_MEMO_SIZE", 256))
+
+_lock = threading.Lock()
+_catalog = {"version": None, "checked": 0.0}
+_memo = OrderedDict()
+
+
+# ---------- catalog version ----------
+
+def cached_catalog_version():
+    """The cached catalog version if it's still within its TTL, else None."""
+    if _catalog["version"] is not None and time.monotonic() - _catalog["checked"] < CATALOG_VERSION_TTL:
+        return _catalog["version"]
+    return None
+
+
+def catalog_version(db):
+    """Version string of the whole product table."""
+    cached = cached_catalog_version()
+    record_cache("catalog_version", cached is not None)
+    if cached:
+        return cached
+
+    count, last_modified = db.query(func.count(models.Product.id), func.max(models.Product.updated_at)).one()
+    version = f"{count}.{_micros(last_modified)}"
+    with _lock:
+        _catalog.update(version=version, checked=time.monotonic())
+    return version
+
+
+def invalidate_catalog():
+    with _lock:
+        _catalog["version"] = None
+
+
+@event.listens_for(SessionLocal, "after_flush")
+def _track_product_writes(session, flush_context):
+    for obj in (*session.new, *session.dirty, *session.deleted):
+        if isinstance(obj, models.Product):
+            session.info["catalog_changed"] = True
+            return
+
+
+@event.listens_for(SessionLocal, "after_commit")
+def _invalidate_on_commit(session):
+    if session.info.pop("catalog_changed", False):
+        invalidate_catalog()
+
+
+@event.listens_for(SessionLocal, "after_rollback")
+def _forget_on_rollback(session):
+    session.info.pop("catalog_changed", None)
+
+
+# ---------- derived results ----------
+
+def memoize(name: str, version: str, key, compute):
+    """`compute()` cached per catalog version; a new version misses, old entries age out of the LRU."""
+    full_key = (name, version, key)
+    with _lock:
+        if full_key in _memo:
+            _memo.move_to_end(full_key)
+            record_cache(name, True)
+            return _memo[full_key]
+    record_cache(name, False)
+    value = compute()
+    with _lock:
+        _memo[full_key] = value
+        while len(_memo) > CATALOG_MEMO_SIZE:
+            _memo.popitem(last=False)
+    return value
+
+
+# ---------- ETags ----------
+
+def _micros(dt) -> int:
+    return int(dt.replace(tzinfo=timezone.utc).timestamp() * 1_000_000) if dt else 0
+
+
+def product_etag(product_id: int, updated_at) -> str:
+    return f'"p{product_id}-{_micros(updated_at)}"'
+
+
+def list_etag(version: str, request: Request) -> str:
+    # the same catalog version renders differently per filter, so the query is part of the tag
+    query = "&".join(sorted(f"{k}={v}" for k, v in request.query_params.multi_items()))
+    digest = hashlib.sha1(f"{version}?{query}".encode()).hexdigest()[:20]
+    return f'"c{digest}"'
+
+
+def http_date(dt) -> str:
+    return format_datetime(dt.replace(tzinfo=timezone.utc, microsecond=0), usegmt=True)
+
+
+def is_not_modified(request: Request, etag: str, last_modified=None) -> bool:
+    """RFC 9110: If-None-Match wins; If-Modified-Since is only used without it."""
+    if_none_match = request.headers.get("if-none-match")
+    if if_none_match is not None:
+        if if_none_match.strip() == "*":
+            return True
+        # compressed copies carry the tag with an encoding suffix; they're the same version
+        tags = [strip_etag_encoding(t.strip().removeprefix("W/")) for t in if_none_match.split(",")]
+        return etag in tags
+
+    if_modified_since = request.headers.get("if-modified-since")
+    if if_modified_since and last_modified is not None:
+        try:
+            since = parsedate_to_datetime(if_modified_since)
+        except (TypeError, ValueError):
+            return False
+        return last_modified.replace(tzinfo=timezone.utc, microsecond=0) <= since
+    return False
+
+
+def cache_headers(route: str, etag: str, last_modified=None) -> dict:
+    headers = {"ETag": etag, "Cache-Control": CACHE_CONTROL[route]}
+    if last_modified is not None:
+        headers["Last-Modified"] = http_date(last_modified)
+    return headers
+
+
+def not_modified(route: str, etag: str, last_modified=None) -> Response:
+    return Response(status_code=304, headers=cache_headers(route, etag, last_modified))
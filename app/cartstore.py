@@ -0,0 +1,401 @@
+"""
+Cart storage, optionally write-behind.
+
+Cart edits are the most frequent writes and the least valuable: most carts
+change many times and are never checked out. `CART_STORE` picks where they go:
+
+- `db` (default): every add/remove is its own transaction on `cart_items`.
+- `memory`: carts live in this process as `{product_id: quantity}` and are
+  written to `cart_items` in the background. Only for a single worker (or
+  sticky sessions), since other workers won't see the changes.
+- `local`: the same, but carts live in a SQLite file on this host
+  (`CART_STORE_PATH`) that all workers share. Edits survive a crash or
+  restart and are flushed by whichever worker runs next.
+
+With a write-behind store, changed carts are marked dirty. Every
+`CART_FLUSH_INTERVAL` seconds, up to `CART_FLUSH_BATCH` of them are written
+per transaction by replacing each user's `cart_items` rows. Ten clicks in
+one interval cost one write. A user's cart is also flushed right before
+checkout, which reads `cart_items` as before. Everything left is flushed on
+shutdown. Only one flusher writes at a time, so an older copy of a cart
+never overwrites a newer one.
+
+A cart line's `id` is its product id in every mode (a user has at most one
+line per product), so `DELETE /cart/{product_id}` means the same thing
+whichever store is configured. `cart_items.id` changes on every write-behind
+flush and is never exposed.
+"""
+import json
+import logging
+import os
+import sqlite3
+import threading
+import time
+import uuid
+from contextlib import contextmanager
+from collections import OrderedDict
+
+from fastapi import HTTPException
+from sqlalchemy import delete, insert
+
+from . import crud, models
+from .database import SessionLocal
+from .metrics import Counter, Gauge
+
+logger = logging.getLogger(__name__)
+
+BACKEND = os.getenv("CART_STORE", "db")
+PATH = os.getenv("CART_STORE_PATH", "/tmp/grocery-carts.sqlite3")
+FLUSH_INTERVAL = float(os.getenv("CART_FLUSH_INTERVAL", 5.0))
+FLUSH_BATCH = int(os.getenv("CART_FLUSH_BATCH", 500))
+IDLE_SECONDS = float(os.getenv("CART_IDLE_SECONDS", 900))
+LEASE_SECONDS = 30.0
+
+CART_WRITES = Counter("cart_writes_total", "Cart edits and the database flushes they were coalesced into", ("kind",))
+CARTS_DIRTY = Gauge("carts_dirty", "Carts changed since their last flush")
+
+
+class CartLine:
+    """What `CartItemOut` reads: `id`, `product`, `quantity`."""
+
+    __slots__ = ("id", "product", "quantity")
+
+    def __init__(self, product, quantity: int):
+        self.id = product.id
+        self.product = product
+        self.quantity = quantity
+
+
+# ---------- cart maps ----------
+# user_id -> {product_id: quantity}, plus a version and a dirty flag per cart.
+
+class MemoryCarts:
+    def __init__(self):
+        self._carts = OrderedDict()  # user_id -> [lines, version, dirty, touched]
+        self._lock = threading.Lock()
+        self._flush_lock = threading.Lock()
+
+    def get(self, user_id: int):
+        with self._lock:
+            cart = self._carts.get(user_id)
+            return dict(cart[0]) if cart else None
+
+    def load(self, user_id: int, lines: dict):
+        """Cache a cart read from the database unless one is already held."""
+        with self._lock:
+            self._carts.setdefault(user_id, [dict(lines), 0, False, time.time()])
+
+    def update(self, user_id: int, change):
+        """Apply `change(lines)` and mark the cart dirty. Exceptions leave it untouched."""
+        with self._lock:
+            cart = self._carts[user_id]
+            lines = dict(cart[0])
+            result = change(lines)
+            cart[:] = [lines, cart[1] + 1, True, time.time()]
+            self._carts.move_to_end(user_id)
+            return result
+
+    def drop(self, user_id: int):
+        with self._lock:
+            self._carts.pop(user_id, None)
+
+    def dirty(self, limit: int, user_id: int = None):
+        with self._lock:
+            found = [
+                (uid, dict(c[0]), c[1]) for uid, c in self._carts.items()
+                if c[2] and (user_id is None or uid == user_id)
+            ]
+        return found[:limit]
+
+    def dirty_count(self) -> int:
+        with self._lock:
+            return sum(1 for c in self._carts.values() if c[2])
+
+    def mark_clean(self, flushed):
+        with self._lock:
+            for user_id, version in flushed:
+                cart = self._carts.get(user_id)
+                if cart and cart[1] == version:
+                    cart[2] = False
+
+    def evict_idle(self, before: float):
+        with self._lock:
+            for user_id in [u for u, c in self._carts.items() if not c[2] and c[3] < before]:
+                del self._carts[user_id]
+
+    @contextmanager
+    def flushing(self):
+        with self._flush_lock:
+            yield
+
+
+class SQLiteCarts:
+    """The same map in a SQLite file, shared by every worker on the host."""
+
+    def __init__(self, path: str = PATH):
+        self.path = path
+        self.owner = uuid.uuid4().hex
+        self._local = threading.local()
+        with self._tx() as conn:
+            conn.execute(
+                "CREATE TABLE IF NOT EXISTS carts (user_id INTEGER PRIMARY KEY, lines TEXT NOT NULL, "
+                "version INTEGER NOT NULL, dirty INTEGER NOT NULL, touched REAL NOT NULL)"
+            )
+            conn.execute("CREATE INDEX IF NOT EXISTS ix_carts_dirty ON carts (dirty)")
+            conn.execute("CREATE TABLE IF NOT EXISTS flush_lease (id INTEGER PRIMARY KEY, owner TEXT, expires REAL)")
+
+    def _conn(self):
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = sqlite3.connect(self.path, timeout=10, isolation_level=None)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            self._local.conn = conn
+        return conn
+
+    @contextmanager
+    def _tx(self):
+        conn = self._conn()
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            yield conn
+        except BaseException:
+            conn.execute("ROLLBACK")
+            raise
+        conn.execute("COMMIT")
+
+    @staticmethod
+    def _decode(raw: str) -> dict:
+        return {pid: qty for pid, qty in json.loads(raw)}
+
+    @staticmethod
+    def _encode(lines: dict) -> str:
+        return json.dumps([[pid, qty] for pid, qty in lines.items()], separators=(",", ":"))
+
+    def get(self, user_id: int):
+        row = self._conn().execute("SELECT lines FROM carts WHERE user_id = ?", (user_id,)).fetchone()
+        return self._decode(row[0]) if row else None
+
+    def load(self, user_id: int, lines: dict):
+        with self._tx() as conn:
+            conn.execute(
+                "INSERT OR IGNORE INTO carts VALUES (?, ?, 0, 0, ?)", (user_id, self._encode(lines), time.time())
+            )
+
+    def update(self, user_id: int, change):
+        with self._tx() as conn:
+            lines = self._decode(conn.execute("SELECT lines FROM carts WHERE user_id = ?", (user_id,)).fetchone()[0])
+            result = change(lines)
+            conn.execute(
+                "UPDATE carts SET lines = ?, version = version + 1, dirty = 1, touched = ? WHERE user_id = ?",
+                (self._encode(lines), time.time(), user_id),
+            )
+            return result
+
+    def drop(self, user_id: int):
+        with self._tx() as conn:
+            conn.execute("DELETE FROM carts WHERE user_id = ?", (user_id,))
+
+    def dirty(self, limit: int, user_id: int = None):
+        q, args = "SELECT user_id, lines, version FROM carts WHERE dirty = 1", ()
+        if user_id is not None:
+            q, args = q + " AND user_id = ?", (user_id,)
+        rows = self._conn().execute(q + " LIMIT ?", (*args, limit)).fetchall()
+        return [(uid, self._decode(raw), version) for uid, raw, version in rows]
+
+    def dirty_count(self) -> int:
+        return self._conn().execute("SELECT count(*) FROM carts WHERE dirty = 1").fetchone()[0]
+
+    def mark_clean(self, flushed):
+        with self._tx() as conn:
+            conn.executemany("UPDATE carts SET dirty = 0 WHERE user_id = ? AND version = ?", list(flushed))
+
+    def evict_idle(self, before: float):
+        with self._tx() as conn:
+            conn.execute("DELETE FROM carts WHERE dirty = 0 AND touched < ?", (before,))
+
+    @contextmanager
+    def flushing(self):
+        """A lease held across processes; a crashed holder's lease runs out after `LEASE_SECONDS`."""
+        while True:
+            with self._tx() as conn:
+                now = time.time()
+                row = conn.execute("SELECT owner, expires FROM flush_lease WHERE id = 1").fetchone()
+                if row is None or row[1] < now:
+                    conn.execute(
+                        "INSERT OR REPLACE INTO flush_lease VALUES (1, ?, ?)", (self.owner, now + LEASE_SECONDS)
+                    )
+                    break
+            time.sleep(0.05)
+        try:
+            yield
+        finally:
+            with self._tx() as conn:
+                conn.execute("DELETE FROM flush_lease WHERE id = 1 AND owner = ?", (self.owner,))
+
+
+# ---------- stores ----------
+
+class CartStore:
+    """Write-through: the `cart_items` table is the cart."""
+
+    write_behind = False
+
+    def start(self):
+        pass
+
+    def stop(self):
+        pass
+
+    def add(self, db, user_id: int, product_id: int, quantity: int = 1):
+        CART_WRITES.inc("edit")
+        CART_WRITES.inc("flush")
+        item = crud.add_to_cart(db, user_id, product_id, quantity)
+        return CartLine(item.product, item.quantity)
+
+    def items(self, db, user_id: int):
+        return [CartLine(item.product, item.quantity) for item in crud.get_cart_items(db, user_id)]
+
+    def remove(self, db, user_id: int, product_id: int) -> bool:
+        CART_WRITES.inc("edit")
+        CART_WRITES.inc("flush")
+        return crud.remove_cart_item(db, user_id, product_id)
+
+    def before_checkout(self, user_id: int):
+        pass
+
+    def after_checkout(self, user_id: int):
+        pass
+
+    def flush(self, user_id: int = None) -> int:
+        return 0
+
+
+class WriteBehindCartStore(CartStore):
+    write_behind = True
+
+    def __init__(self, carts, interval: float = FLUSH_INTERVAL, batch_size: int = FLUSH_BATCH):
+        self.carts = carts
+        self.interval = interval
+        self.batch_size = batch_size
+        self._stop_event = threading.Event()
+        self._thread = None
+
+    def _lines(self, db, user_id: int) -> dict:
+        lines = self.carts.get(user_id)
+        if lines is None:
+            rows = db.query(models.CartItem.product_id, models.CartItem.quantity).filter(
+                models.CartItem.user_id == user_id
+            ).all()
+            lines = {}
+            for product_id, quantity in rows:
+                lines[product_id] = lines.get(product_id, 0) + quantity
+            self.carts.load(user_id, lines)
+        return lines
+
+    def add(self, db, user_id: int, product_id: int, quantity: int = 1):
+        product = crud.get_product(db, product_id)
+        if not product:
+            raise HTTPException(status_code=404, detail="Product not found")
+        self._lines(db, user_id)
+
+        def change(lines):
+            wanted = lines.get(product_id, 0) + quantity
+            if product.stock < wanted:
+                raise HTTPException(status_code=400, detail=f"Only {product.stock} items available in stock")
+            lines[product_id] = wanted
+            return wanted
+
+        line = CartLine(product, self.carts.update(user_id, change))
+        CART_WRITES.inc("edit")
+        return line
+
+    def items(self, db, user_id: int):
+        lines = self._lines(db, user_id)
+        if not lines:
+            return []
+        products = {p.id: p for p in db.query(models.Product).filter(models.Product.id.in_(list(lines)))}
+        return [CartLine(products[pid], qty) for pid, qty in lines.items() if pid in products]
+
+    def remove(self, db, user_id: int, product_id: int) -> bool:
+        self._lines(db, user_id)
+        removed = self.carts.update(user_id, lambda lines: lines.pop(product_id, None) is not None)
+        if removed:
+            CART_WRITES.inc("edit")
+        return removed
+
+    def before_checkout(self, user_id: int):
+        # checkout reads and deletes `cart_items`, so they must be current
+        self.flush(user_id)
+
+    def after_checkout(self, user_id: int):
+        self.carts.drop(user_id)  # re-read (empty) from the database next time
+
+    def flush(self, user_id: int = None) -> int:
+        """Write dirty carts to `cart_items`, `batch_size` per transaction. Returns carts written."""
+        written = 0
+        with self.carts.flushing():
+            while True:
+                batch = self.carts.dirty(self.batch_size, user_id)
+                if not batch:
+                    break
+                self._write(batch)
+                self.carts.mark_clean((uid, version) for uid, _, version in batch)
+                written += len(batch)
+                if len(batch) < self.batch_size:
+                    break
+        CARTS_DIRTY.set(value=self.carts.dirty_count())
+        return written
+
+    def _write(self, batch):
+        db = SessionLocal()
+        try:
+            product_ids = {pid for _, lines, _ in batch for pid in lines}
+            existing = {
+                pid for (pid,) in db.query(models.Product.id).filter(models.Product.id.in_(product_ids))
+            } if product_ids else set()
+            db.execute(delete(models.CartItem).where(models.CartItem.user_id.in_([uid for uid, _, _ in batch])))
+            rows = [
+                {"user_id": uid, "product_id": pid, "quantity": qty}
+                for uid, lines, _ in batch for pid, qty in lines.items() if pid in existing
+            ]
+            if rows:
+                db.execute(insert(models.CartItem), rows)
+            db.commit()
+            CART_WRITES.inc("flush")
+        finally:
+            db.close()
+
+    def start(self):
+        if self._thread is None:
+            self._stop_event.clear()
+            self._thread = threading.Thread(target=self._run, name="cart-flusher", daemon=True)
+            self._thread.start()
+
+    def stop(self):
+        self._stop_event.set()
+        if self._thread is not None:
+            self._thread.join(self.interval + LEASE_SECONDS)
+            self._thread = None
+        self.flush()
+
+    def _run(self):
+        while not self._stop_event.wait(self.interval):
+            try:
+                self.flush()
+                self.carts.evict_idle(time.time() - IDLE_SECONDS)
+            except Exception:
+                logger.exception("cart flush failed; will retry")
+
+
+def make_store(kind: str = BACKEND) -> CartStore:
+    if kind == "db":
+        return CartStore()
+    if kind == "memory":
+        return WriteBehindCartStore(MemoryCarts())
+    if kind == "local":
+        return WriteBehindCartStore(SQLiteCarts())
+    raise ValueError(f"unknown CART_STORE {kind!r}")
+
+
+store = make_store()
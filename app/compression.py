@@ -0,0 +1,146 @@
+"""
+Response compression (brotli when available, else gzip) above a size threshold.
+
+Only complete, single-message bodies of compressible types are touched.
+Streaming responses (`more_body=True`, e.g. server-sent events or exports)
+pass through unchanged, so nothing gets stuck in a compressor buffer.
+
+A compressed body is a different byte sequence from the one its `ETag` was
+computed for, so the tag gets the encoding as a suffix (`"abc"` becomes
+`"abc-br"`). `caching.is_not_modified` drops the suffix again when
+comparing. A 304 answering a suffixed tag repeats that tag.
+"""
+import gzip
+import os
+
+try:
+    import brotli
+except ImportError:  # optional dependency
+    brotli = None
+
+MIN_SIZE = int(os.getenv("COMPRESS_MIN_SIZE", 1024))
+GZIP_LEVEL = int(os.getenv("COMPRESS_GZIP_LEVEL", 6))
+BROTLI_QUALITY = int(os.getenv("COMPRESS_BROTLI_QUALITY", 4))
+COMPRESSIBLE = ("application/json", "text/", "application/javascript", "image/svg+xml", "application/x-ndjson")
+
+
+ENCODINGS = ("br", "gzip")
+
+
+def encoded_etag(etag: bytes, encoding: str) -> bytes:
+    """`"abc"` -> `"abc-gzip"` (weak tags keep their `W/`)."""
+    if not etag.endswith(b'"'):
+        return etag
+    return etag[:-1] + b"-" + encoding.encode() + b'"'
+
+
+def strip_etag_encoding(tag: str) -> str:
+    """Undo `encoded_etag` for a tag sent back by a client."""
+    for encoding in ENCODINGS:
+        suffix = f'-{encoding}"'
+        if tag.endswith(suffix):
+            return tag[:-len(suffix)] + '"'
+    return tag
+
+
+def _choose_encoding(accept_encoding: str):
+    accepted = {part.split(";")[0].strip() for part in accept_encoding.lower().split(",")}
+    if brotli is not None and "br" in accepted:
+        return "br"
+    if "gzip" in accepted:
+        return "gzip"
+    return None
+
+
+def _compress(body: bytes, encoding: str) -> bytes:
+    if encoding == "br":
+        return brotli.compress(body, quality=BROTLI_QUALITY)
+    return gzip.compress(body, compresslevel=GZIP_LEVEL, mtime=0)
+
+
+class CompressionMiddleware:
+    def __init__(self, app, minimum_size: int = MIN_SIZE):
+        self.app = app
+        self.minimum_size = minimum_size
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        headers = dict(scope["headers"])
+        encoding = _choose_encoding(headers.get(b"accept-encoding", b"").decode("latin-1"))
+        if encoding is None:
+            await self.app(scope, receive, send)
+            return
+
+        start = None
+        if_none_match = headers.get(b"if-none-match", b"")
+
+        async def send_wrapper(message):
+            nonlocal start
+            if message["type"] == "http.response.start":
+                if message["status"] == 304:
+                    # the client holds the compressed copy if it sent the suffixed tag back
+                    await send({**message, "headers": _revalidated(message["headers"], if_none_match, encoding)})
+                    return
+                if _content_type(message).startswith(b"text/event-stream"):
+                    # event streams must get their headers out right away
+                    await send(message)
+                    return
+                # hold the headers until we've seen the first body chunk
+                start = message
+                return
+            if message["type"] != "http.response.body" or start is None:
+                # other extensions (e.g. zero-copy send) go out untouched
+                if start is not None:
+                    pending, start = start, None
+                    await send(pending)
+                await send(message)
+                return
+
+            pending, start = start, None
+            body = message.get("body", b"")
+            if message.get("more_body", False) or not self._should_compress(pending, body):
+                await send(pending)
+                await send(message)
+                return
+
+            compressed = _compress(body, encoding)
+            response_headers = [
+                (k, encoded_etag(v, encoding) if k.lower() == b"etag" else v)
+                for k, v in pending["headers"] if k.lower() not in (b"content-length", b"vary")
+            ]
+            vary = [v for k, v in pending["headers"] if k.lower() == b"vary"]
+            response_headers += [
+                (b"content-encoding", encoding.encode()),
+                (b"content-length", str(len(compressed)).encode()),
+                (b"vary", b", ".join(vary + [b"Accept-Encoding"])),
+            ]
+            await send({**pending, "headers": response_headers})
+            await send({**message, "body": compressed})
+
+        await self.app(scope, receive, send_wrapper)
+
+    def _should_compress(self, start, body: bytes) -> bool:
+        if len(body) < self.minimum_size or start["status"] in (204, 206, 304):
+            return False
+        if any(k.lower() == b"content-encoding" for k, _ in start["headers"]):
+            return False
+        return _content_type(start).decode("latin-1").startswith(COMPRESSIBLE)
+
+
+def _revalidated(headers, if_none_match: bytes, encoding: str):
+    result = []
+    for k, v in headers:
+        if k.lower() == b"etag" and encoded_etag(v, encoding).removeprefix(b"W/") in if_none_match:
+            v = encoded_etag(v, encoding)
+        result.append((k, v))
+    return result
+
+
+def _content_type(start) -> bytes:
+    for k, v in start["headers"]:
+        if k.lower() == b"content-type":
+            return v
+    return b""
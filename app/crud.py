@@ -1,6 +1,7 @@
 from sqlalchemy.orm import Session
-from sqlalchemy import func, desc, asc
-from . import models, schemas, auth
+from sqlalchemy import func, desc, asc, case, select, union_all
+from sqlalchemy.orm import selectinload
+from . import models, schemas, auth, jobs, ledger, rollups, stores
 from datetime import datetime
 from fastapi import HTTPException
 
@@ -41,32 +42,149 @@ def create_product(db: Session, product: schemas.ProductCreate):
 def get_product(db: Session, product_id: int):
     return db.query(models.Product).get(product_id)
 
-def list_products(db: Session, category: str = None, popular: str = None, limit: int = 100):
-    q = db.query(models.Product)
+def sold_per_product():
+    """All-time units and revenue per product: the daily rollups plus orders not rolled up yet.
+
+    Exact even after old orders are archived (see archive.py).
+    """
+    OI = models.OrderItem
+    rolled = select(
+        models.SalesDailyProduct.product_id,
+        models.SalesDailyProduct.units.label("units"),
+        models.SalesDailyProduct.revenue.label("revenue"),
+    )
+    pending = (
+        select(OI.product_id, OI.quantity, OI.quantity * OI.price_at_purchase)
+        .join(models.Order, models.Order.id == OI.order_id)
+        .where(models.Order.rolled_up == False)  # noqa: E712
+    )
+    sold = union_all(rolled, pending).subquery()
+    return (
+        select(
+            sold.c.product_id,
+            func.sum(sold.c.units).label("times_sold"),
+            func.sum(sold.c.revenue).label("revenue"),
+        )
+        .group_by(sold.c.product_id)
+        .subquery()
+    )
+
+
+PRODUCT_SORTS = ("price_asc", "price_desc", "newest", "order_count")
+
+
+def filter_products(q, category=None, min_price: float = None, max_price: float = None, in_stock: bool = False):
+    """Apply the listing filters; `category` is one name or a list of them."""
     if category:
-        q = q.filter(models.Product.category == category)
+        categories = [category] if isinstance(category, str) else list(category)
+        if len(categories) == 1:
+            q = q.filter(models.Product.category == categories[0])
+        else:
+            q = q.filter(models.Product.category.in_(categories))
+    if min_price is not None:
+        q = q.filter(models.Product.price >= min_price)
+    if max_price is not None:
+        q = q.filter(models.Product.price <= max_price)
+    if in_stock:
+        q = q.filter(models.Product.stock > 0)
+    return q
+
+
+def list_products(db: Session, category=None, popular: str = None, limit: int = 100, min_price: float = None,
+                  max_price: float = None, in_stock: bool = False, sort: str = None, offset: int = 0):
+    q = filter_products(db.query(models.Product), category, min_price, max_price, in_stock)
     if popular:
-        sold_counts = db.query(models.OrderItem.product_id, func.sum(models.OrderItem.quantity).label("times_sold")).group_by(models.OrderItem.product_id).subquery()
+        sold_counts = sold_per_product()
         q = q.outerjoin(sold_counts, models.Product.id == sold_counts.c.product_id).add_columns(models.Product, func.coalesce(sold_counts.c.times_sold, 0).label("times_sold"))
         if popular == "most":
             q = q.order_by(desc("times_sold"))
         else:
             q = q.order_by(asc("times_sold"))
-        rows = q.limit(limit).all()
+        rows = q.offset(offset).limit(limit).all()
         return [{"product": r[1], "times_sold": int(r[2])} for r in rows]
-    return q.limit(limit).all()
+
+    # id breaks ties so pages don't overlap
+    P = models.Product
+    if sort == "price_asc":
+        q = q.order_by(P.price.asc(), P.id.asc())
+    elif sort == "price_desc":
+        q = q.order_by(P.price.desc(), P.id.desc())
+    elif sort == "newest":
+        q = q.order_by(P.created_at.desc(), P.id.desc())
+    elif sort == "order_count":
+        # orders containing the product, kept current by the recommendations job;
+        # unlike `popular`, which ranks by units sold, a 10-unit order counts once
+        C = models.ProductOrderCount
+        q = q.outerjoin(C, C.product_id == P.id).order_by(func.coalesce(C.orders, 0).desc(), P.id.asc())
+    else:
+        q = q.order_by(P.id)
+    return q.offset(offset).limit(limit).all()
+
+
+def product_facets(db: Session, category=None, min_price: float = None, max_price: float = None,
+                   in_stock: bool = False, price_edges=(0, 5, 10, 20, 50, 100)):
+    """Counts for the filter sidebar.
+
+    Each facet applies every filter except its own, so the counts show what
+    picking another value would return.
+    """
+    P = models.Product
+    by_category = (
+        filter_products(db.query(P.category, func.count(P.id)), None, min_price, max_price, in_stock)
+        .group_by(P.category).order_by(func.count(P.id).desc(), P.category).all()
+    )
+
+    edges = sorted(price_edges)
+    bucket = case(
+        *[(P.price < upper, i) for i, upper in enumerate(edges[1:])],
+        else_=len(edges) - 1,
+    )
+    by_price = dict(
+        filter_products(db.query(bucket, func.count(P.id)), category, None, None, in_stock)
+        .group_by(bucket).all()
+    )
+    buckets = [
+        {"min": lower, "max": edges[i + 1] if i + 1 < len(edges) else None, "count": by_price.get(i, 0)}
+        for i, lower in enumerate(edges)
+    ]
+
+    total, in_stock_count, lowest, highest = filter_products(
+        db.query(func.count(P.id), func.count(case((P.stock > 0, 1))), func.min(P.price), func.max(P.price)),
+        category, min_price, max_price,
+    ).one()
+    return {
+        "total": total,
+        "in_stock": in_stock_count,
+        "price_range": {"min": lowest, "max": highest},
+        "categories": [{"category": c, "count": n} for c, n in by_category],
+        "price_buckets": buckets,
+    }
 
 def update_product(db: Session, product_id: int, fields: dict):
     p = get_product(db, product_id)
     if not p:
         return None
+    changes = {k: [getattr(p, k), v] for k, v in fields.items() if getattr(p, k) != v}
     for k,v in fields.items():
         setattr(p, k, v)
     db.add(p)
+    if changes:
+        jobs.enqueue(db, "product.updated", {"product_id": p.id, "changes": changes})
     db.commit()
     db.refresh(p)
     return p
 
+def bulk_update_stock(db: Session, stock_by_id: dict):
+    """Set stock for many products in one transaction; returns the ids that don't exist."""
+    products = db.query(models.Product).filter(models.Product.id.in_(list(stock_by_id))).all()
+    for p in products:
+        new = stock_by_id[p.id]
+        if p.stock != new:
+            jobs.enqueue(db, "product.updated", {"product_id": p.id, "changes": {"stock": [p.stock, new]}})
+            p.stock = new
+    db.commit()
+    return sorted(set(stock_by_id) - {p.id for p in products})
+
 def delete_product(db: Session, product_id: int):
     p = get_product(db, product_id)
     if not p:
@@ -116,13 +234,14 @@ def add_to_cart(db: Session, user_id: int, product_id: int, quantity: int = 1):
 def get_cart_items(db: Session, user_id: int):
     return db.query(models.CartItem).filter(models.CartItem.user_id == user_id).all()
 
-def remove_cart_item(db: Session, cart_item_id: int):
-    item = db.query(models.CartItem).get(cart_item_id)
-    if item:
+def remove_cart_item(db: Session, user_id: int, product_id: int):
+    """Remove `product_id` from the user's own cart; False if it wasn't there."""
+    items = db.query(models.CartItem).filter_by(user_id=user_id, product_id=product_id).all()
+    for item in items:
         db.delete(item)
+    if items:
         db.commit()
-        return True
-    return False
+    return bool(items)
 
 
 
@@ -140,6 +259,27 @@ def add_to_wishlist(db: Session, user_id: int, product_id: int):
 def get_wishlist(db: Session, user_id: int):
     return db.query(models.WishlistItem).filter_by(user_id=user_id).all()
 
+
+# Notifications
+def get_notifications(db: Session, user_id: int, unread_only: bool = False, limit: int = 50):
+    q = db.query(models.Notification).filter(models.Notification.user_id == user_id)
+    if unread_only:
+        q = q.filter(models.Notification.read_at.is_(None))
+    return q.order_by(models.Notification.created_at.desc(), models.Notification.id.desc()).limit(limit).all()
+
+
+def mark_notifications_read(db: Session, user_id: int, notification_id: int = None):
+    """Returns how many notifications matched (already-read ones keep their read_at)."""
+    N = models.Notification
+    q = db.query(N).filter(N.user_id == user_id)
+    if notification_id is not None:
+        q = q.filter(N.id == notification_id)
+    else:
+        q = q.filter(N.read_at.is_(None))
+    updated = q.update({"read_at": func.coalesce(N.read_at, datetime.utcnow())}, synchronize_session=False)
+    db.commit()
+    return updated
+
 # Checkout
 def checkout(db: Session, user_id: int):
     cart_items = get_cart_items(db, user_id)
@@ -168,12 +308,15 @@ def checkout(db: Session, user_id: int):
     db.refresh(order)
     return order
 
-def create_order(db: Session, user_id: int, total: float, cart_items):
-    order = models.Order(user_id=user_id, total_amount=total)
+def create_order(db: Session, user_id: int, total: float, cart_items, store_id: int = None):
+    """Place the order. With `store_id` the stock is taken from that store (stores.sell) instead of the catalog."""
+    order = models.Order(user_id=user_id, total_amount=total, store_id=store_id)
     db.add(order)
-    db.commit()
-    db.refresh(order)
+    # flush, not commit: the order and its items become visible together
+    db.flush()
+    ledger.reason(db, ledger.SALE, order_id=order.id)
 
+    quantities = {}
     for ci in cart_items:
         product = get_product(db, ci.product_id)
         oi = models.OrderItem(
@@ -183,23 +326,55 @@ def create_order(db: Session, user_id: int, total: float, cart_items):
             price_at_purchase=product.price
         )
         db.add(oi)
-        product.stock -= ci.quantity
-        db.add(product)
+        if store_id is None:
+            product.stock -= ci.quantity
+            db.add(product)
+        else:
+            quantities[product.id] = quantities.get(product.id, 0) + ci.quantity
         db.delete(ci)
 
-    db.commit()
+    # side work (alerts, counters, ...) runs in job workers, not in the request
+    jobs.enqueue(db, "order.placed", {"order_id": order.id, "user_id": user_id})
+    if store_id is None:
+        db.commit()
+    else:
+        stores.sell(db, store_id, order.id, quantities)  # commits the store's stock, then the order
     db.refresh(order)
     return order
 
 
+# Order history
+def get_order_history(db: Session, user_id: int, include_archived: bool = False, limit: int = 50):
+    """A user's orders, newest first. Archived orders are read only when asked for."""
+    orders = (
+        db.query(models.Order).options(selectinload(models.Order.items))
+        .filter(models.Order.user_id == user_id)
+        .order_by(models.Order.created_at.desc()).limit(limit).all()
+    )
+    if include_archived and len(orders) < limit:
+        # live first: an order archived between the two reads shows up once, not zero times
+        seen = {o.id for o in orders}
+        archived = (
+            db.query(models.OrderArchive).options(selectinload(models.OrderArchive.items))
+            .filter(models.OrderArchive.user_id == user_id)
+            .order_by(models.OrderArchive.created_at.desc()).limit(limit).all()
+        )
+        orders += [o for o in archived if o.id not in seen]
+        orders.sort(key=lambda o: o.created_at, reverse=True)
+    return orders[:limit]
+
+
 # Sales report
 def sales_report(db: Session, sort: str = "most", category: str = None, limit: int = 50):
+    """All-time units and revenue per product (rollups + live tail, see sold_per_product)."""
+    sold = sold_per_product()
     q = db.query(
         models.Product.id.label("product_id"),
         models.Product.name,
         models.Product.category,
-        func.coalesce(func.sum(models.OrderItem.quantity), 0).label("times_sold")
-    ).outerjoin(models.OrderItem, models.Product.id == models.OrderItem.product_id).group_by(models.Product.id)
+        func.coalesce(sold.c.times_sold, 0).label("times_sold"),
+        func.coalesce(sold.c.revenue, 0).label("revenue")
+    ).outerjoin(sold, models.Product.id == sold.c.product_id)
     if category:
         q = q.filter(models.Product.category == category)
     if sort == "most":
@@ -208,6 +383,13 @@ def sales_report(db: Session, sort: str = "most", category: str = None, limit: i
         q = q.order_by(asc("times_sold"))
     return q.limit(limit).all()
 
+
+def sales_report_by_period(db: Session, start=None, end=None, granularity: str = "day", by: str = "product",
+                           sort: str = "most", category: str = None, limit: int = 50):
+    """Units and revenue per day/week/month from the daily rollups (see rollups.py)."""
+    return rollups.report(db, start=start, end=end, granularity=granularity, by=by,
+                          sort=sort, category=category, limit=limit)
+
 # Promo code
 
 def create_promocode(db: Session, data: schemas.PromoCodeCreate):
@@ -234,6 +416,21 @@ def apply_promocode(db: Session, code: str, cart_total: float):
     return discount_amount
 
 
+# Stores
+def create_store(db: Session, store: schemas.StoreCreate):
+    s = models.Store(**store.model_dump())
+    db.add(s)
+    db.commit()
+    db.refresh(s)
+    return s
+
+def get_stores(db: Session):
+    return db.query(models.Store).order_by(models.Store.id).all()
+
+def get_store(db: Session, store_id: int):
+    return db.query(models.Store).get(store_id)
+
+
 # LOW STOCK 
 def low_stock_products(db: Session, threshold: int = 5):
     return db.query(models.Product).filter(models.Product.stock <= threshold).all()
@@ -7,23 +7,29 @@ load_dotenv()
 
 DATABASE_URL = os.getenv("DATABASE_URL", "sqlite:///./grocery.db")
 
-# Fix for Render PostgreSQL URLs (postgres:// -> postgresql://)
-if DATABASE_URL.startswith("postgres://"):
-    DATABASE_URL = DATABASE_URL.replace("postgres://", "postgresql://", 1)
-
-# Configure connection arguments based on database type
-connect_args = {}
-if "sqlite" in DATABASE_URL:
-    connect_args = {"check_same_thread": False}
-
-# Create engine with production-ready settings
-engine = create_engine(
-    DATABASE_URL,
-    connect_args=connect_args,
-    pool_pre_ping=True,
-    pool_recycle=300,
-    echo=False
-)
+
+def make_engine(url: str):
+    """Engine with the app's pool settings; also used for per-store databases (stores.py)."""
+    # Fix for Render PostgreSQL URLs (postgres:// -> postgresql://)
+    if url.startswith("postgres://"):
+        url = url.replace("postgres://", "postgresql://", 1)
+
+    # Configure connection arguments based on database type
+    connect_args = {}
+    if "sqlite" in url:
+        connect_args = {"check_same_thread": False}
+
+    # Create engine with production-ready settings
+    return create_engine(
+        url,
+        connect_args=connect_args,
+        pool_pre_ping=True,
+        pool_recycle=300,
+        echo=False
+    )
+
+
+engine = make_engine(DATABASE_URL)
 
 SessionLocal = sessionmaker(bind=engine, autoflush=False, autocommit=False)
 
@@ -35,3 +41,25 @@ def get_db():
         yield db
     finally:
         db.close()
+
+
+def upsert(db, table, rows, keys, add=(), replace=(), chunk_size=1000):
+    """INSERT ... ON CONFLICT (keys) DO UPDATE for SQLite and Postgres.
+
+    Columns in `add` are incremented by the incoming value, columns in
+    `replace` are overwritten with it. Rows are sent as an executemany of one
+    statement, so it is compiled once (and batched by the driver).
+    """
+    if db.bind.dialect.name == "postgresql":
+        from sqlalchemy.dialects.postgresql import insert
+    else:
+        from sqlalchemy.dialects.sqlite import insert
+    stmt = insert(table)
+    updates = {c: table.c[c] + stmt.excluded[c] for c in add}
+    updates.update({c: stmt.excluded[c] for c in replace})
+    if updates:
+        stmt = stmt.on_conflict_do_update(index_elements=list(keys), set_=updates)
+    else:
+        stmt = stmt.on_conflict_do_nothing(index_elements=list(keys))
+    for i in range(0, len(rows), chunk_size):
+        db.execute(stmt, rows[i:i + chunk_size])
@@ -0,0 +1,231 @@
+"""
+Synthetic data generator for realistic-volume databases.
+
+    python -m app.datagen --products 2000000 --users 300000 --orders 3000000 --reset
+
+Rows are built in Python and written with batched Core `INSERT`s (executemany,
+explicit primary keys, no ORM objects), so tens of millions of `order_items`
+load in minutes. Product popularity follows a Zipf distribution. Everything is
+driven by one `random.Random(seed)`, so the same arguments always produce the
+same database, which keeps benchmark runs comparable.
+
+The demo accounts from `seed.py` (manager@example.com / customer@example.com)
+are created as well. Synthetic users are `user<N>@example.com` and all share
+the password `PASSWORD`, hashed once.
+"""
+import argparse
+import random
+import time
+from array import array
+from datetime import datetime, timedelta
+from itertools import accumulate
+
+from sqlalchemy import func, insert, select, text
+
+from .database import Base, engine as default_engine
+from . import models
+from .auth import hash_password
+
+PASSWORD = "password"
+BASE_CATEGORIES = [
+    "Fruits", "Vegetables", "Dairy", "Bakery", "Meat", "Seafood", "Beverages", "Snacks",
+    "Frozen", "Pantry", "Household", "Personal Care", "Baby", "Pet", "Deli", "Organic",
+]
+ADJECTIVES = ["Fresh", "Organic", "Classic", "Premium", "Local", "Family", "Light", "Spicy", "Sweet", "Whole"]
+
+
+def _categories(n: int):
+    names = BASE_CATEGORIES[:n]
+    i = 2
+    while len(names) < n:
+        names.extend(f"{c} {i}" for c in BASE_CATEGORIES[: n - len(names)])
+        i += 1
+    return names
+
+
+def _insert_batches(conn, table, rows, batch_size: int) -> int:
+    batch, total = [], 0
+    for row in rows:
+        batch.append(row)
+        if len(batch) >= batch_size:
+            conn.execute(insert(table), batch)
+            total += len(batch)
+            batch = []
+    if batch:
+        conn.execute(insert(table), batch)
+        total += len(batch)
+    return total
+
+
+def _zipf_cum_weights(n: int, s: float):
+    return list(accumulate(1.0 / (rank ** s) for rank in range(1, n + 1)))
+
+
+def _fix_sequences(conn):
+    """Explicit ids bypass Postgres sequences; move them past the loaded rows."""
+    if conn.dialect.name != "postgresql":
+        return
+    for table in ("users", "products", "orders", "order_items"):
+        conn.execute(text(
+            f"SELECT setval(pg_get_serial_sequence('{table}', 'id'), "
+            f"COALESCE((SELECT MAX(id) FROM {table}), 0) + 1, false)"
+        ))
+
+
+def generate(
+    engine=None,
+    products: int = 10_000,
+    users: int = 1_000,
+    orders: int = 20_000,
+    items_per_order: int = 4,
+    categories: int = 16,
+    zipf: float = 1.1,
+    days: int = 365,
+    stock=(0, 500),
+    seed: int = 42,
+    batch_size: int = 10_000,
+    end: datetime = None,
+    reset: bool = False,
+    log=print,
+):
+    """Fill an empty database (or a reset one) with synthetic data.
+
+    Timestamps are spread over the `days` before `end` (default: today, 00:00
+    UTC), so runs on the same day are identical row for row.
+    """
+    engine = engine or default_engine
+    rng = random.Random(seed)
+    now = end or datetime.utcnow().replace(hour=0, minute=0, second=0, microsecond=0)
+    start = time.perf_counter()
+
+    if reset:
+        Base.metadata.drop_all(bind=engine)
+    Base.metadata.create_all(bind=engine)
+
+    with engine.begin() as conn:
+        if conn.dialect.name == "sqlite":
+            conn.exec_driver_sql("PRAGMA synchronous=OFF")
+        if conn.execute(select(func.count()).select_from(models.Product.__table__)).scalar():
+            raise RuntimeError("products table is not empty; use --reset to regenerate")
+
+        # ---------- users ----------
+        hashed = hash_password(PASSWORD)
+        demo = [
+            {"id": 1, "name": "Manager", "email": "manager@example.com",
+             "hashed_password": hash_password("managerpass"), "role": "manager", "created_at": now},
+            {"id": 2, "name": "Customer", "email": "customer@example.com",
+             "hashed_password": hash_password("custpass"), "role": "customer", "created_at": now},
+        ]
+        user_rows = (
+            {"id": i + 3, "name": f"User {i}", "email": f"user{i}@example.com",
+             "hashed_password": hashed, "role": "customer",
+             "created_at": now - timedelta(seconds=rng.randrange(days * 86400))}
+            for i in range(users)
+        )
+        conn.execute(insert(models.User.__table__), demo)
+        n = _insert_batches(conn, models.User.__table__, user_rows, batch_size)
+        log(f"users: {n + len(demo)} ({time.perf_counter() - start:.1f}s)")
+
+        # ---------- products ----------
+        category_names = _categories(categories)
+        category_weights = _zipf_cum_weights(len(category_names), 0.8)
+        prices = array("d")
+
+        def product_rows():
+            for pid in range(1, products + 1):
+                category = rng.choices(category_names, cum_weights=category_weights)[0]
+                price = round(rng.lognormvariate(3.5, 0.8), 2)
+                prices.append(price)
+                yield {
+                    "id": pid,
+                    "name": f"{rng.choice(ADJECTIVES)} {category} #{pid}",
+                    "category": category,
+                    "price": price,
+                    "stock": rng.randint(*stock),
+                    "image_url": None,
+                    "created_at": now - timedelta(seconds=rng.randrange(days * 86400)),
+                }
+
+        n = _insert_batches(conn, models.Product.__table__, product_rows(), batch_size)
+        log(f"products: {n} in {len(category_names)} categories ({time.perf_counter() - start:.1f}s)")
+
+        # ---------- orders + order_items ----------
+        # popularity rank -> product id is a random permutation, so best sellers
+        # are spread across ids and categories instead of being ids 1..k
+        ranked_ids = list(range(1, products + 1))
+        rng.shuffle(ranked_ids)
+        cum_weights = _zipf_cum_weights(products, zipf)
+        span = days * 86400
+        order_batch, item_batch = [], []
+        item_id = 0
+        first_user, last_user = 2, users + 2
+
+        for oid in range(1, orders + 1):
+            # ids increase with time, like real traffic
+            created = now - timedelta(seconds=span * (1 - oid / (orders + 1)) + rng.random())
+            count = min(products, rng.randint(1, 2 * items_per_order - 1))
+            picked = set(rng.choices(ranked_ids, cum_weights=cum_weights, k=count))
+            total = 0.0
+            for pid in picked:
+                item_id += 1
+                qty = rng.randint(1, 3)
+                price = prices[pid - 1]
+                total += price * qty
+                item_batch.append({
+                    "id": item_id, "order_id": oid, "product_id": pid,
+                    "quantity": qty, "price_at_purchase": price,
+                })
+            order_batch.append({
+                "id": oid, "user_id": rng.randint(first_user, last_user),
+                "total_amount": round(total, 2), "created_at": created,
+            })
+            if len(item_batch) >= batch_size:
+                conn.execute(insert(models.Order.__table__), order_batch)
+                conn.execute(insert(models.OrderItem.__table__), item_batch)
+                order_batch, item_batch = [], []
+        if order_batch:
+            conn.execute(insert(models.Order.__table__), order_batch)
+        if item_batch:
+            conn.execute(insert(models.OrderItem.__table__), item_batch)
+        log(f"orders: {orders}, order_items: {item_id} ({time.perf_counter() - start:.1f}s)")
+
+        _fix_sequences(conn)
+
+    log(f"done in {time.perf_counter() - start:.1f}s")
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Generate a large synthetic grocery dataset.")
+    parser.add_argument("--products", type=int, default=10_000)
+    parser.add_argument("--users", type=int, default=1_000)
+    parser.add_argument("--orders", type=int, default=20_000)
+    parser.add_argument("--items-per-order", type=int, default=4, help="mean line items per order")
+    parser.add_argument("--categories", type=int, default=16)
+    parser.add_argument("--zipf", type=float, default=1.1, help="popularity skew exponent")
+    parser.add_argument("--days", type=int, default=365, help="order history span")
+    parser.add_argument("--min-stock", type=int, default=0)
+    parser.add_argument("--max-stock", type=int, default=500)
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--batch-size", type=int, default=10_000)
+    parser.add_argument("--end-date", type=datetime.fromisoformat, help="end of the order history (YYYY-MM-DD)")
+    parser.add_argument("--reset", action="store_true", help="drop and recreate all tables first")
+    args = parser.parse_args(argv)
+
+    generate(
+        products=args.products,
+        users=args.users,
+        orders=args.orders,
+        items_per_order=args.items_per_order,
+        categories=args.categories,
+        zipf=args.zipf,
+        days=args.days,
+        stock=(args.min_stock, args.max_stock),
+        seed=args.seed,
+        batch_size=args.batch_size,
+        end=args.end_date,
+        reset=args.reset,
+    )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,263 @@
+"""
+Stock-change events for live dashboards (`GET /inventory/stream`).
+
+Any ORM flush that changes `Product.stock` records an event on the session.
+That covers checkout, `update_product` and anything added later. The events
+are published only after the transaction commits, so subscribers never see
+a change that was rolled back.
+
+Publishing goes through a `Broker`, chosen with `EVENT_BROKER`:
+
+- `memory` (default): fan-out inside this process only.
+- `spool`: every worker appends events to one local file
+  (`EVENT_SPOOL_PATH`) and tails it, so several gunicorn workers on the same
+  host see each other's changes. It is a stand-in for Redis/NATS pub/sub
+  with the same interface.
+
+Each subscriber has a bounded queue (`EVENT_QUEUE_SIZE`). A slow client
+loses its oldest events rather than holding up publishers, and is told how
+many it missed.
+"""
+import abc
+import asyncio
+import json
+import logging
+import os
+import threading
+from collections import deque
+from datetime import datetime
+
+from sqlalchemy import event, inspect
+
+from . import models
+from .database import SessionLocal
+from .metrics import Counter, Gauge
+
+logger = logging.getLogger(__name__)
+
+LOW_STOCK_THRESHOLD = int(os.getenv("LOW_STOCK_THRESHOLD", 5))
+BROKER = os.getenv("EVENT_BROKER", "memory")
+QUEUE_SIZE = int(os.getenv("EVENT_QUEUE_SIZE", 256))
+SPOOL_PATH = os.getenv("EVENT_SPOOL_PATH", "/tmp/grocery-events.ndjson")
+SPOOL_MAX_BYTES = int(os.getenv("EVENT_SPOOL_MAX_BYTES", 16 * 1024 * 1024))
+SPOOL_POLL_INTERVAL = float(os.getenv("EVENT_SPOOL_POLL_INTERVAL", 0.2))
+
+SUBSCRIBERS = Gauge("event_subscribers", "Open event stream subscriptions")
+EVENTS_DROPPED = Counter("events_dropped_total", "Events dropped from full subscriber queues")
+
+
+def crossing(old, new, threshold: int = LOW_STOCK_THRESHOLD):
+    """'low' when stock falls to the threshold or below, 'restocked' when it climbs back above."""
+    if old is None or new is None:
+        return None
+    if old > threshold >= new:
+        return "low"
+    if new > threshold >= old:
+        return "restocked"
+    return None
+
+
+# ---------- subscriptions ----------
+
+class Subscription:
+    """One client's bounded queue. `push` may be called from any thread."""
+
+    def __init__(self, loop: asyncio.AbstractEventLoop, maxlen: int = QUEUE_SIZE):
+        self._loop = loop
+        self._queue = deque(maxlen=maxlen)
+        self._lock = threading.Lock()
+        self._ready = asyncio.Event()
+        self.dropped = 0
+
+    def push(self, item: dict):
+        with self._lock:
+            if len(self._queue) == self._queue.maxlen:
+                self.dropped += 1
+                EVENTS_DROPPED.inc()
+            self._queue.append(item)
+        self._loop.call_soon_threadsafe(self._ready.set)
+
+    async def get(self, timeout: float):
+        """(events, dropped since the last call); empty after `timeout` seconds."""
+        try:
+            await asyncio.wait_for(self._ready.wait(), timeout)
+        except asyncio.TimeoutError:
+            return [], 0
+        with self._lock:
+            self._ready.clear()
+            items, self._queue = list(self._queue), deque(maxlen=self._queue.maxlen)
+            dropped, self.dropped = self.dropped, 0
+        return items, dropped
+
+
+class Broker(abc.ABC):
+    """Publish/subscribe interface. `publish` is thread-safe and never blocks on subscribers."""
+
+    def __init__(self):
+        self._subscribers = set()
+        self._lock = threading.Lock()
+
+    def start(self):
+        pass
+
+    def stop(self):
+        pass
+
+    @abc.abstractmethod
+    def publish(self, events: list):
+        """Deliver `events` to every subscriber, in this process or beyond."""
+
+    def subscribe(self, loop, maxlen: int = QUEUE_SIZE) -> Subscription:
+        sub = Subscription(loop, maxlen)
+        with self._lock:
+            self._subscribers.add(sub)
+        SUBSCRIBERS.inc()
+        return sub
+
+    def unsubscribe(self, sub: Subscription):
+        with self._lock:
+            if sub in self._subscribers:
+                self._subscribers.discard(sub)
+                SUBSCRIBERS.dec()
+
+    def _deliver(self, events: list):
+        with self._lock:
+            subscribers = list(self._subscribers)
+        for sub in subscribers:
+            for item in events:
+                try:
+                    sub.push(item)
+                except RuntimeError:  # the subscriber's event loop is gone
+                    self.unsubscribe(sub)
+                    break
+
+
+class InProcessBroker(Broker):
+    def publish(self, events: list):
+        self._deliver(events)
+
+
+class LocalSpoolBroker(Broker):
+    """Workers on one host share events through an append-only file.
+
+    Each event is one JSON line written with O_APPEND. A tail thread per
+    worker delivers new lines, its own included, to local subscribers. The
+    file is truncated once it exceeds `max_bytes`; tailers notice it shrank
+    and start again from the top.
+    """
+
+    def __init__(self, path: str = SPOOL_PATH, max_bytes: int = SPOOL_MAX_BYTES,
+                 poll_interval: float = SPOOL_POLL_INTERVAL):
+        super().__init__()
+        self.path = path
+        self.max_bytes = max_bytes
+        self.poll_interval = poll_interval
+        self._stop_event = threading.Event()
+        self._thread = None
+
+    def publish(self, events: list):
+        data = "".join(json.dumps(e, default=str) + "\n" for e in events).encode()
+        fd = os.open(self.path, os.O_WRONLY | os.O_APPEND | os.O_CREAT, 0o644)
+        try:
+            if os.fstat(fd).st_size > self.max_bytes:
+                os.ftruncate(fd, 0)
+            os.write(fd, data)
+        finally:
+            os.close(fd)
+
+    def start(self):
+        if self._thread is None:
+            self._stop_event.clear()
+            self._thread = threading.Thread(target=self._tail, name="event-spool-tail", daemon=True)
+            self._thread.start()
+
+    def stop(self):
+        self._stop_event.set()
+        if self._thread is not None:
+            self._thread.join(self.poll_interval * 5)
+            self._thread = None
+
+    def _tail(self):
+        offset = os.path.getsize(self.path) if os.path.exists(self.path) else 0
+        partial = b""
+        while not self._stop_event.wait(self.poll_interval):
+            try:
+                size = os.path.getsize(self.path)
+            except OSError:
+                continue
+            if size < offset:  # truncated by a publisher
+                offset, partial = 0, b""
+            if size == offset:
+                continue
+            with open(self.path, "rb") as f:
+                f.seek(offset)
+                chunk = f.read(size - offset)
+            offset += len(chunk)
+            *lines, partial = (partial + chunk).split(b"\n")
+            events = []
+            for line in lines:
+                try:
+                    events.append(json.loads(line))
+                except ValueError:
+                    logger.warning("skipping unreadable event spool line")
+            if events:
+                self._deliver(events)
+
+
+def _make_broker(kind: str) -> Broker:
+    if kind == "spool":
+        return LocalSpoolBroker()
+    if kind != "memory":
+        raise ValueError(f"unknown EVENT_BROKER {kind!r}")
+    return InProcessBroker()
+
+
+broker = _make_broker(BROKER)
+
+
+# ---------- capture from the ORM ----------
+
+def stock_event(product_id: int, name: str, old, new, store_id: int = None) -> dict:
+    """`store_id` is set for a store's stock and None for the catalog's."""
+    return {
+        "type": "stock",
+        "product_id": product_id,
+        "store_id": store_id,
+        "name": name,
+        "old": old,
+        "new": new,
+        "crossing": crossing(old, new),
+        "at": datetime.utcnow().isoformat(),
+    }
+
+
+def record(session, item: dict):
+    """Queue an event to be published when `session` commits (for writes that bypass the ORM)."""
+    session.info.setdefault("stock_events", []).append(item)
+
+
+@event.listens_for(SessionLocal, "after_flush")
+def _capture_stock_changes(session, flush_context):
+    for obj in (*session.new, *session.dirty):
+        if not isinstance(obj, models.Product):
+            continue
+        history = inspect(obj).attrs.stock.history
+        if not history.added:
+            continue
+        old = history.deleted[0] if history.deleted else None
+        record(session, stock_event(obj.id, obj.name, old, history.added[0]))
+
+
+@event.listens_for(SessionLocal, "after_commit")
+def _publish_on_commit(session):
+    pending = session.info.pop("stock_events", None)
+    if pending:
+        try:
+            broker.publish(pending)
+        except Exception:
+            logger.exception("failed to publish %s stock events", len(pending))
+
+
+@event.listens_for(SessionLocal, "after_rollback")
+def _forget_on_rollback(session):
+    session.info.pop("stock_events", None)
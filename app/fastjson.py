@@ -0,0 +1,55 @@
+"""
+Opt-in fast response path (`FAST_JSON=1`).
+
+By default a `response_model` route validates the returned ORM rows, turns the
+result into plain Python objects and then encodes them with stdlib `json`.
+With the fast path, hot routes return `respond(SERIALIZER, rows)`. A prebuilt
+`TypeAdapter` validates the rows and writes JSON bytes in one pass in
+pydantic-core. Fully loaded ORM rows are read straight from their `__dict__`,
+which skips the per-attribute descriptor lookups. Expired or partly loaded rows
+fall back to normal attribute access. Every other route gets `ORJSONResponse`
+as its default response class.
+
+`benchmarks/serialization.py` measures both paths per 1,000 products.
+"""
+import os
+from typing import List
+
+from fastapi import Response
+from fastapi.responses import JSONResponse, ORJSONResponse
+from pydantic import TypeAdapter
+
+from . import schemas
+
+ENABLED = os.getenv("FAST_JSON", "0") == "1"
+DEFAULT_RESPONSE_CLASS = ORJSONResponse if ENABLED else JSONResponse
+
+
+class Serializer:
+    def __init__(self, model, many: bool = False):
+        self.adapter = TypeAdapter(List[model] if many else model)
+        self.fields = frozenset(model.model_fields)
+        self.many = many
+
+    def _source(self, obj):
+        loaded = getattr(obj, "__dict__", None)
+        if loaded is not None and self.fields.issubset(loaded):
+            return loaded
+        return obj
+
+    def render(self, obj) -> bytes:
+        """ORM object(s) -> JSON bytes, shaped and checked by the response schema."""
+        source = [self._source(o) for o in obj] if self.many else self._source(obj)
+        return self.adapter.dump_json(self.adapter.validate_python(source, from_attributes=True))
+
+
+PRODUCT = Serializer(schemas.ProductOut)
+PRODUCT_LIST = Serializer(schemas.ProductOut, many=True)
+CART_ITEM = Serializer(schemas.CartItemOut)
+CART_ITEM_LIST = Serializer(schemas.CartItemOut, many=True)
+
+
+def respond(serializer: Serializer, obj, response: Response = None, status_code: int = 200) -> Response:
+    """A finished JSON response. Headers set on the injected `response` are kept."""
+    headers = dict(response.headers) if response is not None else None
+    return Response(serializer.render(obj), status_code=status_code, headers=headers, media_type="application/json")
@@ -0,0 +1,182 @@
+"""
+Demand forecasting for reorders.
+
+Sales velocity is an exponentially weighted moving average (EWMA) of units
+sold per day. Day `d` days ago weighs `alpha * (1 - alpha) ** d`. Past days come
+from the daily rollups (app/rollups.py); orders not rolled up yet are read
+from `order_items` directly. The weighting and aggregation run as numpy array
+operations over every product at once.
+
+The velocities are cached per process and kept current incrementally:
+
+- when the day rolls over, every velocity decays by `(1 - alpha) ** days`;
+- orders with an id above the last one seen are added on the next request.
+
+A full rebuild runs every `FORECAST_REBUILD_SECONDS`. It corrects for orders
+that committed out of id order and for history older than the window.
+
+For each product:
+
+    days_of_cover = stock / velocity
+    reorder_qty   = ceil(velocity * (lead_time_days + cover_days)) - stock, at least 0
+"""
+import math
+import os
+import threading
+import time
+from datetime import date, datetime
+
+import numpy as np
+from sqlalchemy import Date, func, select, type_coerce, union_all
+
+from . import caching, models
+from .metrics import record_cache
+
+ALPHA = float(os.getenv("FORECAST_ALPHA", 0.1))
+HISTORY_DAYS = int(os.getenv("FORECAST_HISTORY_DAYS", 90))
+LEAD_TIME_DAYS = float(os.getenv("FORECAST_LEAD_TIME_DAYS", 7))
+COVER_DAYS = float(os.getenv("FORECAST_COVER_DAYS", 14))
+REBUILD_SECONDS = float(os.getenv("FORECAST_REBUILD_SECONDS", 3600))
+
+_lock = threading.Lock()
+_state = {
+    "day": None,            # date the velocities are aged to
+    "product_ids": None,    # sorted int64 array
+    "velocity": None,       # float64 array, aligned with product_ids
+    "max_order_id": 0,      # orders up to here are included
+    "built": 0.0,           # monotonic time of the last full rebuild
+}
+# (catalog version, ids, stock) so unchanged catalogs aren't re-read
+_stock = {"version": None, "ids": None, "stock": None}
+
+
+def _weights(days, today: date) -> np.ndarray:
+    ages = (np.datetime64(today, "D") - np.asarray(days, dtype="datetime64[D]")).astype(np.int64)
+    return ALPHA * (1 - ALPHA) ** np.maximum(ages, 0)
+
+
+def _fold(rows, today: date):
+    """Rows of (product_id, day, units) -> (sorted product ids, weighted sums)."""
+    if not rows:
+        return np.empty(0, np.int64), np.empty(0)
+    product_ids, days, units = zip(*rows)
+    ids, inverse = np.unique(np.asarray(product_ids, dtype=np.int64), return_inverse=True)
+    weighted = np.asarray(units, dtype=np.float64) * _weights(days, today)
+    return ids, np.bincount(inverse, weights=weighted, minlength=len(ids))
+
+
+def _order_day():
+    return type_coerce(func.date(models.Order.created_at), Date)
+
+
+def _rebuild(db, today: date):
+    Order, OI, Daily = models.Order, models.OrderItem, models.SalesDailyProduct
+    max_order_id = db.query(func.coalesce(func.max(Order.id), 0)).scalar()
+    start = date.fromordinal(today.toordinal() - HISTORY_DAYS)
+
+    # one statement, so an order rolled up mid-read is counted exactly once
+    rolled = select(Daily.product_id, Daily.day.label("day"), Daily.units).where(Daily.day >= start)
+    pending = (
+        select(OI.product_id, _order_day().label("day"), func.sum(OI.quantity).label("units"))
+        .join(Order, Order.id == OI.order_id)
+        .where(Order.rolled_up == False, Order.id <= max_order_id, OI.product_id.isnot(None))  # noqa: E712
+        .group_by(OI.product_id, _order_day())
+    )
+    rows = db.execute(union_all(rolled, pending)).all()
+
+    ids, velocity = _fold(rows, today)
+    _state.update(day=today, product_ids=ids, velocity=velocity,
+                  max_order_id=max_order_id, built=time.monotonic())
+
+
+def _catch_up(db, today: date):
+    Order, OI = models.Order, models.OrderItem
+    if today > _state["day"]:
+        _state["velocity"] = _state["velocity"] * (1 - ALPHA) ** (today - _state["day"]).days
+        _state["day"] = today
+
+    max_order_id = db.query(func.coalesce(func.max(Order.id), 0)).scalar()
+    if max_order_id <= _state["max_order_id"]:
+        return
+    rows = (
+        db.query(OI.product_id, _order_day(), func.sum(OI.quantity))
+        .join(Order, Order.id == OI.order_id)
+        .filter(Order.id > _state["max_order_id"], Order.id <= max_order_id, OI.product_id.isnot(None))
+        .group_by(OI.product_id, _order_day())
+        .all()
+    )
+    new_ids, added = _fold(rows, today)
+    ids, velocity = _state["product_ids"], _state["velocity"]
+    if not np.isin(new_ids, ids, assume_unique=True).all():
+        merged = np.union1d(ids, new_ids)
+        grown = np.zeros(len(merged))
+        grown[np.searchsorted(merged, ids)] = velocity
+        ids, velocity = merged, grown
+    else:
+        velocity = velocity.copy()
+    np.add.at(velocity, np.searchsorted(ids, new_ids), added)
+    _state.update(product_ids=ids, velocity=velocity, max_order_id=max_order_id)
+
+
+def velocities(db):
+    """(product ids, units/day) for every product with sales, kept current."""
+    today = datetime.utcnow().date()
+    with _lock:
+        stale = _state["day"] is None or time.monotonic() - _state["built"] > REBUILD_SECONDS
+        record_cache("forecast", not stale)
+        if stale:
+            _rebuild(db, today)
+        else:
+            _catch_up(db, today)
+        return _state["product_ids"], _state["velocity"]
+
+
+def _stock_levels(db):
+    version = caching.catalog_version(db)
+    with _lock:
+        if _stock["version"] == version:
+            return _stock["ids"], _stock["stock"]
+    rows = db.query(models.Product.id, models.Product.stock).order_by(models.Product.id).all()
+    ids = np.fromiter((r[0] for r in rows), dtype=np.int64, count=len(rows))
+    stock = np.fromiter((r[1] for r in rows), dtype=np.float64, count=len(rows))
+    with _lock:
+        _stock.update(version=version, ids=ids, stock=stock)
+    return ids, stock
+
+
+def forecast(db, lead_time_days: float = LEAD_TIME_DAYS, cover_days: float = COVER_DAYS,
+             limit: int = 50, only_reorder: bool = True) -> list:
+    """Products ordered by days of cover, most urgent first."""
+    sold_ids, sold_velocity = velocities(db)
+    ids, stock = _stock_levels(db)
+
+    velocity = np.zeros(len(ids))
+    if len(sold_ids):
+        pos = np.clip(np.searchsorted(sold_ids, ids), 0, len(sold_ids) - 1)
+        hit = sold_ids[pos] == ids
+        velocity[hit] = sold_velocity[pos[hit]]
+
+    with np.errstate(divide="ignore", invalid="ignore"):
+        cover = np.where(velocity > 0, np.maximum(stock, 0) / velocity, np.inf)
+    reorder = np.maximum(np.ceil(velocity * (lead_time_days + cover_days) - 1e-9) - stock, 0)
+
+    candidates = np.flatnonzero(reorder > 0) if only_reorder else np.arange(len(ids))
+    # most urgent first; ties (e.g. no sales at all) by the bigger reorder
+    top = candidates[np.lexsort((-reorder[candidates], cover[candidates]))][:limit]
+    if not len(top):
+        return []
+
+    names = dict(
+        db.query(models.Product.id, models.Product.name).filter(models.Product.id.in_(ids[top].tolist())).all()
+    )
+    return [
+        {
+            "product_id": int(ids[i]),
+            "name": names.get(int(ids[i])),
+            "stock": int(stock[i]),
+            "velocity": round(float(velocity[i]), 3),
+            "days_of_cover": None if math.isinf(cover[i]) else round(float(cover[i]), 1),
+            "reorder_qty": int(reorder[i]),
+        }
+        for i in top
+    ]
@@ -0,0 +1,185 @@
+"""
+Product image storage and serving (`/uploads`).
+
+Uploads are stored content-addressed: the file name is a hash of the bytes
+plus the original extension. A name therefore never changes meaning, and
+responses for it are `Cache-Control: public, max-age=31536000, immutable`.
+Browsers and CDNs keep them for a year without revalidating. Replacing a
+product's image produces a new name. Files saved under their original names
+before this scheme are still served, with `IMAGE_LEGACY_CACHE_CONTROL`.
+
+`ImageFiles` replaces `StaticFiles` for the mount:
+
+- a strong `ETag` (the content hash, or size+mtime for legacy files) and
+  `Last-Modified`, answering matching conditional requests with 304;
+- single byte ranges (`Range: bytes=a-b`, honouring `If-Range`) as 206, and
+  unsatisfiable ones as 416. Multi-range requests get the whole file;
+- the body is handed to the server with the ASGI zero-copy extensions
+  (`http.response.pathsend`, `http.response.zerocopysend`, i.e. sendfile)
+  when the server offers them. Otherwise it is read in chunks off the event
+  loop.
+
+`benchmarks/images.py` compares it with the plain `StaticFiles` mount.
+"""
+import hashlib
+import mimetypes
+import os
+import re
+import tempfile
+from datetime import datetime
+
+from anyio import to_thread
+from starlette.requests import Request
+
+from . import caching
+
+UPLOAD_DIR = "uploads"
+IMMUTABLE = "public, max-age=31536000, immutable"
+LEGACY_CACHE_CONTROL = os.getenv("IMAGE_LEGACY_CACHE_CONTROL", "public, max-age=3600")
+CHUNK_SIZE = 256 * 1024
+
+_HASHED = re.compile(r"^([0-9a-f]{32})(\.[A-Za-z0-9]{1,8})?$")
+_RANGE = re.compile(r"^bytes=(\d*)-(\d*)$")
+
+
+# ---------- storage ----------
+
+def save_upload(upload, directory: str = UPLOAD_DIR) -> str:
+    """Store an uploaded file under its content hash; returns its URL path (`uploads/<name>`)."""
+    os.makedirs(directory, exist_ok=True)
+    ext = os.path.splitext(upload.filename or "")[1].lower()
+    if not re.fullmatch(r"\.[a-z0-9]{1,8}", ext):
+        ext = ""
+    digest = hashlib.sha256()
+    fd, tmp = tempfile.mkstemp(prefix=".upload-", dir=directory)
+    try:
+        with os.fdopen(fd, "wb") as f:
+            while chunk := upload.file.read(CHUNK_SIZE):
+                digest.update(chunk)
+                f.write(chunk)
+        name = digest.hexdigest()[:32] + ext
+        path = os.path.join(directory, name)
+        if os.path.exists(path):
+            os.unlink(tmp)  # same bytes already stored
+        else:
+            os.chmod(tmp, 0o644)
+            os.replace(tmp, path)
+    except BaseException:
+        if os.path.exists(tmp):
+            os.unlink(tmp)
+        raise
+    return f"{os.path.basename(directory.rstrip('/'))}/{name}"
+
+
+# ---------- serving ----------
+
+def byte_range(header: str, size: int):
+    """(start, end) inclusive for a single-range `Range` header; None to send everything; False if unsatisfiable."""
+    match = _RANGE.match(header.replace(" ", ""))
+    if not match:
+        return None  # absent, malformed or multi-range: the whole file is a valid answer
+    first, last = match.groups()
+    if first:
+        start = int(first)
+        end = min(int(last), size - 1) if last else size - 1
+    elif last:
+        start, end = max(size - int(last), 0), size - 1
+    else:
+        return None
+    if start >= size or start > end:
+        return False
+    return start, end
+
+
+class ImageFiles:
+    """ASGI app serving files from one flat directory."""
+
+    def __init__(self, directory: str = UPLOAD_DIR):
+        self.directory = directory
+
+    def _resolve(self, scope):
+        name, root = scope["path"], scope.get("root_path", "")
+        if root and name.startswith(root):  # Starlette mounts keep the prefix in root_path
+            name = name[len(root):]
+        name = name.lstrip("/")
+        if not name or "/" in name or "\\" in name or name.startswith("."):
+            return None, None
+        return name, os.path.join(self.directory, name)
+
+    async def __call__(self, scope, receive, send):
+        if scope["method"] not in ("GET", "HEAD"):
+            await self._plain(send, 405, b"Method Not Allowed", [(b"allow", b"GET, HEAD")])
+            return
+        name, path = self._resolve(scope)
+        try:
+            stat = os.stat(path) if path else None
+        except OSError:
+            stat = None
+        if stat is None or not os.path.isfile(path):
+            await self._plain(send, 404, b"Not Found")
+            return
+
+        hashed = _HASHED.match(name)
+        etag = f'"{hashed.group(1)}"' if hashed else f'"{stat.st_mtime_ns:x}-{stat.st_size:x}"'
+        last_modified = datetime.utcfromtimestamp(stat.st_mtime)
+        headers = [
+            (b"etag", etag.encode()),
+            (b"last-modified", caching.http_date(last_modified).encode()),
+            (b"cache-control", (IMMUTABLE if hashed else LEGACY_CACHE_CONTROL).encode()),
+            (b"accept-ranges", b"bytes"),
+        ]
+        request = Request(scope)
+        if caching.is_not_modified(request, etag, last_modified):
+            await send({"type": "http.response.start", "status": 304, "headers": headers})
+            await send({"type": "http.response.body", "body": b""})
+            return
+
+        content_type = mimetypes.guess_type(name)[0] or "application/octet-stream"
+        headers.append((b"content-type", content_type.encode()))
+        size, start, end, status = stat.st_size, 0, stat.st_size - 1, 200
+        range_header = request.headers.get("range")
+        if range_header and request.headers.get("if-range", etag) == etag:
+            wanted = byte_range(range_header, size)
+            if wanted is False:
+                await self._plain(send, 416, b"", [(b"content-range", f"bytes */{size}".encode())] + headers[:4])
+                return
+            if wanted:
+                start, end = wanted
+                status = 206
+                headers.append((b"content-range", f"bytes {start}-{end}/{size}".encode()))
+        count = end - start + 1 if size else 0
+        headers.append((b"content-length", str(count).encode()))
+        await send({"type": "http.response.start", "status": status, "headers": headers})
+        if scope["method"] == "HEAD" or not count:
+            await send({"type": "http.response.body", "body": b""})
+            return
+        await self._send_file(scope, send, path, start, count, size)
+
+    async def _send_file(self, scope, send, path: str, start: int, count: int, size: int):
+        extensions = scope.get("extensions") or {}
+        if "http.response.pathsend" in extensions and count == size:
+            await send({"type": "http.response.pathsend", "path": os.path.abspath(path)})
+            return
+        with open(path, "rb") as f:
+            if "http.response.zerocopysend" in extensions:
+                await send({"type": "http.response.zerocopysend", "file": f, "offset": start, "count": count})
+                return
+            f.seek(start)
+            remaining = count
+            while remaining:
+                chunk = await to_thread.run_sync(f.read, min(CHUNK_SIZE, remaining))
+                if not chunk:
+                    break
+                remaining -= len(chunk)
+                await send({"type": "http.response.body", "body": chunk, "more_body": remaining > 0})
+            if remaining:
+                await send({"type": "http.response.body", "body": b""})
+
+    @staticmethod
+    async def _plain(send, status: int, body: bytes, headers=()):
+        await send({
+            "type": "http.response.start",
+            "status": status,
+            "headers": [(b"content-type", b"text/plain"), (b"content-length", str(len(body)).encode()), *headers],
+        })
+        await send({"type": "http.response.body", "body": body})
@@ -0,0 +1,255 @@
+"""
+Lightweight durable job queue backed by the `jobs` table.
+
+Enqueue inside the request's own transaction, so a job exists if and only if
+the data it refers to was committed:
+
+    jobs.enqueue(db, "order.placed", {"order_id": order.id})
+    db.commit()   # the after-commit hook wakes up local workers
+
+Workers claim due jobs in batches (`FOR UPDATE SKIP LOCKED` on Postgres, a
+guarded `UPDATE` everywhere else). They run the registered handler, then
+delete the job, or reschedule it with exponential backoff. After
+`max_attempts` failures the job is marked `dead` and kept for inspection.
+Jobs whose worker died mid-run are requeued once their lock is older than
+`JOB_LOCK_TIMEOUT`.
+
+Run workers separately from the web processes:
+
+    python -m app.jobs --threads 4
+
+or inside each web worker with `JOB_WORKERS=<n>`.
+"""
+import argparse
+import importlib
+import json
+import logging
+import os
+import random
+import signal
+import socket
+import threading
+from datetime import datetime, timedelta
+
+from sqlalchemy import event
+
+from . import models
+from .database import SessionLocal
+from .metrics import Counter
+
+logger = logging.getLogger(__name__)
+
+MAX_ATTEMPTS = int(os.getenv("JOB_MAX_ATTEMPTS", 5))
+BATCH_SIZE = int(os.getenv("JOB_BATCH_SIZE", 50))
+POLL_INTERVAL = float(os.getenv("JOB_POLL_INTERVAL", 2.0))
+BACKOFF_BASE = float(os.getenv("JOB_BACKOFF_BASE", 2.0))
+BACKOFF_MAX = float(os.getenv("JOB_BACKOFF_MAX", 600.0))
+LOCK_TIMEOUT = float(os.getenv("JOB_LOCK_TIMEOUT", 300.0))
+
+JOBS_PROCESSED = Counter("jobs_processed_total", "Background jobs by kind and outcome", ("kind", "result"))
+
+# kind -> (function, takes_batch)
+_handlers = {}
+_wakeup = threading.Event()
+
+
+def handler(kind: str, batch: bool = False):
+    """Register the function that runs jobs of `kind`.
+
+    Called as `fn(db, payload)`, or `fn(db, [payloads])` with `batch=True`.
+    Handlers may run more than once for the same job, so they must be idempotent.
+    """
+    def decorator(fn):
+        _handlers[kind] = (fn, batch)
+        return fn
+    return decorator
+
+
+def enqueue(db, kind: str, payload: dict = None, delay: float = 0, max_attempts: int = MAX_ATTEMPTS):
+    job = models.Job(
+        kind=kind,
+        payload=json.dumps(payload or {}, default=str),
+        run_at=datetime.utcnow() + timedelta(seconds=delay),
+        max_attempts=max_attempts,
+    )
+    db.add(job)
+    db.info["jobs_enqueued"] = True
+    return job
+
+
+@event.listens_for(SessionLocal, "after_commit")
+def _wake_workers(session):
+    if session.info.pop("jobs_enqueued", False):
+        _wakeup.set()
+
+
+@event.listens_for(SessionLocal, "after_rollback")
+def _forget_enqueued(session):
+    session.info.pop("jobs_enqueued", None)
+
+
+def backoff(attempts: int) -> float:
+    delay = min(BACKOFF_MAX, BACKOFF_BASE * 2 ** (attempts - 1))
+    return delay * random.uniform(1.0, 1.1)
+
+
+# ---------- worker ----------
+
+def _claim(db, worker_id: str, limit: int):
+    now = datetime.utcnow()
+    Job = models.Job
+
+    # requeue jobs whose worker disappeared mid-run
+    db.query(Job).filter(
+        Job.status == "running", Job.locked_at < now - timedelta(seconds=LOCK_TIMEOUT)
+    ).update({"status": "queued", "locked_by": None}, synchronize_session=False)
+
+    q = db.query(Job.id).filter(Job.status == "queued", Job.run_at <= now).order_by(Job.run_at, Job.id).limit(limit)
+    if db.bind.dialect.name == "postgresql":
+        q = q.with_for_update(skip_locked=True)
+    ids = [row.id for row in q]
+    if ids:
+        db.query(Job).filter(Job.id.in_(ids), Job.status == "queued").update(
+            {"status": "running", "locked_by": worker_id, "locked_at": now, "attempts": Job.attempts + 1},
+            synchronize_session=False,
+        )
+    db.commit()
+    if not ids:
+        return []
+    # another worker may have won some of these ids between our SELECT and UPDATE
+    return db.query(Job).filter(Job.id.in_(ids), Job.locked_by == worker_id, Job.status == "running").all()
+
+
+def _finish(db, job, error: str = None):
+    if error is None:
+        db.delete(job)
+        JOBS_PROCESSED.inc(job.kind, "done")
+    elif job.attempts >= job.max_attempts:
+        job.status, job.locked_by, job.last_error = "dead", None, error
+        JOBS_PROCESSED.inc(job.kind, "dead")
+        logger.error("job %s (%s) is dead after %s attempts: %s", job.id, job.kind, job.attempts, error)
+    else:
+        job.status, job.locked_by, job.last_error = "queued", None, error
+        job.run_at = datetime.utcnow() + timedelta(seconds=backoff(job.attempts))
+        JOBS_PROCESSED.inc(job.kind, "retry")
+
+
+def _run(kind: str, group: list):
+    """Run one kind's jobs; returns {job_id: error or None}."""
+    entry = _handlers.get(kind)
+    if entry is None:
+        return {job.id: f"no handler registered for {kind!r}" for job in group}
+    fn, takes_batch = entry
+    calls = [group] if takes_batch else [[job] for job in group]
+    results = {}
+    for jobs_in_call in calls:
+        payloads = [json.loads(job.payload) for job in jobs_in_call]
+        db = SessionLocal()
+        try:
+            fn(db, payloads if takes_batch else payloads[0])
+            db.commit()
+            error = None
+        except Exception as e:
+            db.rollback()
+            logger.exception("job kind %s failed", kind)
+            error = f"{type(e).__name__}: {e}"
+        finally:
+            db.close()
+        results.update({job.id: error for job in jobs_in_call})
+    return results
+
+
+def run_once(worker_id: str, batch_size: int = BATCH_SIZE) -> int:
+    """Claim and run one batch. Returns the number of jobs handled."""
+    db = SessionLocal()
+    try:
+        claimed = _claim(db, worker_id, batch_size)
+        by_kind = {}
+        for job in claimed:
+            by_kind.setdefault(job.kind, []).append(job)
+        for kind, group in by_kind.items():
+            results = _run(kind, group)
+            for job in group:
+                _finish(db, job, results[job.id])
+            db.commit()
+        return len(claimed)
+    finally:
+        db.close()
+
+
+class Worker(threading.Thread):
+    def __init__(self, index: int = 0, batch_size: int = BATCH_SIZE, poll_interval: float = POLL_INTERVAL):
+        super().__init__(name=f"job-worker-{index}", daemon=True)
+        self.worker_id = f"{socket.gethostname()}:{os.getpid()}:{index}"
+        self.batch_size = batch_size
+        self.poll_interval = poll_interval
+        self._stop_event = threading.Event()
+
+    def run(self):
+        while not self._stop_event.is_set():
+            try:
+                handled = run_once(self.worker_id, self.batch_size)
+            except Exception:
+                logger.exception("job worker %s crashed while polling", self.worker_id)
+                handled = 0
+            if not handled:
+                _wakeup.wait(self.poll_interval)
+                _wakeup.clear()
+
+    def stop(self):
+        self._stop_event.set()
+        _wakeup.set()
+
+
+def start_workers(count: int, **kwargs):
+    importlib.import_module("app.tasks")  # registers the handlers
+    workers = [Worker(i, **kwargs) for i in range(count)]
+    for w in workers:
+        w.start()
+    return workers
+
+
+def stop_workers(workers, timeout: float = 10.0):
+    for w in workers:
+        w.stop()
+    for w in workers:
+        w.join(timeout)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Run background job workers.")
+    parser.add_argument("--threads", type=int, default=2)
+    parser.add_argument("--batch-size", type=int, default=BATCH_SIZE)
+    parser.add_argument("--poll-interval", type=float, default=POLL_INTERVAL)
+    parser.add_argument("--once", action="store_true", help="drain due jobs once and exit")
+    args = parser.parse_args(argv)
+    logging.basicConfig(level=logging.INFO, format="%(asctime)s %(levelname)s %(name)s: %(message)s")
+
+    if args.once:
+        importlib.import_module("app.tasks")
+        worker_id = f"{socket.gethostname()}:{os.getpid()}:once"
+        total = 0
+        while True:
+            handled = run_once(worker_id, args.batch_size)
+            total += handled
+            if not handled:
+                break
+        print(f"handled {total} jobs")
+        return
+
+    workers = start_workers(args.threads, batch_size=args.batch_size, poll_interval=args.poll_interval)
+    stopping = threading.Event()
+    signal.signal(signal.SIGTERM, lambda *a: stopping.set())
+    signal.signal(signal.SIGINT, lambda *a: stopping.set())
+    logger.info("started %s job workers", len(workers))
+    # the after-commit wake-up only reaches this process; the poll interval covers the rest
+    while not stopping.wait(1.0):
+        pass
+    stop_workers(workers)
+
+
+if __name__ == "__main__":
+    # `python -m app.jobs` loads this file as __main__; app.tasks registers its
+    # handlers on the imported app.jobs, so run that module's workers.
+    from app.jobs import main
+    main()
@@ -0,0 +1,294 @@
+"""
+Append-only stock ledger.
+
+    python -m app.ledger --snapshot
+
+Every ORM flush that changes `Product.stock` also inserts one
+`stock_movements` row per changed product, with the signed change. The insert
+is a single executemany on the flush's own connection, so entries commit or
+roll back with the change they describe. A movement's kind comes from the
+reason the caller set on the session (`reason(db, SALE, order_id=...)` in
+checkout). Without one, increases are `restock` and decreases `adjustment`.
+`release` is for reserved stock returned to the shelf.
+
+Store stock (`store_stock`, see stores.py) is written with Core statements,
+so stores.py records its changes itself through `record_store`. Those
+entries carry the `store_id`. They are always written to the main database,
+in the same transaction as the order or stock update they belong to.
+Snapshots, `stock_at` and `drift` cover the catalog's stock (`store_id` NULL).
+
+`stock_snapshots` bounds how much history a lookup reads. `--snapshot`
+(run periodically, e.g. hourly) rolls each product's last snapshot forward
+through the movements since, up to the newest entry older than
+`LEDGER_SNAPSHOT_LAG_SECONDS`. The lag leaves room for transactions that
+commit out of id order. A product's first snapshot is taken from its live
+stock instead, which baselines products that existed before the ledger.
+Stock at any time is then the nearest snapshot plus a short tail of
+movements.
+
+`drift` compares `products.stock` with what the ledger adds up to. A
+mismatch means a write bypassed the ORM or two writers overwrote each
+other's stock. `correct` records the difference as an adjustment.
+"""
+import argparse
+import os
+from datetime import datetime, timedelta
+
+from sqlalchemy import and_, event, func, inspect, select
+
+from . import models
+from .database import SessionLocal
+
+SALE = "sale"
+RESTOCK = "restock"
+ADJUSTMENT = "adjustment"
+RELEASE = "release"
+KINDS = (SALE, RESTOCK, ADJUSTMENT, RELEASE)
+
+SNAPSHOT_LAG_SECONDS = float(os.getenv("LEDGER_SNAPSHOT_LAG_SECONDS", 60))
+SNAPSHOT_CHUNK = 10_000
+
+
+# ---------- capture from the ORM ----------
+
+def reason(session, kind: str, order_id: int = None):
+    """Label the stock changes this transaction flushes from now on."""
+    session.info["stock_reason"] = (kind, order_id)
+
+
+@event.listens_for(SessionLocal, "after_flush")
+def _record_movements(session, flush_context):
+    kind, order_id = session.info.get("stock_reason", (None, None))
+    now = datetime.utcnow()
+    rows = []
+    for obj in (*session.new, *session.dirty):
+        if not isinstance(obj, models.Product):
+            continue
+        history = inspect(obj).attrs.stock.history
+        if not history.added:
+            continue
+        if history.deleted:
+            old = history.deleted[0] or 0
+        elif obj in session.new:
+            old = 0
+        else:
+            continue  # previous value was never loaded; shows up as drift
+        change = (history.added[0] or 0) - old
+        if change:
+            rows.append({
+                "product_id": obj.id,
+                "kind": kind or (RESTOCK if change > 0 else ADJUSTMENT),
+                "quantity": change,
+                "order_id": order_id,
+                "store_id": None,
+                "created_at": now,
+            })
+    if rows:
+        session.connection().execute(models.StockMovement.__table__.insert(), rows)
+
+
+def record_store(session, store_id: int, changes: dict, kind: str = None, order_id: int = None):
+    """Append one entry per `{product_id: signed change}` of a store's stock. Caller commits."""
+    now = datetime.utcnow()
+    rows = [
+        {
+            "product_id": product_id,
+            "kind": kind or (RESTOCK if change > 0 else ADJUSTMENT),
+            "quantity": change,
+            "order_id": order_id,
+            "store_id": store_id,
+            "created_at": now,
+        }
+        for product_id, change in changes.items() if change
+    ]
+    if rows:
+        session.execute(models.StockMovement.__table__.insert(), rows)
+
+
+@event.listens_for(SessionLocal, "after_commit")
+def _clear_reason(session):
+    session.info.pop("stock_reason", None)
+
+
+@event.listens_for(SessionLocal, "after_rollback")
+def _clear_reason_on_rollback(session):
+    session.info.pop("stock_reason", None)
+
+
+# ---------- reads ----------
+
+def _latest_snapshots():
+    S = models.StockSnapshot
+    last = select(S.product_id, func.max(S.movement_id).label("movement_id")).group_by(S.product_id).subquery()
+    return (
+        select(S.product_id, S.movement_id, S.stock)
+        .join(last, and_(S.product_id == last.c.product_id, S.movement_id == last.c.movement_id))
+        .subquery()
+    )
+
+
+def ledger_stock():
+    """Subquery of (product_id, stock) as the ledger has it: last snapshot plus every movement since."""
+    M = models.StockMovement
+    snap = _latest_snapshots()
+    tail = (
+        select(M.product_id, func.sum(M.quantity).label("quantity"))
+        .outerjoin(snap, snap.c.product_id == M.product_id)
+        .where(M.store_id.is_(None), M.id > func.coalesce(snap.c.movement_id, 0))
+        .group_by(M.product_id)
+        .subquery()
+    )
+    P = models.Product
+    return (
+        select(
+            P.id.label("product_id"),
+            (func.coalesce(snap.c.stock, 0) + func.coalesce(tail.c.quantity, 0)).label("stock"),
+        )
+        .outerjoin(snap, snap.c.product_id == P.id)
+        .outerjoin(tail, tail.c.product_id == P.id)
+        .subquery()
+    )
+
+
+def stock_at(db, product_id: int, at: datetime):
+    """Stock of one product at `at`, or None if the product is unknown.
+
+    Reads one snapshot and the movements between it and `at`: forward from
+    the last snapshot before `at`, or backward from the first one after it.
+    """
+    S, M = models.StockSnapshot, models.StockMovement
+    before = (
+        db.query(S).filter(S.product_id == product_id, S.as_of <= at)
+        .order_by(S.as_of.desc(), S.movement_id.desc()).first()
+    )
+    if before is not None:
+        tail = db.query(func.coalesce(func.sum(M.quantity), 0)).filter(
+            M.product_id == product_id, M.store_id.is_(None), M.id > before.movement_id, M.created_at <= at
+        ).scalar()
+        return before.stock + tail
+
+    after = db.query(S).filter(S.product_id == product_id).order_by(S.as_of, S.movement_id).first()
+    if after is not None:
+        since = db.query(func.coalesce(func.sum(M.quantity), 0)).filter(
+            M.product_id == product_id, M.store_id.is_(None), M.id <= after.movement_id, M.created_at > at
+        ).scalar()
+        return after.stock - since
+
+    # not snapshotted yet: walk back from the live value
+    stock = db.query(models.Product.stock).filter(models.Product.id == product_id).scalar()
+    if stock is None:
+        return None
+    since = db.query(func.coalesce(func.sum(M.quantity), 0)).filter(
+        M.product_id == product_id, M.store_id.is_(None), M.created_at > at
+    ).scalar()
+    return stock - since
+
+
+def movements(db, product_id: int = None, kind: str = None, since: datetime = None, limit: int = 100,
+              store_id: int = None):
+    """The catalog's movements, or with `store_id` that store's."""
+    M = models.StockMovement
+    q = db.query(M).filter(M.store_id.is_(None) if store_id is None else M.store_id == store_id)
+    if product_id is not None:
+        q = q.filter(M.product_id == product_id)
+    if kind is not None:
+        q = q.filter(M.kind == kind)
+    if since is not None:
+        q = q.filter(M.created_at >= since)
+    return q.order_by(M.id.desc()).limit(limit).all()
+
+
+def drift(db, limit: int = 100):
+    """Products whose stock differs from the ledger: (product_id, name, stock, ledger_stock)."""
+    P = models.Product
+    ledger = ledger_stock()
+    return db.execute(
+        select(P.id, P.name, P.stock, ledger.c.stock)
+        .join(ledger, ledger.c.product_id == P.id)
+        .where(P.stock != ledger.c.stock)
+        .order_by(P.id)
+        .limit(limit)
+    ).all()
+
+
+# ---------- writes ----------
+
+def correct(db, limit: int = 1000) -> int:
+    """Record an adjustment for every drifted product so the ledger matches `products.stock`. Caller commits."""
+    now = datetime.utcnow()
+    rows = [
+        {"product_id": pid, "kind": ADJUSTMENT, "quantity": stock - expected, "order_id": None, "store_id": None,
+         "created_at": now}
+        for pid, _, stock, expected in drift(db, limit)
+    ]
+    if rows:
+        db.execute(models.StockMovement.__table__.insert(), rows)
+    return len(rows)
+
+
+def snapshot(db, now: datetime = None) -> int:
+    """Write a snapshot for every product that moved since its last one. Caller commits.
+
+    Returns the number of snapshot rows written.
+    """
+    M, S, P = models.StockMovement, models.StockSnapshot, models.Product
+    now = now or datetime.utcnow()
+    watermark, as_of = db.execute(
+        select(M.id, M.created_at)
+        .where(M.created_at < now - timedelta(seconds=SNAPSHOT_LAG_SECONDS))
+        .order_by(M.id.desc()).limit(1)
+    ).first() or (0, now)
+
+    snap = _latest_snapshots()
+    rolled = db.execute(
+        select(snap.c.product_id, snap.c.stock + func.sum(M.quantity))
+        .join(M, and_(
+            M.product_id == snap.c.product_id, M.store_id.is_(None),
+            M.id > snap.c.movement_id, M.id <= watermark,
+        ))
+        .group_by(snap.c.product_id, snap.c.stock)
+    ).all()
+
+    # first snapshot: live stock minus whatever moved after the watermark
+    later = (
+        select(M.product_id, func.sum(M.quantity).label("quantity"))
+        .where(M.store_id.is_(None), M.id > watermark).group_by(M.product_id).subquery()
+    )
+    baselined = db.execute(
+        select(P.id, P.stock - func.coalesce(later.c.quantity, 0))
+        .outerjoin(later, later.c.product_id == P.id)
+        .where(~select(S.product_id).where(S.product_id == P.id).exists())
+    ).all()
+
+    rows = [
+        {"product_id": pid, "movement_id": watermark, "stock": stock, "as_of": as_of}
+        for pid, stock in (*rolled, *baselined)
+    ]
+    for i in range(0, len(rows), SNAPSHOT_CHUNK):
+        db.execute(S.__table__.insert(), rows[i:i + SNAPSHOT_CHUNK])
+    return len(rows)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Maintain the stock ledger.")
+    group = parser.add_mutually_exclusive_group(required=True)
+    group.add_argument("--snapshot", action="store_true", help="snapshot every product that moved")
+    group.add_argument("--drift", action="store_true", help="list products whose stock disagrees with the ledger")
+    parser.add_argument("--limit", type=int, default=100)
+    args = parser.parse_args(argv)
+
+    db = SessionLocal()
+    try:
+        if args.snapshot:
+            written = snapshot(db)
+            db.commit()
+            print(f"wrote {written} snapshots")
+        else:
+            for pid, name, stock, expected in drift(db, args.limit):
+                print(f"{pid}\t{name}\tstock={stock}\tledger={expected}\tdrift={stock - expected}")
+    finally:
+        db.close()
+
+
+if __name__ == "__main__":
+    main()
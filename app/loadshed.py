@@ -0,0 +1,88 @@
+"""
+Concurrency-based load shedding.
+
+Once a worker is past what it can serve, queueing more work only makes every
+request slower. Past the limits below, new requests get an immediate
+`503` with `Retry-After`, so clients and the load balancer back off:
+
+- more than `SHED_MAX_IN_FLIGHT` requests in flight in this worker, or
+- the DB pool exhausted with more than `SHED_MAX_POOL_WAITERS` threads
+  queued for a connection. The queue is estimated as busy threadpool
+  threads minus checked-out connections.
+
+Health, readiness, metrics and long-lived streams are never shed.
+"""
+import json
+import os
+
+from anyio import to_thread
+
+from .metrics import Counter
+
+MAX_IN_FLIGHT = int(os.getenv("SHED_MAX_IN_FLIGHT", 256))
+MAX_POOL_WAITERS = int(os.getenv("SHED_MAX_POOL_WAITERS", 32))
+RETRY_AFTER = int(os.getenv("SHED_RETRY_AFTER", 1))
+EXEMPT_PATHS = ("/health", "/ready", "/metrics", "/inventory/stream")
+
+REQUESTS_SHED = Counter("requests_shed_total", "Requests rejected with 503 by load shedding", ("reason",))
+
+
+def pool_waiters(engine) -> int:
+    pool = engine.pool
+    size, checked_out = getattr(pool, "size", None), getattr(pool, "checkedout", None)
+    max_overflow = getattr(pool, "_max_overflow", -1)
+    if size is None or checked_out is None or max_overflow < 0:
+        return 0  # not a bounded pool
+    in_use = checked_out()
+    if in_use < size() + max_overflow:
+        return 0
+    busy = to_thread.current_default_thread_limiter().statistics().borrowed_tokens
+    return max(0, busy - in_use)
+
+
+class LoadShedMiddleware:
+    """Pure ASGI; counts only this worker's requests (the event loop is single-threaded)."""
+
+    def __init__(self, app, engine=None, max_in_flight: int = MAX_IN_FLIGHT,
+                 max_pool_waiters: int = MAX_POOL_WAITERS, exempt=EXEMPT_PATHS):
+        self.app = app
+        self.engine = engine
+        self.max_in_flight = max_in_flight
+        self.max_pool_waiters = max_pool_waiters
+        self.exempt = tuple(exempt)
+        self.in_flight = 0
+
+    def overloaded(self):
+        """The reason to shed the next request, or None."""
+        if self.max_in_flight and self.in_flight >= self.max_in_flight:
+            return "in_flight"
+        if self.engine is not None and self.max_pool_waiters and pool_waiters(self.engine) > self.max_pool_waiters:
+            return "db_pool"
+        return None
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http" or scope["path"].startswith(self.exempt):
+            await self.app(scope, receive, send)
+            return
+
+        reason = self.overloaded()
+        if reason:
+            REQUESTS_SHED.inc(reason)
+            body = json.dumps({"detail": "Server is overloaded, retry shortly"}).encode()
+            await send({
+                "type": "http.response.start",
+                "status": 503,
+                "headers": [
+                    (b"content-type", b"application/json"),
+                    (b"content-length", str(len(body)).encode()),
+                    (b"retry-after", str(RETRY_AFTER).encode()),
+                ],
+            })
+            await send({"type": "http.response.body", "body": body})
+            return
+
+        self.in_flight += 1
+        try:
+            await self.app(scope, receive, send)
+        finally:
+            self.in_flight -= 1
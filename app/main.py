@@ -1,8 +1,13 @@
+import time
+IMPORT_STARTED = time.perf_counter()
+
+from contextlib import asynccontextmanager
 from fastapi import FastAPI, HTTPException
+from fastapi.responses import JSONResponse, PlainTextResponse
 from fastapi.middleware.cors import CORSMiddleware
-from fastapi.staticfiles import StaticFiles
 import os
-from .database import Base, engine, SessionLocal
+from sqlalchemy import text
+from .database import engine, SessionLocal
 from .routers import (
     auth as auth_router,
     products as products_router,
@@ -10,17 +15,53 @@ from .routers import (
     orders as orders_router,
     wishlist as wishlist_router,
     promocodes as promocode_router,
-    inventory as inventory_router
+    inventory as inventory_router,
+    notifications as notifications_router,
+    stores as stores_router,
+    profiling as profiling_router
 )
-from . import models
+from . import models, metrics, fastjson, jobs, events, cartstore, snapshot, images, profiling
+from .compression import CompressionMiddleware
+from .loadshed import LoadShedMiddleware
 from . import seed  # Import the seed module
+from .migrate import UPLOAD_DIR
+
+# Flipped by the lifespan below; /ready reports 503 outside of this window
+lifecycle = {"started": False, "draining": False}
+
+
+# In-process job workers (0 = run `python -m app.jobs` separately)
+JOB_WORKERS = int(os.getenv("JOB_WORKERS", 0))
+
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    # started here rather than at import so each forked worker gets its own threads
+    workers = jobs.start_workers(JOB_WORKERS) if JOB_WORKERS else []
+    events.broker.start()
+    cartstore.store.start()
+    if snapshot.ENABLED:
+        snapshot.reader.open()
+    lifecycle["started"] = True
+    yield
+    lifecycle["draining"] = True
+    cartstore.store.stop()  # final flush of write-behind carts
+    profiling.profiler.shutdown()
+    events.broker.stop()
+    jobs.stop_workers(workers)
+
 
 app = FastAPI(
     title="Grocery Backend API",
     description="Production-ready grocery e-commerce API",
-    version="1.0.0"
+    version="1.0.0",
+    lifespan=lifespan,
+    default_response_class=fastjson.DEFAULT_RESPONSE_CLASS
 )
 
+# inside CORS, so browsers can read shed 503s and their Retry-After,
+# and inside the metrics middleware, so they're counted per route
+app.add_middleware(LoadShedMiddleware, engine=engine)
 # CORS Configuration
 app.add_middleware(
     CORSMiddleware,
@@ -28,15 +69,17 @@ app.add_middleware(
     allow_credentials=True,
     allow_methods=["*"],
     allow_headers=["*"],
+    expose_headers=["Retry-After"],
 )
+app.add_middleware(CompressionMiddleware)
+# idle unless a manager starts a session at /admin/profile
+app.add_middleware(profiling.ProfilingMiddleware, routes=app.routes)
+app.add_middleware(metrics.MetricsMiddleware, started_at=IMPORT_STARTED)
+metrics.instrument_engine(engine)
 
-# Create tables
-Base.metadata.create_all(bind=engine)
-
-# Mount static files for uploads
-UPLOAD_DIR = "uploads"
-os.makedirs(UPLOAD_DIR, exist_ok=True)
-app.mount("/uploads", StaticFiles(directory=UPLOAD_DIR), name="uploads")
+# Tables and the upload folder are created by `python -m app.migrate`
+# content-addressed images: immutable caching, ETag/304, byte ranges, zero-copy send
+app.mount("/uploads", images.ImageFiles(UPLOAD_DIR), name="uploads")
 
 # Include routers
 app.include_router(auth_router.router)
@@ -46,6 +89,9 @@ app.include_router(orders_router.router)
 app.include_router(wishlist_router.router)
 app.include_router(promocode_router.router)
 app.include_router(inventory_router.router)
+app.include_router(notifications_router.router)
+app.include_router(stores_router.router)
+app.include_router(profiling_router.router)
 
 
 @app.get("/")
@@ -58,8 +104,47 @@ def root():
 
 
 @app.get("/health")
-def health_check():
-    return {"status": "healthy"}
+def health_check(deep: bool = False):
+    """Liveness check. With `deep=true` also runs a round trip to the database."""
+    if not deep:
+        return {"status": "healthy"}
+
+    db = SessionLocal()
+    start = time.perf_counter()
+    try:
+        db.execute(text("SELECT 1"))
+        db_status = {"ok": True}
+    except Exception as e:
+        db_status = {"ok": False, "error": str(e)}
+    finally:
+        db.close()
+    db_status["latency_ms"] = round((time.perf_counter() - start) * 1000, 2)
+
+    if not db_status["ok"]:
+        return JSONResponse(status_code=503, content={"status": "unhealthy", "db": db_status})
+    return {"status": "healthy", "db": db_status}
+
+
+@app.get("/ready")
+def readiness_check():
+    """Readiness probe: startup has finished, we're not draining and the schema is reachable."""
+    if not lifecycle["started"] or lifecycle["draining"]:
+        return JSONResponse(status_code=503, content={"status": "not ready"})
+
+    db = SessionLocal()
+    try:
+        db.query(models.Product.id).limit(1).all()
+    except Exception as e:
+        return JSONResponse(status_code=503, content={"status": "not ready", "error": str(e)})
+    finally:
+        db.close()
+    return {"status": "ready", "startup_seconds": metrics.startup_seconds()}
+
+
+@app.get("/metrics", include_in_schema=False)
+async def metrics_endpoint():
+    """Prometheus scrape endpoint."""
+    return PlainTextResponse(metrics.render(), media_type="text/plain; version=0.0.4")
 
 
 # ===== SEED ENDPOINT =====
@@ -102,3 +187,6 @@ def seed_database(secret: str):
         raise HTTPException(status_code=500, detail=f"Seeding failed: {str(e)}")
     finally:
         db.close()
+
+
+metrics.STARTUP_SECONDS.set("import", value=time.perf_counter() - IMPORT_STARTED)
@@ -0,0 +1,253 @@
+"""
+In-process metrics exposed in Prometheus text format.
+
+Every metric keeps its own lock, so recording from the event loop and from
+threadpool workers (sync routes) is safe. Values that already live elsewhere
+(DB pool, threadpool) are read at scrape time instead of being tracked.
+"""
+import threading
+import time
+from bisect import bisect_left
+
+from anyio import to_thread
+
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+_registry = []
+_collectors = []
+
+
+def _escape(value) -> str:
+    return str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _labels(names, values, extra=None) -> str:
+    pairs = [f'{n}="{_escape(v)}"' for n, v in zip(names, values)]
+    if extra:
+        pairs.append(extra)
+    return "{" + ",".join(pairs) + "}" if pairs else ""
+
+
+def _fmt(value) -> str:
+    if value == float("inf"):
+        return "+Inf"
+    if isinstance(value, float) and value.is_integer():
+        return str(int(value))
+    return repr(value) if isinstance(value, float) else str(value)
+
+
+class _Metric:
+    kind = "untyped"
+
+    def __init__(self, name: str, help: str, labelnames=()):
+        self.name = name
+        self.help = help
+        self.labelnames = tuple(labelnames)
+        self._lock = threading.Lock()
+        self._values = {} if self.labelnames else {(): 0}
+        _registry.append(self)
+
+    def _header(self):
+        return [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} {self.kind}"]
+
+
+class Counter(_Metric):
+    kind = "counter"
+
+    def inc(self, *labels, amount: float = 1):
+        with self._lock:
+            self._values[labels] = self._values.get(labels, 0) + amount
+
+    def value(self, *labels):
+        return self._values.get(labels, 0)
+
+    def collect(self):
+        with self._lock:
+            items = sorted(self._values.items())
+        return self._header() + [
+            f"{self.name}{_labels(self.labelnames, k)} {_fmt(v)}" for k, v in items
+        ]
+
+
+class Gauge(Counter):
+    kind = "gauge"
+
+    def dec(self, *labels, amount: float = 1):
+        self.inc(*labels, amount=-amount)
+
+    def set(self, *labels, value: float):
+        with self._lock:
+            self._values[labels] = value
+
+
+class Histogram(_Metric):
+    kind = "histogram"
+
+    def __init__(self, name: str, help: str, labelnames=(), buckets=DEFAULT_BUCKETS):
+        super().__init__(name, help, labelnames)
+        self._values = {}
+        self.buckets = tuple(sorted(buckets))
+
+    def observe(self, value: float, *labels):
+        idx = bisect_left(self.buckets, value)
+        with self._lock:
+            state = self._values.get(labels)
+            if state is None:
+                # per-bucket counts (last slot is +Inf), sum, count
+                state = self._values[labels] = [[0] * (len(self.buckets) + 1), 0.0, 0]
+            state[0][idx] += 1
+            state[1] += value
+            state[2] += 1
+
+    def collect(self):
+        with self._lock:
+            items = sorted((k, ([*v[0]], v[1], v[2])) for k, v in self._values.items())
+        lines = self._header()
+        for labels, (counts, total, count) in items:
+            cumulative = 0
+            for bound, n in zip(self.buckets + (float("inf"),), counts):
+                cumulative += n
+                le = 'le="' + _fmt(float(bound)) + '"'
+                lines.append(f"{self.name}_bucket{_labels(self.labelnames, labels, le)} {cumulative}")
+            lines.append(f"{self.name}_sum{_labels(self.labelnames, labels)} {_fmt(total)}")
+            lines.append(f"{self.name}_count{_labels(self.labelnames, labels)} {count}")
+        return lines
+
+
+def collector(fn):
+    """Register a function that sets gauges right before each scrape."""
+    _collectors.append(fn)
+    return fn
+
+
+# ---------- HTTP ----------
+REQUEST_LATENCY = Histogram(
+    "http_request_duration_seconds", "Request latency by route template",
+    ("method", "route"),
+)
+REQUESTS = Counter(
+    "http_requests_total", "Responses by route and status code",
+    ("method", "route", "status"),
+)
+IN_FLIGHT = Gauge("http_requests_in_flight", "Requests currently being handled")
+
+STARTUP_SECONDS = Gauge(
+    "app_startup_seconds",
+    "Seconds from the start of importing app.main to the end of the phase",
+    ("phase",),
+)
+
+
+def startup_seconds() -> dict:
+    return {labels[0]: round(v, 4) for labels, v in STARTUP_SECONDS._values.items()}
+
+
+# ---------- bcrypt / threadpool ----------
+BCRYPT_IN_PROGRESS = Gauge(
+    "bcrypt_operations_in_progress", "bcrypt hash/verify calls currently running"
+)
+THREADPOOL_BUSY = Gauge("threadpool_workers_busy", "Threadpool workers running sync code")
+THREADPOOL_WAITING = Gauge(
+    "threadpool_tasks_waiting", "Sync calls (including bcrypt) queued for a threadpool worker"
+)
+
+# ---------- DB pool ----------
+DB_POOL_SIZE = Gauge("db_pool_size", "Configured connection pool size")
+DB_POOL_CHECKED_OUT = Gauge("db_pool_checked_out", "Connections currently checked out")
+DB_POOL_OVERFLOW = Gauge("db_pool_overflow", "Connections opened beyond pool_size")
+DB_POOL_CHECKOUTS = Counter("db_pool_checkouts_total", "Connection checkouts from the pool")
+
+# ---------- caches ----------
+CACHE_REQUESTS = Counter("cache_requests_total", "Cache lookups by result", ("cache", "result"))
+CACHE_HIT_RATIO = Gauge("cache_hit_ratio", "Cache hits / lookups since start", ("cache",))
+
+
+def record_cache(cache: str, hit: bool):
+    CACHE_REQUESTS.inc(cache, "hit" if hit else "miss")
+
+
+@collector
+def _cache_ratios():
+    with CACHE_REQUESTS._lock:
+        values = dict(CACHE_REQUESTS._values)
+    for cache in {k[0] for k in values}:
+        hits = values.get((cache, "hit"), 0)
+        total = hits + values.get((cache, "miss"), 0)
+        CACHE_HIT_RATIO.set(cache, value=hits / total if total else 0.0)
+
+
+@collector
+def _threadpool():
+    try:
+        limiter = to_thread.current_default_thread_limiter()
+    except Exception:  # no running event loop
+        return
+    stats = limiter.statistics()
+    THREADPOOL_BUSY.set(value=stats.borrowed_tokens)
+    THREADPOOL_WAITING.set(value=stats.tasks_waiting)
+
+
+def instrument_engine(engine):
+    """Track checkouts and expose pool occupancy for `engine`."""
+    from sqlalchemy import event
+
+    @event.listens_for(engine, "checkout")
+    def _on_checkout(*args):
+        DB_POOL_CHECKOUTS.inc()
+
+    @collector
+    def _pool():
+        pool = engine.pool
+        for gauge, attr in (
+            (DB_POOL_SIZE, "size"),
+            (DB_POOL_CHECKED_OUT, "checkedout"),
+            (DB_POOL_OVERFLOW, "overflow"),
+        ):
+            fn = getattr(pool, attr, None)
+            if fn is not None:
+                # QueuePool reports overflow as negative until the pool is full
+                gauge.set(value=max(fn(), 0))
+
+
+def render() -> str:
+    for fn in _collectors:
+        fn()
+    lines = []
+    for metric in _registry:
+        lines.extend(metric.collect())
+    return "\n".join(lines) + "\n"
+
+
+class MetricsMiddleware:
+    """Pure ASGI middleware, so streaming responses are not buffered."""
+
+    def __init__(self, app, started_at: float = None):
+        self.app = app
+        # set -> import-to-first-request latency still to be recorded
+        self.started_at = started_at
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        status = [500]
+
+        async def send_wrapper(message):
+            if message["type"] == "http.response.start":
+                status[0] = message["status"]
+            await send(message)
+
+        start = time.perf_counter()
+        IN_FLIGHT.inc()
+        try:
+            await self.app(scope, receive, send_wrapper)
+        finally:
+            IN_FLIGHT.dec()
+            route = getattr(scope.get("route"), "path", "unmatched")
+            method = scope["method"]
+            REQUEST_LATENCY.observe(time.perf_counter() - start, method, route)
+            REQUESTS.inc(method, route, str(status[0]))
+            if self.started_at is not None:
+                STARTUP_SECONDS.set("first_request", value=time.perf_counter() - self.started_at)
+                self.started_at = None
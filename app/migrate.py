@@ -0,0 +1,67 @@
+"""
+Explicit schema step, run once per deploy before the web workers start:
+
+    python -m app.migrate
+
+Keeping this out of `app.main` means workers never race each other on
+`CREATE TABLE` and a cold start does no schema reflection.
+
+`create_all` only creates missing tables, so columns and indexes added to
+existing tables are brought in here as well. New columns must be nullable or
+carry a server default; backfills live in `BACKFILLS`.
+"""
+import os
+
+from sqlalchemy import inspect, text
+
+from .database import Base, engine as default_engine
+from . import models  # noqa: F401  (registers every table on Base.metadata)
+from .stores import store_engines
+from .images import UPLOAD_DIR
+
+# (table, column) -> statement run right after that column is added
+BACKFILLS = {
+    ("products", "updated_at"): "UPDATE products SET updated_at = created_at WHERE updated_at IS NULL",
+    ("orders", "rolled_up"): "UPDATE orders SET rolled_up = FALSE WHERE rolled_up IS NULL",
+    ("orders", "recs_indexed"): "UPDATE orders SET recs_indexed = FALSE WHERE recs_indexed IS NULL",
+}
+
+
+def _add_missing_columns(conn):
+    inspector = inspect(conn)
+    for table in Base.metadata.sorted_tables:
+        if not inspector.has_table(table.name):
+            continue
+        existing = {c["name"] for c in inspector.get_columns(table.name)}
+        for column in table.columns:
+            if column.name in existing:
+                continue
+            col_type = column.type.compile(dialect=conn.dialect)
+            conn.execute(text(f"ALTER TABLE {table.name} ADD COLUMN {column.name} {col_type}"))
+            backfill = BACKFILLS.get((table.name, column.name))
+            if backfill:
+                conn.execute(text(backfill))
+            print(f"added column {table.name}.{column.name}")
+
+
+def migrate(engine=None):
+    engine = engine or default_engine
+    with engine.begin() as conn:
+        _add_missing_columns(conn)
+    Base.metadata.create_all(bind=engine)
+    # create_all skips indexes on tables that already exist
+    with engine.begin() as conn:
+        for table in Base.metadata.sorted_tables:
+            for index in table.indexes:
+                index.create(bind=conn, checkfirst=True)
+    # stores placed on their own databases only need their stock table
+    for store_engine in {id(e): e for e in store_engines()}.values():
+        models.StoreStock.__table__.create(bind=store_engine, checkfirst=True)
+        for index in models.StoreStock.__table__.indexes:
+            index.create(bind=store_engine, checkfirst=True)
+    os.makedirs(UPLOAD_DIR, exist_ok=True)
+
+
+if __name__ == "__main__":
+    migrate()
+    print("Schema is up to date")
@@ -1,4 +1,4 @@
-from sqlalchemy import Column, Integer, String, Float, DateTime, ForeignKey, Boolean
+from sqlalchemy import Column, Integer, String, Float, Date, DateTime, ForeignKey, Boolean, Text, Index
 from sqlalchemy.orm import relationship
 from datetime import datetime
 from .database import Base
@@ -29,9 +29,19 @@ class Product(Base):
     stock = Column(Integer, default=0)
     image_url = Column(String(500), nullable=True)
     created_at = Column(DateTime, default=datetime.utcnow)
+    # bumped on every ORM update; drives ETag / Last-Modified for catalog reads
+    updated_at = Column(DateTime, default=datetime.utcnow, onupdate=datetime.utcnow, index=True)
 
     order_items = relationship("OrderItem", back_populates="product")
 
+    # one index per supported listing filter/sort (crud.list_products); stock > 0 is a residual filter
+    __table_args__ = (
+        Index("ix_products_category_price", "category", "price", "id"),
+        Index("ix_products_category_created", "category", "created_at", "id"),
+        Index("ix_products_price", "price", "id"),
+        Index("ix_products_created", "created_at", "id"),
+    )
+
 
 class CartItem(Base):
     __tablename__ = "cart_items"
@@ -49,8 +59,9 @@ class WishlistItem(Base):
     __tablename__ = "wishlist_items"
 
     id = Column(Integer, primary_key=True, index=True)
-    user_id = Column(Integer, ForeignKey("users.id"))
-    product_id = Column(Integer, ForeignKey("products.id"))
+    user_id = Column(Integer, ForeignKey("users.id"), index=True)
+    # changed product ids -> wishlist users, for notifications
+    product_id = Column(Integer, ForeignKey("products.id"), index=True)
 
     user = relationship("User", back_populates="wishlist_items")
     product = relationship("Product")
@@ -60,9 +71,15 @@ class Order(Base):
     __tablename__ = "orders"
 
     id = Column(Integer, primary_key=True, index=True)
-    user_id = Column(Integer, ForeignKey("users.id"))
+    user_id = Column(Integer, ForeignKey("users.id"), index=True)
     total_amount = Column(Float, nullable=False)
-    created_at = Column(DateTime, default=datetime.utcnow)
+    created_at = Column(DateTime, default=datetime.utcnow, index=True)
+    # set once the order's items are folded into the sales rollups (app/rollups.py)
+    rolled_up = Column(Boolean, default=False, nullable=False, index=True)
+    # set once the order is counted into the co-purchase pairs (app/recommendations.py)
+    recs_indexed = Column(Boolean, default=False, nullable=False, index=True)
+    # the store whose stock the order was taken from; None for the online catalog stock
+    store_id = Column(Integer, nullable=True)
 
     user = relationship("User", back_populates="orders")
     items = relationship("OrderItem", back_populates="order", cascade="all, delete-orphan")
@@ -72,7 +89,7 @@ class OrderItem(Base):
     __tablename__ = "order_items"
 
     id = Column(Integer, primary_key=True, index=True)
-    order_id = Column(Integer, ForeignKey("orders.id"))
+    order_id = Column(Integer, ForeignKey("orders.id"), index=True)
     product_id = Column(Integer, ForeignKey("products.id"))
     quantity = Column(Integer, nullable=False)
     price_at_purchase = Column(Float, nullable=False)
@@ -92,3 +109,197 @@ class PromoCode(Base):
     expires_at = Column(DateTime, nullable=False)
     min_order_amount = Column(Float, default=0)
     active = Column(Boolean, default=True)
+
+
+class Job(Base):
+    """Background job; see app/jobs.py. Finished jobs are deleted, dead ones kept."""
+    __tablename__ = "jobs"
+
+    id = Column(Integer, primary_key=True, index=True)
+    kind = Column(String(100), nullable=False)
+    payload = Column(Text, nullable=False, default="{}")  # JSON
+    status = Column(String(20), nullable=False, default="queued")  # queued | running | dead
+    attempts = Column(Integer, nullable=False, default=0)
+    max_attempts = Column(Integer, nullable=False, default=5)
+    run_at = Column(DateTime, nullable=False, default=datetime.utcnow)
+    locked_by = Column(String(200), nullable=True)
+    locked_at = Column(DateTime, nullable=True)
+    last_error = Column(Text, nullable=True)
+    created_at = Column(DateTime, default=datetime.utcnow)
+
+    __table_args__ = (Index("ix_jobs_status_run_at", "status", "run_at"),)
+
+
+# ---------- Order archive (maintained by app/archive.py) ----------
+
+class OrderArchive(Base):
+    """Orders moved out of `orders` by app/archive.py; monthly partitions on Postgres."""
+    __tablename__ = "orders_archive"
+
+    id = Column(Integer, primary_key=True, autoincrement=False)
+    created_at = Column(DateTime, primary_key=True)  # partition key must be in the PK
+    user_id = Column(Integer, nullable=True)
+    total_amount = Column(Float, nullable=False)
+    store_id = Column(Integer, nullable=True)
+
+    items = relationship(
+        "OrderItemArchive", primaryjoin="OrderArchive.id == foreign(OrderItemArchive.order_id)", viewonly=True
+    )
+
+    __table_args__ = (
+        Index("ix_orders_archive_user_created", "user_id", "created_at"),
+        {"postgresql_partition_by": "RANGE (created_at)"},
+    )
+
+
+class OrderItemArchive(Base):
+    """Items of archived orders, with the order's created_at copied in for partitioning."""
+    __tablename__ = "order_items_archive"
+
+    id = Column(Integer, primary_key=True, autoincrement=False)
+    created_at = Column(DateTime, primary_key=True)
+    order_id = Column(Integer, nullable=False)
+    product_id = Column(Integer, nullable=True)
+    quantity = Column(Integer, nullable=False)
+    price_at_purchase = Column(Float, nullable=False)
+
+    __table_args__ = (
+        Index("ix_order_items_archive_order", "order_id"),
+        {"postgresql_partition_by": "RANGE (created_at)"},
+    )
+
+
+# ---------- Sales rollups (maintained by app/rollups.py) ----------
+
+class SalesDailyProduct(Base):
+    __tablename__ = "sales_daily_product"
+
+    day = Column(Date, primary_key=True)
+    product_id = Column(Integer, primary_key=True)
+    category = Column(String(100), nullable=False, default="")
+    units = Column(Integer, nullable=False, default=0)
+    revenue = Column(Float, nullable=False, default=0)
+
+    __table_args__ = (Index("ix_sales_daily_product_product_day", "product_id", "day"),)
+
+
+class SalesDailyCategory(Base):
+    __tablename__ = "sales_daily_category"
+
+    day = Column(Date, primary_key=True)
+    category = Column(String(100), primary_key=True)  # "" for uncategorized products
+    units = Column(Integer, nullable=False, default=0)
+    revenue = Column(Float, nullable=False, default=0)
+
+
+class ProductOrderCount(Base):
+    """Number of orders containing each product; also the listing's `sort=order_count`."""
+    __tablename__ = "product_order_counts"
+
+    product_id = Column(Integer, primary_key=True)
+    orders = Column(Integer, nullable=False, default=0)
+
+    __table_args__ = (Index("ix_product_order_counts_orders", "orders", "product_id"),)
+
+
+class ProductPairCount(Base):
+    """Sparse co-occurrence matrix: orders containing both products, product_a < product_b."""
+    __tablename__ = "product_pair_counts"
+
+    product_a = Column(Integer, primary_key=True)
+    product_b = Column(Integer, primary_key=True)
+    orders = Column(Integer, nullable=False, default=0)
+
+    __table_args__ = (Index("ix_product_pair_counts_b", "product_b"),)
+
+
+class RelatedProduct(Base):
+    """Precomputed top-K neighbors per product, rank 1 = best."""
+    __tablename__ = "related_products"
+
+    product_id = Column(Integer, primary_key=True)
+    rank = Column(Integer, primary_key=True)
+    related_id = Column(Integer, nullable=False)
+    score = Column(Float, nullable=False)
+
+
+class Notification(Base):
+    """A batch of wishlist alerts for one user; `items` is a JSON list."""
+    __tablename__ = "notifications"
+
+    id = Column(Integer, primary_key=True, index=True)
+    user_id = Column(Integer, ForeignKey("users.id"), nullable=False)
+    message = Column(String(255), nullable=False)
+    items = Column(Text, nullable=False)
+    created_at = Column(DateTime, default=datetime.utcnow)
+    read_at = Column(DateTime, nullable=True)
+
+    __table_args__ = (Index("ix_notifications_user_created", "user_id", "created_at"),)
+
+
+class NotificationLog(Base):
+    """When a user was last told about a product, per kind: the dedup window."""
+    __tablename__ = "notification_log"
+
+    user_id = Column(Integer, primary_key=True)
+    product_id = Column(Integer, primary_key=True)
+    kind = Column(String(20), primary_key=True)
+    last_sent_at = Column(DateTime, nullable=False)
+
+
+class StockMovement(Base):
+    """Append-only stock ledger: one signed change per product per flush (see ledger.py).
+
+    `store_id` is set for a store's stock (`store_stock`) and NULL for the catalog's.
+    """
+    __tablename__ = "stock_movements"
+
+    id = Column(Integer, primary_key=True)
+    product_id = Column(Integer, nullable=False)
+    kind = Column(String(20), nullable=False)
+    quantity = Column(Integer, nullable=False)
+    order_id = Column(Integer, nullable=True)
+    store_id = Column(Integer, nullable=True)
+    created_at = Column(DateTime, nullable=False, default=datetime.utcnow)
+
+    __table_args__ = (
+        Index("ix_stock_movements_product_id", "product_id", "id"),
+        Index("ix_stock_movements_product_created", "product_id", "created_at"),
+        Index("ix_stock_movements_store_product", "store_id", "product_id", "id"),
+    )
+
+
+class StockSnapshot(Base):
+    """A product's stock after ledger entry `movement_id`, which was written at `as_of`."""
+    __tablename__ = "stock_snapshots"
+
+    product_id = Column(Integer, primary_key=True)
+    movement_id = Column(Integer, primary_key=True)
+    stock = Column(Integer, nullable=False)
+    as_of = Column(DateTime, nullable=False)
+
+    __table_args__ = (Index("ix_stock_snapshots_product_as_of", "product_id", "as_of"),)
+
+
+class Store(Base):
+    __tablename__ = "stores"
+
+    id = Column(Integer, primary_key=True, index=True)
+    name = Column(String(255), nullable=False)
+    created_at = Column(DateTime, default=datetime.utcnow)
+
+
+class StoreStock(Base):
+    """Per-store stock (see stores.py).
+
+    Keys lead with store_id and there are no foreign keys, so one store's rows
+    can live in their own database.
+    """
+    __tablename__ = "store_stock"
+
+    store_id = Column(Integer, primary_key=True)
+    product_id = Column(Integer, primary_key=True)
+    stock = Column(Integer, nullable=False, default=0)
+    updated_at = Column(DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
+
+    __table_args__ = (Index("ix_store_stock_store_stock", "store_id", "stock", "product_id"),)
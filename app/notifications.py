@@ -0,0 +1,116 @@
+"""
+Wishlist notifications: back in stock and price drops.
+
+`update_product` and the bulk stock update enqueue `product.updated` jobs that
+carry `{field: [old, new]}`. The job handler passes each batch here:
+
+1. Changes are coalesced per product across the batch: first old value,
+   last new value. Stock that goes 0 -> 5 -> 0 within one batch notifies
+   nobody.
+2. For each kind, one join from the changed product ids to
+   `wishlist_items` (indexed on product_id) finds the users. It skips pairs
+   already notified within `NOTIFY_DEDUP_SECONDS` (`notification_log`) and
+   products whose current state no longer qualifies.
+3. Each user gets one `notifications` row per batch listing all their items,
+   and the dedup log is updated in the same transaction.
+
+No step scans users or wishlists that aren't affected.
+"""
+import json
+import os
+from datetime import datetime, timedelta
+
+from sqlalchemy import and_, or_
+
+from . import models
+from .database import upsert
+
+DEDUP_SECONDS = float(os.getenv("NOTIFY_DEDUP_SECONDS", 24 * 3600))
+BACK_IN_STOCK = "back_in_stock"
+PRICE_DROP = "price_drop"
+
+
+def coalesce(payloads) -> dict:
+    """product_id -> {field: [first old, last new]} over `product.updated` payloads, oldest first."""
+    merged = {}
+    for p in payloads:
+        fields = merged.setdefault(p["product_id"], {})
+        for field, (old, new) in p.get("changes", {}).items():
+            fields[field] = [fields[field][0] if field in fields else old, new]
+    return merged
+
+
+def triggers(changes: dict) -> dict:
+    """kind -> {product_id: old value} for changes users should hear about."""
+    found = {BACK_IN_STOCK: {}, PRICE_DROP: {}}
+    for product_id, fields in changes.items():
+        if "stock" in fields:
+            old, new = fields["stock"]
+            if (old or 0) <= 0 < (new or 0):
+                found[BACK_IN_STOCK][product_id] = old
+        if "price" in fields:
+            old, new = fields["price"]
+            if old is not None and new is not None and new < old:
+                found[PRICE_DROP][product_id] = old
+    return found
+
+
+def _recipients(db, kind: str, product_ids, cutoff):
+    W, P, L = models.WishlistItem, models.Product, models.NotificationLog
+    q = (
+        db.query(W.user_id, P.id, P.name, P.price, P.stock)
+        .join(P, P.id == W.product_id)
+        .outerjoin(L, and_(L.user_id == W.user_id, L.product_id == W.product_id, L.kind == kind))
+        .filter(W.product_id.in_(product_ids), or_(L.last_sent_at.is_(None), L.last_sent_at < cutoff))
+    )
+    if kind == BACK_IN_STOCK:
+        q = q.filter(P.stock > 0)
+    return q.all()
+
+
+def _message(items) -> str:
+    counts = {}
+    for item in items:
+        counts[item["kind"]] = counts.get(item["kind"], 0) + 1
+    parts = []
+    if counts.get(BACK_IN_STOCK):
+        parts.append(f"{counts[BACK_IN_STOCK]} back in stock")
+    if counts.get(PRICE_DROP):
+        parts.append(f"{counts[PRICE_DROP]} cheaper")
+    noun = "item" if len(items) == 1 else "items"
+    return f"{len(items)} {noun} on your wishlist: " + ", ".join(parts)
+
+
+def notify(db, payloads, now: datetime = None) -> int:
+    """Turn a batch of `product.updated` payloads into per-user notifications. Caller commits.
+
+    Returns the number of notifications created.
+    """
+    now = now or datetime.utcnow()
+    cutoff = now - timedelta(seconds=DEDUP_SECONDS)
+    per_user = {}
+    for kind, olds in triggers(coalesce(payloads)).items():
+        if not olds:
+            continue
+        for user_id, product_id, name, price, stock in _recipients(db, kind, list(olds), cutoff):
+            item = {"kind": kind, "product_id": product_id, "name": name, "price": price, "stock": stock}
+            if kind == PRICE_DROP:
+                if price >= olds[product_id]:  # raised again since
+                    continue
+                item["old_price"] = olds[product_id]
+            per_user.setdefault(user_id, []).append(item)
+
+    if not per_user:
+        return 0
+    db.execute(
+        models.Notification.__table__.insert(),
+        [{"user_id": user_id, "message": _message(items), "items": json.dumps(items), "created_at": now}
+         for user_id, items in per_user.items()],
+    )
+    upsert(
+        db, models.NotificationLog.__table__,
+        [{"user_id": user_id, "product_id": item["product_id"], "kind": item["kind"], "last_sent_at": now}
+         for user_id, items in per_user.items() for item in items],
+        keys=["user_id", "product_id", "kind"], replace=["last_sent_at"],
+    )
+    return len(per_user)
@@ -0,0 +1,345 @@
+"""
+On-demand sampling profiler for chosen routes (`/admin/profile`).
+
+Nothing runs until a manager starts a session. A session names routes by
+method and path template, as in the `/metrics` labels (`GET /products/`, or
+just the path for every method). It picks `sample_rate` of the requests to
+them and ends by itself after `seconds`, capped at `PROFILE_MAX_SECONDS`.
+The session is a small JSON file in `PROFILE_DIR`. Every gunicorn worker on
+the host checks it at most once a second, so one request starts profiling
+everywhere.
+
+While a picked request is in flight, a thread in its worker reads
+`sys._current_frames()` every `PROFILE_INTERVAL_MS` and keeps the stacks of
+the threads doing that request's work:
+
+- the event loop thread, while it is inside the request's coroutine
+  (async routes, middleware, response serialization);
+- a threadpool thread running the request's sync code (sync routes and
+  dependencies, response validation). The request marks the context it
+  hands to the threadpool, and that marker identifies the thread.
+
+Nothing is traced, so requests that aren't picked cost one dict lookup.
+
+Samples are counted per distinct stack, rooted at the route, in the
+collapsed format that flamegraph.pl, inferno and speedscope read. Each
+worker keeps at most `PROFILE_MAX_STACKS` distinct stacks. After that, new
+stacks are counted under `[truncated]`. Workers write their counts next to
+the session file every few seconds and when the session ends. The download
+adds them up.
+"""
+import asyncio
+import contextvars
+import glob
+import json
+import logging
+import os
+import queue
+import random
+import sys
+import tempfile
+import threading
+import time
+import uuid
+
+from starlette.routing import Match
+
+from .metrics import Counter
+
+try:  # the threadpool's worker loop; its frame holds the context of the call it's running
+    from anyio._backends._asyncio import WorkerThread
+    _WORKER_CODE = WorkerThread.run.__code__
+except (ImportError, AttributeError):  # only event loop stacks are attributed then
+    _WORKER_CODE = None
+# what the worker does between calls, while the finished call's context is still in its frame
+_WORKER_BOOKKEEPING = {asyncio.BaseEventLoop.call_soon_threadsafe.__code__, queue.Queue.task_done.__code__}
+
+logger = logging.getLogger(__name__)
+
+DIRECTORY = os.getenv("PROFILE_DIR", "/tmp/grocery-profiles")
+INTERVAL = float(os.getenv("PROFILE_INTERVAL_MS", 10)) / 1000
+MAX_STACKS = int(os.getenv("PROFILE_MAX_STACKS", 20_000))
+MAX_SECONDS = int(os.getenv("PROFILE_MAX_SECONDS", 900))
+MAX_DEPTH = 128
+CHECK_INTERVAL = 1.0
+FLUSH_INTERVAL = 5.0
+TRUNCATED = "[truncated]"
+
+PROFILED_REQUESTS = Counter("profiled_requests_total", "Requests picked for profiling", ("route",))
+
+# route key of the picked request this context belongs to; copied into threadpool calls
+_ROUTE = contextvars.ContextVar("profiled_route", default=None)
+
+_ROOTS = sorted({os.path.join(os.path.abspath(p), "") for p in sys.path if p}, key=len, reverse=True)
+_labels = {}
+
+
+def _label(code) -> str:
+    label = _labels.get(code)
+    if label is None:
+        path = code.co_filename
+        for root in _ROOTS:
+            if path.startswith(root):
+                path = path[len(root):]
+                break
+        label = _labels[code] = f"{code.co_qualname} ({path}:{code.co_firstlineno})"
+    return label
+
+
+def _session_path(directory: str) -> str:
+    return os.path.join(directory, "session.json")
+
+
+def _write_atomic(path: str, data: str):
+    directory = os.path.dirname(path)
+    fd, tmp = tempfile.mkstemp(prefix=".profile-", dir=directory)
+    try:
+        with os.fdopen(fd, "w") as f:
+            f.write(data)
+        os.replace(tmp, path)
+    except BaseException:
+        if os.path.exists(tmp):
+            os.unlink(tmp)
+        raise
+
+
+# ---------- routes ----------
+
+def route_keys(route) -> set:
+    return {f"{method} {route.path}" for method in getattr(route, "methods", None) or ()}
+
+
+def resolve(routes, specs):
+    """([(route, keys to profile)], specs matching no route) for `GET /path` or bare `/path` specs."""
+    wanted, unknown = set(), []
+    available = set().union(*(route_keys(r) for r in routes))
+    for spec in specs:
+        method, _, path = spec.strip().rpartition(" ")
+        if method:
+            found = {f"{method.upper()} {path}"} & available
+        else:
+            found = {key for key in available if key.split(" ", 1)[1] == path}
+        if not found:
+            unknown.append(spec)
+        wanted |= found
+    targets = [(route, route_keys(route) & wanted) for route in routes]
+    return [(route, keys) for route, keys in targets if keys], unknown
+
+
+# ---------- sessions (shared by every worker through PROFILE_DIR) ----------
+
+def start(routes, sample_rate: float, seconds: int, directory: str = DIRECTORY) -> dict:
+    """Start a session for `routes` (already resolved keys); replaces any earlier one and its stacks."""
+    os.makedirs(directory, exist_ok=True)
+    now = time.time()
+    session = {
+        "id": uuid.uuid4().hex[:12],
+        "routes": sorted(routes),
+        "sample_rate": sample_rate,
+        "started_at": now,
+        "expires_at": now + min(seconds, MAX_SECONDS),
+    }
+    for path in glob.glob(os.path.join(directory, "*.collapsed")):
+        os.unlink(path)
+    _write_atomic(_session_path(directory), json.dumps(session))
+    return session
+
+
+def stop(directory: str = DIRECTORY):
+    """End the current session now; workers write their final counts within a second or two."""
+    session = read_session(directory)
+    if session is not None and session["expires_at"] > time.time():
+        session["expires_at"] = time.time()
+        _write_atomic(_session_path(directory), json.dumps(session))
+    return session
+
+
+def read_session(directory: str = DIRECTORY):
+    try:
+        with open(_session_path(directory)) as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return None
+
+
+def collapsed(session_id: str, directory: str = DIRECTORY) -> dict:
+    """{stack: samples} summed over every worker's file for `session_id`."""
+    totals = {}
+    for path in glob.glob(os.path.join(directory, f"{session_id}.*.collapsed")):
+        with open(path) as f:
+            for line in f:
+                stack, _, count = line.rstrip("\n").rpartition(" ")
+                if stack:
+                    totals[stack] = totals.get(stack, 0) + int(count)
+    return totals
+
+
+def workers(session_id: str, directory: str = DIRECTORY) -> int:
+    return len(glob.glob(os.path.join(directory, f"{session_id}.*.collapsed")))
+
+
+# ---------- sampling in this worker ----------
+
+class Profiler:
+    def __init__(self, directory: str = DIRECTORY, interval: float = INTERVAL, max_stacks: int = MAX_STACKS):
+        self.directory = directory
+        self.interval = interval
+        self.max_stacks = max_stacks
+        self.session = None
+        self.active = {}  # middleware frame of each picked request in flight -> route key
+        self.counts = {}
+        self._lock = threading.Lock()
+        self._checked = 0.0
+        self._mtime = None
+        self._thread = None
+
+    def current(self):
+        """The running session, re-read from disk at most every CHECK_INTERVAL seconds."""
+        now = time.monotonic()
+        if now - self._checked >= CHECK_INTERVAL:
+            with self._lock:
+                if now - self._checked >= CHECK_INTERVAL:
+                    self._checked = now
+                    self._reload()
+        session = self.session
+        if session is None or session["expires_at"] <= time.time():
+            return None
+        return session
+
+    def _reload(self):
+        try:
+            mtime = os.stat(_session_path(self.directory)).st_mtime_ns
+        except OSError:
+            mtime = None
+        if mtime == self._mtime:
+            return
+        self._mtime = mtime
+        session = read_session(self.directory) if mtime else None
+        if session is not None and self.session is not None and session["id"] == self.session["id"]:
+            self.session = session  # stopped early
+            return
+        if self.session is not None:
+            self._flush()
+        self.session, self.counts = session, {}
+        if session is not None and session["expires_at"] > time.time() and self._thread is None:
+            self._thread = threading.Thread(target=self._run, name="profiler", daemon=True)
+            self._thread.start()
+
+    def _finished(self) -> bool:
+        with self._lock:
+            if self.session is not None and self.session["expires_at"] > time.time():
+                return False  # a new session arrived while we were winding down
+            self._flush()
+            self._thread = None
+            return True
+
+    def refresh(self):
+        """Re-read the session file on the next check, e.g. right after this worker changed it."""
+        self._checked = 0.0
+
+    def begin(self, frame, key: str):
+        self.active[frame] = key
+
+    def end(self, frame):
+        self.active.pop(frame, None)
+
+    def _run(self):
+        flushed = time.monotonic()
+        while self.current() is not None or not self._finished():
+            time.sleep(self.interval)
+            try:
+                if self.active:
+                    self._sample()
+                if time.monotonic() - flushed >= FLUSH_INTERVAL:
+                    self._flush()
+                    flushed = time.monotonic()
+            except Exception:
+                logger.exception("profiler sample failed")
+
+    def _sample(self):
+        active = dict(self.active)
+        me = threading.get_ident()
+        for thread_id, frame in sys._current_frames().items():
+            if thread_id == me:
+                continue
+            stack, key, where = [], None, "threadpool"
+            while frame is not None:
+                code = frame.f_code
+                if frame in active:
+                    key, where = active[frame], "event loop"
+                    break
+                if code is _WORKER_CODE:
+                    context = frame.f_locals.get("context")
+                    if isinstance(context, contextvars.Context) and stack and stack[-1] not in _WORKER_BOOKKEEPING:
+                        key = context.get(_ROUTE)
+                    break
+                stack.append(code)
+                frame = frame.f_back
+            if key is not None and stack:
+                self._count(key, where, stack)
+
+    def _count(self, key: str, where: str, stack):
+        frames = [_label(code) for code in reversed(stack[-MAX_DEPTH:])]
+        line = ";".join((key, f"[{where}]", *frames))
+        if line not in self.counts and len(self.counts) >= self.max_stacks:
+            line = f"{key};{TRUNCATED}"
+        self.counts[line] = self.counts.get(line, 0) + 1
+
+    def _flush(self):
+        session, counts = self.session, dict(self.counts)
+        if session is None or not counts:
+            return
+        path = os.path.join(self.directory, f"{session['id']}.{os.getpid()}.collapsed")
+        try:
+            _write_atomic(path, "".join(f"{stack} {n}\n" for stack, n in sorted(counts.items())))
+        except OSError:
+            logger.exception("could not write profile %s", path)
+
+    def shutdown(self):
+        """Write this worker's counts before it exits."""
+        self._flush()
+
+
+profiler = Profiler()
+
+
+class ProfilingMiddleware:
+    """Pure ASGI; picks requests to the session's routes and registers them with the profiler."""
+
+    def __init__(self, app, routes=(), profiler: Profiler = profiler):
+        self.app = app
+        self.routes = routes
+        self.profiler = profiler
+        self._targets = (None, {})
+
+    def _pick(self, scope):
+        session = self.profiler.current()
+        if session is None:
+            return None
+        if self._targets[0] != session["id"]:
+            targets = resolve(self.routes, session["routes"])[0]
+            self._targets = (session["id"], {id(route): keys for route, keys in targets})
+        # first full match, as the router does, so /products/facets isn't taken for /products/{product_id}
+        for route in self.routes:
+            match, _ = route.matches(scope)
+            if match == Match.FULL:
+                key = f"{scope['method']} {route.path}"
+                if key in self._targets[1].get(id(route), ()) and random.random() < session["sample_rate"]:
+                    return key
+                return None
+        return None
+
+    async def __call__(self, scope, receive, send):
+        key = self._pick(scope) if scope["type"] == "http" else None
+        if key is None:
+            await self.app(scope, receive, send)
+            return
+        PROFILED_REQUESTS.inc(key)
+        frame = sys._getframe()
+        token = _ROUTE.set(key)
+        self.profiler.begin(frame, key)
+        try:
+            await self.app(scope, receive, send)
+        finally:
+            self.profiler.end(frame)
+            _ROUTE.reset(token)
@@ -0,0 +1,147 @@
+"""
+Token-bucket rate limiting for expensive or abusable routes.
+
+    @router.post("/token", dependencies=[Depends(ratelimit.limit("auth.token"))])
+
+Each route has a budget of `N/seconds`: bursts of up to N requests, refilled
+at N per `seconds`. Buckets are kept per client IP and, where known, per
+account: the bearer token's user id, or the username being logged in as. An
+attacker rotating IPs against one account is limited too. Over budget is
+`429 Too Many Requests` with `Retry-After`.
+
+Buckets live in a per-process LRU map (`RATE_LIMIT_MAX_KEYS`). A bucket idle
+long enough to refill completely is the same as no bucket, so it is evicted.
+With several workers each has its own map, which makes the effective limit
+up to `WEB_CONCURRENCY` times the budget.
+"""
+import math
+import os
+import threading
+import time
+from collections import OrderedDict
+
+from fastapi import HTTPException, Request
+from jose import jwt
+
+from .auth import ALGORITHM, SECRET_KEY
+from .metrics import Counter
+
+ENABLED = os.getenv("RATE_LIMIT_ENABLED", "1") == "1"
+MAX_KEYS = int(os.getenv("RATE_LIMIT_MAX_KEYS", 100_000))
+# Proxies in front of the app (1 on Render). The client address is the hop the
+# outermost of them appended to X-Forwarded-For; anything left of it is client-supplied.
+PROXY_HOPS = int(os.getenv("RATE_LIMIT_PROXY_HOPS", 0))
+
+RATE_LIMITED = Counter("rate_limited_total", "Requests rejected by rate limits", ("route", "key"))
+
+
+def _budget(env: str, default: str):
+    """'N/seconds' -> (burst, tokens per second)."""
+    count, _, seconds = os.getenv(env, default).partition("/")
+    return int(count), int(count) / float(seconds or 1)
+
+
+BUDGETS = {
+    "auth.token": _budget("RATE_LIMIT_AUTH_TOKEN", "10/60"),
+    "auth.register": _budget("RATE_LIMIT_AUTH_REGISTER", "5/300"),
+    "promocodes.apply": _budget("RATE_LIMIT_PROMO_APPLY", "30/60"),
+}
+
+
+class BucketStore:
+    """key -> [tokens, last refill, seconds to refill completely], least recently used first."""
+
+    def __init__(self, max_keys: int = MAX_KEYS):
+        self.max_keys = max_keys
+        self._buckets = OrderedDict()
+        self._lock = threading.Lock()
+
+    def __len__(self):
+        return len(self._buckets)
+
+    def take(self, keys, burst: int, rate: float, now: float = None):
+        """Spend one token from each of `keys`, or from none of them.
+
+        Returns (0, None) if allowed, else (seconds until a token is available,
+        the first key that is out of tokens).
+        """
+        now = time.monotonic() if now is None else now
+        with self._lock:
+            buckets = [self._refill(key, burst, rate, now) for key in keys]
+            self._evict(now)
+            for key, bucket in zip(keys, buckets):
+                if bucket[0] < 1:
+                    return (1 - bucket[0]) / rate, key
+            for bucket in buckets:
+                bucket[0] -= 1
+            return 0.0, None
+
+    def _refill(self, key: str, burst: int, rate: float, now: float):
+        bucket = self._buckets.get(key)
+        if bucket is None:
+            bucket = self._buckets[key] = [float(burst), now, burst / rate]
+        else:
+            bucket[0] = min(burst, bucket[0] + (now - bucket[1]) * rate)
+            bucket[1] = now
+            self._buckets.move_to_end(key)
+        return bucket
+
+    def _evict(self, now: float):
+        buckets = self._buckets
+        while buckets:
+            _, last, full_after = next(iter(buckets.values()))
+            if len(buckets) <= self.max_keys and now - last < full_after:
+                break
+            buckets.popitem(last=False)
+
+
+store = BucketStore()
+
+
+def client_ip(request: Request) -> str:
+    if PROXY_HOPS:
+        hops = [h.strip() for h in request.headers.get("x-forwarded-for", "").split(",") if h.strip()]
+        if len(hops) >= PROXY_HOPS:
+            return hops[-PROXY_HOPS]
+    return request.client.host if request.client else "unknown"
+
+
+def _account(request: Request, form) -> str:
+    auth = request.headers.get("authorization", "")
+    if auth.lower().startswith("bearer "):
+        try:
+            user_id = jwt.decode(auth[7:], SECRET_KEY, algorithms=[ALGORITHM]).get("user_id")
+            if user_id is not None:
+                return f"user:{user_id}"
+        except Exception:
+            pass
+    if form is not None and form.get("username"):
+        return f"login:{str(form.get('username')).lower()}"
+    return None
+
+
+def limit(route: str):
+    """Dependency enforcing the `route` budget per client IP and per account."""
+    burst, rate = BUDGETS[route]
+
+    async def dependency(request: Request):
+        if not ENABLED:
+            return
+        form = None
+        if request.headers.get("content-type", "").startswith("application/x-www-form-urlencoded"):
+            form = await request.form()  # cached on the request, the endpoint reuses it
+        keys = {f"{route}|{client_ip(request)}": "ip"}
+        account = _account(request, form)
+        if account:
+            keys[f"{route}|{account}"] = "account"
+        # a request one bucket rejects spends nothing from the others
+        wait, blocked = store.take(list(keys), burst, rate)
+        if wait:
+            RATE_LIMITED.inc(route, keys[blocked])
+            raise HTTPException(
+                status_code=429,
+                detail="Too many requests",
+                headers={"Retry-After": str(math.ceil(wait))},
+            )
+
+    return dependency
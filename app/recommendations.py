@@ -0,0 +1,228 @@
+"""
+"Frequently bought together" from order co-occurrence.
+
+The sparse co-occurrence matrix lives in `product_pair_counts`: how many
+orders contain both products, stored once per pair with product_a < product_b.
+`product_order_counts` has the per-product totals. Neighbors are scored by
+
+    cosine = pair / sqrt(orders_a * orders_b)      (RECS_SCORE=cosine, default)
+    lift   = pair * total_orders / (orders_a * orders_b)   (RECS_SCORE=lift)
+
+and the best `RECS_TOP_K` per product are written to `related_products`.
+`GET /products/{id}/related` then reads a few rows by primary key.
+
+`refresh` runs from the `order.placed` job. It claims each order exactly once
+through `orders.recs_indexed` and counts its pairs with a self-join on
+`order_items`. It then re-ranks the products in those orders. Lists of
+products that weren't in new orders drift slowly as their neighbors' totals
+grow; a periodic
+
+    python -m app.recommendations --rerank
+
+refreshes every list, and `--rebuild` recounts from scratch.
+"""
+import argparse
+import math
+import os
+
+from sqlalchemy import delete, func, select, union_all, update
+from sqlalchemy.orm import aliased
+
+from . import models
+from .database import SessionLocal, upsert
+
+TOP_K = int(os.getenv("RECS_TOP_K", 10))
+SCORE = os.getenv("RECS_SCORE", "cosine")
+MIN_PAIR_ORDERS = int(os.getenv("RECS_MIN_PAIR_ORDERS", 2))
+BATCH_SIZE = int(os.getenv("RECS_BATCH_SIZE", 5000))
+
+
+def refresh(db, order_ids=None, batch_size: int = BATCH_SIZE, rerank_products: bool = True) -> int:
+    """Count pending orders into the co-occurrence matrix. Caller commits.
+
+    Returns the number of orders counted, 0 once caught up.
+    """
+    Order, OI = models.Order, models.OrderItem
+    pending = select(Order.id).where(Order.recs_indexed == False)  # noqa: E712
+    if order_ids is not None:
+        pending = pending.where(Order.id.in_(order_ids))
+    else:
+        pending = pending.order_by(Order.id).limit(batch_size)
+    ids = db.execute(pending).scalars().all()
+    if not ids:
+        return 0
+    claimed = db.execute(
+        update(Order).where(Order.id.in_(ids), Order.recs_indexed == False)  # noqa: E712
+        .values(recs_indexed=True).returning(Order.id)
+    ).scalars().all()
+    if not claimed:
+        return 0
+
+    singles = _count(db, OI, claimed)
+    if rerank_products:
+        rerank(db, [pid for pid, _ in singles])
+    return len(claimed)
+
+
+def _count(db, items, order_ids):
+    """Add the pairs and per-product counts of `order_ids` (rows of `items`) to the matrix.
+
+    Lines of deleted products (`product_id` NULL) are skipped.
+    """
+    a, b = aliased(items), aliased(items)
+    pairs = db.execute(
+        select(a.product_id, b.product_id, func.count(func.distinct(a.order_id)))
+        .join(b, (a.order_id == b.order_id) & (a.product_id < b.product_id))
+        .where(a.order_id.in_(order_ids), a.product_id.isnot(None), b.product_id.isnot(None))
+        .group_by(a.product_id, b.product_id)
+    ).all()
+    singles = db.execute(
+        select(items.product_id, func.count(func.distinct(items.order_id)))
+        .where(items.order_id.in_(order_ids), items.product_id.isnot(None))
+        .group_by(items.product_id)
+    ).all()
+
+    upsert(
+        db, models.ProductPairCount.__table__,
+        [{"product_a": pa, "product_b": pb, "orders": n} for pa, pb, n in pairs],
+        keys=["product_a", "product_b"], add=["orders"],
+    )
+    upsert(
+        db, models.ProductOrderCount.__table__,
+        [{"product_id": pid, "orders": n} for pid, n in singles],
+        keys=["product_id"], add=["orders"],
+    )
+    return singles
+
+
+def _strength(pair, orders_a, orders_b):
+    # same ordering as the final score, without sqrt (not built into SQLite)
+    if SCORE == "lift":
+        return pair * 1.0 / (orders_a * orders_b)
+    return pair * pair * 1.0 / (orders_a * orders_b)
+
+
+def rerank(db, product_ids) -> None:
+    """Recompute the top-K lists of `product_ids` from the pair counts."""
+    if not product_ids:
+        return
+    P, C = models.ProductPairCount, models.ProductOrderCount
+    forward = select(P.product_a.label("product_id"), P.product_b.label("related_id"), P.orders.label("pair")) \
+        .where(P.product_a.in_(product_ids), P.orders >= MIN_PAIR_ORDERS)
+    backward = select(P.product_b, P.product_a, P.orders) \
+        .where(P.product_b.in_(product_ids), P.orders >= MIN_PAIR_ORDERS)
+    edges = union_all(forward, backward).subquery()
+
+    ca, cb = aliased(C), aliased(C)
+    strength = _strength(edges.c.pair, ca.orders, cb.orders)
+    ranked = (
+        select(
+            edges.c.product_id, edges.c.related_id, edges.c.pair, ca.orders.label("orders_a"),
+            cb.orders.label("orders_b"),
+            func.row_number().over(
+                partition_by=edges.c.product_id, order_by=(strength.desc(), edges.c.related_id)
+            ).label("rank"),
+        )
+        .join(ca, ca.product_id == edges.c.product_id)
+        .join(cb, cb.product_id == edges.c.related_id)
+        .subquery()
+    )
+    rows = db.execute(select(ranked).where(ranked.c.rank <= TOP_K)).all()
+
+    total = None
+    if SCORE == "lift":
+        total = (
+            db.query(func.count(models.Order.id)).filter(models.Order.recs_indexed == True).scalar()  # noqa: E712
+            + db.query(func.count(models.OrderArchive.id)).scalar()
+        )
+
+    def score(r):
+        if total is not None:
+            return r.pair * total / (r.orders_a * r.orders_b)
+        return r.pair / math.sqrt(r.orders_a * r.orders_b)
+
+    db.execute(delete(models.RelatedProduct).where(models.RelatedProduct.product_id.in_(product_ids)))
+    if rows:
+        db.execute(
+            models.RelatedProduct.__table__.insert(),
+            [{"product_id": r.product_id, "rank": r.rank, "related_id": r.related_id, "score": round(score(r), 6)}
+             for r in rows],
+        )
+
+
+def related(db, product_id: int, limit: int = TOP_K):
+    """The product's precomputed neighbors as (Product, score), best first."""
+    R = models.RelatedProduct
+    return (
+        db.query(models.Product, R.score)
+        .join(R, R.related_id == models.Product.id)
+        .filter(R.product_id == product_id, R.rank <= limit)
+        .order_by(R.rank)
+        .all()
+    )
+
+
+# ---------- offline ----------
+
+def catch_up(batch_size: int = BATCH_SIZE, rerank_products: bool = True) -> int:
+    total = 0
+    while True:
+        db = SessionLocal()
+        try:
+            counted = refresh(db, batch_size=batch_size, rerank_products=rerank_products)
+            db.commit()
+        finally:
+            db.close()
+        if not counted:
+            return total
+        total += counted
+
+
+def rerank_all(chunk_size: int = 1000) -> int:
+    db = SessionLocal()
+    try:
+        ids = db.execute(select(models.ProductOrderCount.product_id)).scalars().all()
+        for i in range(0, len(ids), chunk_size):
+            rerank(db, ids[i:i + chunk_size])
+            db.commit()
+        return len(ids)
+    finally:
+        db.close()
+
+
+def rebuild(batch_size: int = BATCH_SIZE) -> int:
+    db = SessionLocal()
+    try:
+        for table in (models.RelatedProduct, models.ProductPairCount, models.ProductOrderCount):
+            db.execute(delete(table))
+        db.execute(update(models.Order).values(recs_indexed=False))
+        # archived orders (app/archive.py) were counted once already; count them again from the archive
+        archived = db.execute(select(models.OrderArchive.id).order_by(models.OrderArchive.id)).scalars().all()
+        for i in range(0, len(archived), batch_size):
+            _count(db, models.OrderItemArchive, archived[i:i + batch_size])
+        db.commit()
+    finally:
+        db.close()
+    counted = len(archived) + catch_up(batch_size, rerank_products=False)
+    rerank_all()
+    return counted
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Maintain the frequently-bought-together index.")
+    group = parser.add_mutually_exclusive_group()
+    group.add_argument("--rebuild", action="store_true", help="recount every order from scratch")
+    group.add_argument("--rerank", action="store_true", help="recompute every product's top-K list")
+    parser.add_argument("--batch-size", type=int, default=BATCH_SIZE)
+    args = parser.parse_args(argv)
+
+    if args.rebuild:
+        print(f"counted {rebuild(args.batch_size)} orders")
+    elif args.rerank:
+        print(f"reranked {rerank_all()} products")
+    else:
+        print(f"counted {catch_up(args.batch_size)} new orders")
+
+
+if __name__ == "__main__":
+    main()
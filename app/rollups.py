@@ -0,0 +1,197 @@
+"""
+Daily sales rollups: units and revenue per (day, product) and per (day, category).
+
+`refresh` folds each order's items into the rollup tables exactly once: an
+order is claimed by flipping `orders.rolled_up`, in the same transaction as
+the upserts. It runs from the `order.placed` job and can be caught up or
+backfilled with
+
+    python -m app.rollups
+
+Revenue is gross: quantity * price_at_purchase, before order-level promo
+discounts. Reports over date ranges read only the rollups, so their cost
+depends on days x products sold, not on the number of orders. Lines whose
+product was deleted (`product_id` NULL) are left out of both rollups.
+"""
+import csv
+import io
+import json
+import os
+
+from sqlalchemy import Date, cast, func, select, type_coerce, update
+
+from . import models
+from .database import SessionLocal, engine, upsert
+
+BATCH_SIZE = int(os.getenv("ROLLUP_BATCH_SIZE", 50000))
+GRANULARITIES = ("day", "week", "month")
+GROUPINGS = ("product", "category")
+
+
+def refresh(db, order_ids=None, batch_size: int = BATCH_SIZE) -> int:
+    """Fold orders not yet rolled up into the rollups. Caller commits.
+
+    With `order_ids`, only those orders are considered; otherwise up to
+    `batch_size` of the oldest pending ones. Returns the number of orders
+    folded in, 0 once caught up.
+    """
+    Order, OI = models.Order, models.OrderItem
+    pending = select(Order.id).where(Order.rolled_up == False)  # noqa: E712
+    if order_ids is not None:
+        pending = pending.where(Order.id.in_(order_ids))
+    else:
+        pending = pending.order_by(Order.id).limit(batch_size)
+    ids = db.execute(pending).scalars().all()
+    if not ids:
+        return 0
+
+    # Claim the orders by flipping their flag. A concurrent refresh claiming
+    # the same ids gets them back only if it wins, so nothing is counted twice.
+    claimed = db.execute(
+        update(Order).where(Order.id.in_(ids), Order.rolled_up == False)  # noqa: E712
+        .values(rolled_up=True).returning(Order.id)
+    ).scalars().all()
+    if not claimed:
+        return 0
+
+    day = type_coerce(func.date(Order.created_at), Date)
+    category = func.coalesce(models.Product.category, "")
+    rows = (
+        db.query(
+            day.label("day"),
+            OI.product_id,
+            category.label("category"),
+            func.sum(OI.quantity).label("units"),
+            func.sum(OI.quantity * OI.price_at_purchase).label("revenue"),
+        )
+        .join(Order, Order.id == OI.order_id)
+        .outerjoin(models.Product, models.Product.id == OI.product_id)
+        .filter(OI.order_id.in_(claimed), OI.product_id.isnot(None))  # deleted products have no rollup key
+        .group_by(day, OI.product_id, category)
+        .all()
+    )
+
+    product_rows = [r._asdict() for r in rows]
+    category_rows = {}
+    for r in rows:
+        key = (r.day, r.category)
+        units, revenue = category_rows.get(key, (0, 0.0))
+        category_rows[key] = (units + r.units, revenue + r.revenue)
+
+    upsert(
+        db, models.SalesDailyProduct.__table__, product_rows,
+        keys=["day", "product_id"], add=["units", "revenue"], replace=["category"],
+    )
+    upsert(
+        db, models.SalesDailyCategory.__table__,
+        [{"day": d, "category": c, "units": u, "revenue": rev} for (d, c), (u, rev) in category_rows.items()],
+        keys=["day", "category"], add=["units", "revenue"],
+    )
+    return len(claimed)
+
+
+def catch_up(batch_size: int = BATCH_SIZE) -> int:
+    total = 0
+    while True:
+        db = SessionLocal()
+        try:
+            written = refresh(db, batch_size=batch_size)
+            db.commit()
+        finally:
+            db.close()
+        if not written:
+            return total
+        total += written
+
+
+# ---------- reports ----------
+
+def _bucket(dialect: str, granularity: str, day):
+    if granularity == "day":
+        return day
+    if dialect == "postgresql":
+        return cast(func.date_trunc(granularity, day), Date)
+    if granularity == "week":
+        # Monday of the ISO week
+        return type_coerce(func.date(day, "weekday 0", "-6 days"), Date)
+    return type_coerce(func.date(day, "start of month"), Date)
+
+
+def report_select(dialect: str, start=None, end=None, granularity: str = "day", by: str = "product",
+                  category: str = None, sort: str = "most", limit: int = None):
+    """Units and revenue per period (and per product or category), best sellers first.
+
+    With `limit`, at most `limit` rows are returned per period.
+    """
+    table = (models.SalesDailyProduct if by == "product" else models.SalesDailyCategory).__table__
+    period = _bucket(dialect, granularity, table.c.day).label("period")
+    units = func.sum(table.c.units).label("units")
+    revenue = func.sum(table.c.revenue).label("revenue")
+    order = units.desc() if sort == "most" else units.asc()
+
+    if by == "product":
+        keys = [table.c.product_id, func.max(models.Product.name).label("name"), func.max(table.c.category).label("category")]
+        group = [period, table.c.product_id]
+        source = table.outerjoin(models.Product.__table__, models.Product.id == table.c.product_id)
+    else:
+        keys = [table.c.category]
+        group = [period, table.c.category]
+        source = table
+
+    rank = func.row_number().over(partition_by=period, order_by=order).label("rank")
+    stmt = select(period, *keys, units, revenue, rank).select_from(source).group_by(*group)
+    if start:
+        stmt = stmt.where(table.c.day >= start)
+    if end:
+        stmt = stmt.where(table.c.day <= end)
+    if category is not None:
+        stmt = stmt.where(table.c.category == category)
+
+    ranked = stmt.subquery()
+    out = select(*[c for c in ranked.c if c.name != "rank"])
+    if limit:
+        out = out.where(ranked.c.rank <= limit)
+    return out.order_by(ranked.c.period, ranked.c.rank)
+
+
+def _row_dict(row) -> dict:
+    d = row._asdict()
+    d["period"] = d["period"].isoformat()
+    d["units"] = int(d["units"])
+    d["revenue"] = round(d["revenue"] or 0.0, 2)
+    return d
+
+
+def report(db, **params) -> list:
+    return [_row_dict(r) for r in db.execute(report_select(db.bind.dialect.name, **params))]
+
+
+def stream_report(fmt: str = "csv", chunk_rows: int = 1000, **params):
+    """Yield the full report as CSV or NDJSON chunks from a server-side cursor.
+
+    Uses its own connection, so it can outlive the request's session.
+    """
+    stmt = report_select(engine.dialect.name, **params)
+    with engine.connect() as conn:
+        result = conn.execution_options(stream_results=True, yield_per=chunk_rows).execute(stmt)
+        columns = list(result.keys())
+        if fmt == "csv":
+            buf = io.StringIO()
+            writer = csv.writer(buf)
+            writer.writerow(columns)
+            for rows in result.partitions():
+                for row in rows:
+                    d = _row_dict(row)
+                    writer.writerow([d[c] for c in columns])
+                yield buf.getvalue()
+                buf.seek(0)
+                buf.truncate()
+            if buf.tell():
+                yield buf.getvalue()
+        else:
+            for rows in result.partitions():
+                yield "".join(json.dumps(_row_dict(row)) + "\n" for row in rows)
+
+
+if __name__ == "__main__":
+    print(f"rolled up {catch_up()} orders")
@@ -1,7 +1,7 @@
 from fastapi import APIRouter, Depends, HTTPException, status
 from sqlalchemy.orm import Session
 from fastapi.security import OAuth2PasswordRequestForm, OAuth2PasswordBearer
-from .. import schemas, crud
+from .. import schemas, crud, ratelimit
 from ..database import get_db
 from ..auth import create_access_token, verify_password
 
@@ -9,7 +9,7 @@ router = APIRouter(prefix="/auth",tags=["auth"])
 oauth2_scheme = OAuth2PasswordBearer(tokenUrl="/token")
 
 
-@router.post("/register", response_model=schemas.UserOut)
+@router.post("/register", response_model=schemas.UserOut, dependencies=[Depends(ratelimit.limit("auth.register"))])
 def register(user_in: schemas.UserCreate, db: Session = Depends(get_db)):
     existing = crud.get_user_by_email(db, user_in.email)
     if existing:
@@ -18,7 +18,7 @@ def register(user_in: schemas.UserCreate, db: Session = Depends(get_db)):
     return user
 
 
-@router.post("/token", response_model=schemas.Token)
+@router.post("/token", response_model=schemas.Token, dependencies=[Depends(ratelimit.limit("auth.token"))])
 def login_for_access_token(form_data: OAuth2PasswordRequestForm = Depends(), db: Session = Depends(get_db)):
     user = crud.get_user_by_email(db, form_data.username)
     if not user or not verify_password(form_data.password, user.hashed_password):
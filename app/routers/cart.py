@@ -3,7 +3,7 @@ from typing import List
 from sqlalchemy.orm import Session
 from fastapi.security import OAuth2PasswordBearer
 from jose import jwt
-from .. import schemas, crud
+from .. import schemas, fastjson, cartstore
 from ..database import get_db
 from ..auth import SECRET_KEY, ALGORITHM
 
@@ -23,7 +23,10 @@ def add_to_cart(item: schemas.CartItemCreate, token: str = Depends(oauth2), db:
     payload = get_payload(token)
     if not payload or payload.get("role") != "customer":
         raise HTTPException(status_code=403, detail="Customer required")
-    return crud.add_to_cart(db, payload.get("user_id"), item.product_id, item.quantity)
+    cart_item = cartstore.store.add(db, payload.get("user_id"), item.product_id, item.quantity)
+    if fastjson.ENABLED:
+        return fastjson.respond(fastjson.CART_ITEM, cart_item)
+    return cart_item
 
 
 @router.get("/", response_model=List[schemas.CartItemOut])
@@ -31,15 +34,19 @@ def get_cart(token: str = Depends(oauth2), db: Session = Depends(get_db)):
     payload = get_payload(token)
     if not payload or payload.get("role") != "customer":
         raise HTTPException(status_code=403, detail="Customer required")
-    return crud.get_cart_items(db, payload.get("user_id"))
+    items = cartstore.store.items(db, payload.get("user_id"))
+    if fastjson.ENABLED:
+        return fastjson.respond(fastjson.CART_ITEM_LIST, items)
+    return items
 
 
-@router.delete("/{cart_item_id}")
-def remove_cart(cart_item_id: int, token: str = Depends(oauth2), db: Session = Depends(get_db)):
+@router.delete("/{product_id}")
+def remove_cart(product_id: int, token: str = Depends(oauth2), db: Session = Depends(get_db)):
+    """Remove a product from the caller's cart; the id is the cart line's `id`, i.e. the product id."""
     payload = get_payload(token)
     if not payload or payload.get("role") != "customer":
         raise HTTPException(status_code=403, detail="Customer required")
-    ok = crud.remove_cart_item(db, cart_item_id)
+    ok = cartstore.store.remove(db, payload.get("user_id"), product_id)
     if not ok:
         raise HTTPException(status_code=404, detail="Cart item not found")
     return {"detail": "removed"}
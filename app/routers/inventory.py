@@ -1,7 +1,13 @@
-from fastapi import APIRouter, Depends, HTTPException
+import asyncio
+import json
+import os
+from datetime import datetime
+from typing import List, Optional
+from fastapi import APIRouter, Depends, HTTPException, Query, Request
+from fastapi.responses import StreamingResponse
 from sqlalchemy.orm import Session
 from app.database import get_db
-from app import crud
+from app import crud, events, forecast, ledger, schemas
 from ..auth import SECRET_KEY, ALGORITHM
 from fastapi.security import OAuth2PasswordBearer
 from jose import jwt
@@ -10,6 +16,9 @@ from jose import jwt
 router = APIRouter(prefix="/inventory", tags=["Inventory"])
 oauth2 = OAuth2PasswordBearer(tokenUrl="/token")
 
+# Seconds between keep-alive comments on an idle event stream
+STREAM_HEARTBEAT = float(os.getenv("EVENT_STREAM_HEARTBEAT", 15))
+
 
 @router.get("/low-stock")
 def low_stock_products(
@@ -25,3 +34,170 @@ def low_stock_products(
 
     items = crud.low_stock_products(db, threshold)
     return items
+
+
+@router.put("/stock")
+def bulk_update_stock(
+    updates: List[schemas.StockUpdate],
+    token: str = Depends(oauth2),
+    db: Session = Depends(get_db)
+):
+    """Set stock for many products at once, e.g. after a delivery."""
+    payload = jwt.decode(token, SECRET_KEY, algorithms=[ALGORITHM])
+
+    # Manager check
+    if payload.get("role") != "manager":
+        raise HTTPException(status_code=403, detail="Manager access required")
+
+    stock_by_id = {u.product_id: u.stock for u in updates}
+    missing = crud.bulk_update_stock(db, stock_by_id)
+    return {"updated": len(stock_by_id) - len(missing), "missing": missing}
+
+
+@router.get("/forecast", response_model=List[schemas.ForecastItemOut])
+def reorder_forecast(
+    lead_time_days: float = Query(forecast.LEAD_TIME_DAYS, ge=0),
+    cover_days: float = Query(forecast.COVER_DAYS, ge=0),
+    limit: int = Query(50, ge=1, le=1000),
+    only_reorder: bool = True,
+    token: str = Depends(oauth2),
+    db: Session = Depends(get_db)
+):
+    payload = jwt.decode(token, SECRET_KEY, algorithms=[ALGORITHM])
+
+    # Manager check
+    if payload.get("role") != "manager":
+        raise HTTPException(status_code=403, detail="Manager access required")
+
+    return forecast.forecast(db, lead_time_days, cover_days, limit, only_reorder)
+
+
+@router.get("/movements", response_model=List[schemas.StockMovementOut])
+def stock_movements(
+    product_id: Optional[int] = None,
+    kind: Optional[str] = None,
+    since: Optional[datetime] = None,
+    store_id: Optional[int] = None,
+    limit: int = Query(100, ge=1, le=1000),
+    token: str = Depends(oauth2),
+    db: Session = Depends(get_db)
+):
+    """Stock ledger entries, newest first; the online catalog's unless `store_id` is given."""
+    payload = jwt.decode(token, SECRET_KEY, algorithms=[ALGORITHM])
+
+    # Manager check
+    if payload.get("role") != "manager":
+        raise HTTPException(status_code=403, detail="Manager access required")
+
+    if kind is not None and kind not in ledger.KINDS:
+        raise HTTPException(status_code=400, detail=f"kind must be one of {', '.join(ledger.KINDS)}")
+    return ledger.movements(db, product_id, kind, since, limit, store_id)
+
+
+@router.get("/stock-at", response_model=schemas.StockAtOut)
+def stock_at(
+    product_id: int,
+    at: datetime,
+    token: str = Depends(oauth2),
+    db: Session = Depends(get_db)
+):
+    """A product's stock at a point in time: nearest snapshot plus the movements in between."""
+    payload = jwt.decode(token, SECRET_KEY, algorithms=[ALGORITHM])
+
+    # Manager check
+    if payload.get("role") != "manager":
+        raise HTTPException(status_code=403, detail="Manager access required")
+
+    stock = ledger.stock_at(db, product_id, at.replace(tzinfo=None))
+    if stock is None:
+        raise HTTPException(status_code=404, detail="Product not found")
+    return {"product_id": product_id, "at": at, "stock": stock}
+
+
+@router.get("/reconcile", response_model=List[schemas.StockDriftOut])
+def stock_drift(
+    limit: int = Query(100, ge=1, le=1000),
+    token: str = Depends(oauth2),
+    db: Session = Depends(get_db)
+):
+    """Products whose stock disagrees with the ledger."""
+    payload = jwt.decode(token, SECRET_KEY, algorithms=[ALGORITHM])
+
+    # Manager check
+    if payload.get("role") != "manager":
+        raise HTTPException(status_code=403, detail="Manager access required")
+
+    return [
+        {"product_id": pid, "name": name, "stock": stock, "ledger_stock": expected, "drift": stock - expected}
+        for pid, name, stock, expected in ledger.drift(db, limit)
+    ]
+
+
+@router.post("/reconcile")
+def reconcile_stock(
+    limit: int = Query(1000, ge=1, le=10000),
+    token: str = Depends(oauth2),
+    db: Session = Depends(get_db)
+):
+    """Accept current stock as correct: record an adjustment for each drifted product."""
+    payload = jwt.decode(token, SECRET_KEY, algorithms=[ALGORITHM])
+
+    # Manager check
+    if payload.get("role") != "manager":
+        raise HTTPException(status_code=403, detail="Manager access required")
+
+    corrected = ledger.correct(db, limit)
+    db.commit()
+    return {"corrected": corrected}
+
+
+def _sse(event: str, data: dict) -> str:
+    return f"event: {event}\ndata: {json.dumps(data, default=str)}\n\n"
+
+
+@router.get("/stream")
+async def stock_stream(
+    request: Request,
+    threshold: int = events.LOW_STOCK_THRESHOLD,
+    crossings_only: bool = False,
+    store_id: Optional[int] = None,
+    token: str = Depends(oauth2)
+):
+    """Server-sent events: `stock` for every change, `low_stock` / `restocked` on threshold crossings.
+
+    The catalog's stock by default; one store's with `store_id`.
+    """
+    payload = jwt.decode(token, SECRET_KEY, algorithms=[ALGORITHM])
+
+    # Manager check
+    if payload.get("role") != "manager":
+        raise HTTPException(status_code=403, detail="Manager access required")
+
+    sub = events.broker.subscribe(asyncio.get_running_loop())
+
+    async def stream():
+        try:
+            yield "retry: 3000\n\n"
+            while not await request.is_disconnected():
+                items, dropped = await sub.get(STREAM_HEARTBEAT)
+                if dropped:
+                    # the client fell behind; it should re-read /inventory/low-stock
+                    yield _sse("overflow", {"dropped": dropped})
+                if not items and not dropped:
+                    yield ": keep-alive\n\n"
+                for item in items:
+                    if item.get("store_id") != store_id:
+                        continue
+                    item = {**item, "crossing": events.crossing(item["old"], item["new"], threshold)}
+                    if crossings_only and not item["crossing"]:
+                        continue
+                    kind = {"low": "low_stock", "restocked": "restocked"}.get(item["crossing"], "stock")
+                    yield _sse(kind, item)
+        finally:
+            events.broker.unsubscribe(sub)
+
+    return StreamingResponse(
+        stream(),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
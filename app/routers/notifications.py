@@ -0,0 +1,65 @@
+from fastapi import APIRouter, Depends, HTTPException
+from sqlalchemy.orm import Session
+from fastapi.security import OAuth2PasswordBearer
+from jose import jwt
+from typing import List
+from .. import schemas, crud
+from ..database import get_db
+from ..auth import SECRET_KEY, ALGORITHM
+
+router = APIRouter(prefix="/notifications", tags=["notifications"])
+oauth2 = OAuth2PasswordBearer(tokenUrl="/token")
+
+
+def get_payload(token: str):
+    try:
+        return jwt.decode(token, SECRET_KEY, algorithms=[ALGORITHM])
+    except Exception:
+        return None
+
+
+# -----------------------------
+# List notifications
+# -----------------------------
+@router.get("/", response_model=List[schemas.NotificationOut])
+def get_notifications(
+    unread_only: bool = False,
+    limit: int = 50,
+    token: str = Depends(oauth2),
+    db: Session = Depends(get_db)
+):
+    payload = get_payload(token)
+    if not payload or payload.get("role") != "customer":
+        raise HTTPException(status_code=403, detail="Customer required")
+
+    return crud.get_notifications(db, payload.get("user_id"), unread_only, limit)
+
+
+# -----------------------------
+# Mark as read
+# -----------------------------
+@router.post("/read-all")
+def mark_all_read(
+    token: str = Depends(oauth2),
+    db: Session = Depends(get_db)
+):
+    payload = get_payload(token)
+    if not payload or payload.get("role") != "customer":
+        raise HTTPException(status_code=403, detail="Customer required")
+
+    return {"updated": crud.mark_notifications_read(db, payload.get("user_id"))}
+
+
+@router.post("/{notification_id}/read")
+def mark_read(
+    notification_id: int,
+    token: str = Depends(oauth2),
+    db: Session = Depends(get_db)
+):
+    payload = get_payload(token)
+    if not payload or payload.get("role") != "customer":
+        raise HTTPException(status_code=403, detail="Customer required")
+
+    if not crud.mark_notifications_read(db, payload.get("user_id"), notification_id):
+        raise HTTPException(status_code=404, detail="Notification not found")
+    return {"detail": "read"}
@@ -1,9 +1,11 @@
+from datetime import date
 from fastapi import APIRouter, Depends, HTTPException
+from fastapi.responses import StreamingResponse
 from sqlalchemy.orm import Session
 from fastapi.security import OAuth2PasswordBearer
 from jose import jwt
 from typing import List, Optional
-from .. import schemas, crud
+from .. import schemas, crud, rollups, cartstore
 from ..database import get_db
 from ..auth import SECRET_KEY, ALGORITHM
 
@@ -21,6 +23,7 @@ def get_payload(token: str):
 @router.post("/checkout", response_model=schemas.OrderOut)
 def checkout(
     promo_code: str = None,
+    store_id: Optional[int] = None,
     token: str = Depends(oauth2),
     db: Session = Depends(get_db)
 ):
@@ -29,8 +32,13 @@ def checkout(
         raise HTTPException(status_code=403, detail="Customer required")
 
     user_id = payload.get("user_id")
+    if store_id is not None and not crud.get_store(db, store_id):
+        raise HTTPException(status_code=404, detail="Store not found")
 
     try:
+        # a write-behind cart store writes this user's pending edits first
+        cartstore.store.before_checkout(user_id)
+
         # calculate total and check stock
         cart_items = crud.get_cart_items(db, user_id)
         if not cart_items:
@@ -39,7 +47,8 @@ def checkout(
         total = 0
         for ci in cart_items:
             product = crud.get_product(db, ci.product_id)
-            if product.stock < ci.quantity:
+            # a store's stock is checked and taken in one step below
+            if store_id is None and product.stock < ci.quantity:
                 raise HTTPException(
                     status_code=400,
                     detail=f"Insufficient stock for '{product.name}'"
@@ -59,14 +68,16 @@ def checkout(
             discount = promo_result
             total -= discount
 
-        # Create order
-        order = crud.create_order(db, user_id, total, cart_items)
+        # Create order (with a store, its stock is taken before the order commits)
+        order = crud.create_order(db, user_id, total, cart_items, store_id=store_id)
+        cartstore.store.after_checkout(user_id)
 
         return {
             "id": order.id,
             "total_amount": order.total_amount,
             "discount_applied": discount,
             "created_at": order.created_at,
+            "store_id": order.store_id,
             "items": [
                 {
                     "product_id": oi.product_id,
@@ -81,3 +92,86 @@ def checkout(
         raise
     except Exception as e:
         raise HTTPException(status_code=400, detail=str(e))
+
+
+@router.get("/", response_model=List[schemas.OrderOut])
+def order_history(
+    include_archived: bool = False,
+    limit: int = 50,
+    token: str = Depends(oauth2),
+    db: Session = Depends(get_db)
+):
+    payload = get_payload(token)
+    if not payload or payload.get("role") != "customer":
+        raise HTTPException(status_code=403, detail="Customer required")
+
+    return crud.get_order_history(db, payload.get("user_id"), include_archived, limit)
+
+
+def _check_report_params(granularity: Optional[str], by: str):
+    if granularity is not None and granularity not in rollups.GRANULARITIES:
+        raise HTTPException(status_code=400, detail=f"granularity must be one of {', '.join(rollups.GRANULARITIES)}")
+    if by not in rollups.GROUPINGS:
+        raise HTTPException(status_code=400, detail=f"by must be one of {', '.join(rollups.GROUPINGS)}")
+
+
+@router.get("/sales-report")
+def sales_report(
+    sort: str = "most",
+    category: Optional[str] = None,
+    limit: int = 50,
+    start: Optional[date] = None,
+    end: Optional[date] = None,
+    granularity: Optional[str] = None,
+    by: str = "product",
+    token: str = Depends(oauth2),
+    db: Session = Depends(get_db)
+):
+    payload = get_payload(token)
+    if not payload or payload.get("role") != "manager":
+        raise HTTPException(status_code=403, detail="Manager access required")
+    _check_report_params(granularity, by)
+
+    # Date ranges / periods come from the daily rollups; the plain report stays all-time
+    if start or end or granularity or by != "product":
+        return crud.sales_report_by_period(
+            db, start=start, end=end, granularity=granularity or "day", by=by,
+            sort=sort, category=category, limit=limit
+        )
+
+    rows = crud.sales_report(db, sort=sort, category=category, limit=limit)
+    return [
+        {
+            "product_id": r.product_id,
+            "name": r.name,
+            "category": r.category,
+            "times_sold": int(r.times_sold),
+            "revenue": round(r.revenue, 2)
+        }
+        for r in rows
+    ]
+
+
+@router.get("/sales-report/export")
+def export_sales_report(
+    format: str = "csv",
+    start: Optional[date] = None,
+    end: Optional[date] = None,
+    granularity: str = "day",
+    by: str = "product",
+    category: Optional[str] = None,
+    token: str = Depends(oauth2)
+):
+    payload = get_payload(token)
+    if not payload or payload.get("role") != "manager":
+        raise HTTPException(status_code=403, detail="Manager access required")
+    _check_report_params(granularity, by)
+    if format not in ("csv", "ndjson"):
+        raise HTTPException(status_code=400, detail="format must be csv or ndjson")
+
+    # rows are streamed from a server-side cursor, never held in memory all at once
+    body = rollups.stream_report(format, start=start, end=end, granularity=granularity, by=by, category=category)
+    media_type = "text/csv" if format == "csv" else "application/x-ndjson"
+    filename = f"sales-{by}-{granularity}.{format}"
+    return StreamingResponse(body, media_type=media_type,
+                             headers={"Content-Disposition": f'attachment; filename="{filename}"'})
@@ -1,10 +1,10 @@
 import os
-from fastapi import APIRouter, Depends, HTTPException , File, UploadFile, Form
+from fastapi import APIRouter, Depends, HTTPException , File, UploadFile, Form, Query, Request, Response
 from typing import List, Optional
 from sqlalchemy.orm import Session
 from fastapi.security import OAuth2PasswordBearer
 from jose import jwt
-from .. import schemas, crud
+from .. import schemas, crud, models, caching, fastjson, images, recommendations, snapshot
 from ..database import get_db
 from ..auth import SECRET_KEY, ALGORITHM
 
@@ -12,6 +12,9 @@ from ..auth import SECRET_KEY, ALGORITHM
 router = APIRouter(prefix="/products", tags=["products"])
 oauth2 = OAuth2PasswordBearer(tokenUrl="/token")
 
+# lower edges of the price facet buckets; the last bucket is open-ended
+FACET_PRICE_BUCKETS = tuple(float(x) for x in os.getenv("FACET_PRICE_BUCKETS", "0,5,10,20,50,100").split(","))
+
 
 def get_payload(token: str):
     try:
@@ -36,20 +39,11 @@ def create_product(
     if not payload or payload.get("role") != "manager":
         raise HTTPException(status_code=403, detail="Manager required")
 
-    # ---------- CREATE UPLOAD FOLDER IF NOT EXISTS ----------
-    UPLOAD_DIR = "uploads"
-    os.makedirs(UPLOAD_DIR, exist_ok=True)
-
     # ---------- SAVE IMAGE IF PROVIDED ----------
+    # stored under a hash of its bytes, so the URL can be cached forever
     image_url = None
     if image is not None:
-        file_location = os.path.join(UPLOAD_DIR, image.filename)
-        with open(file_location, "wb") as f:
-            f.write(image.file.read())
-        image_url = file_location
-        
-        # Convert Windows path → URL path
-        image_url = file_location.replace("\\", "/")
+        image_url = images.save_upload(image)
 
     product_data = {
         "name": name,
@@ -62,21 +56,106 @@ def create_product(
     return crud.create_product(db, schemas.ProductCreate(**product_data))
 
 @router.get("/", response_model=List[schemas.ProductOut])
-def list_products(category: Optional[str] = None, popular: Optional[str] = None, limit: int = 50, db: Session = Depends(get_db)):
-    prods = crud.list_products(db, category=category, popular=popular, limit=limit)
+def list_products(
+    request: Request,
+    response: Response,
+    category: Optional[List[str]] = Query(None),
+    popular: Optional[str] = None,
+    min_price: Optional[float] = Query(None, ge=0),
+    max_price: Optional[float] = Query(None, ge=0),
+    in_stock: bool = False,
+    sort: Optional[str] = None,
+    limit: int = Query(50, ge=1, le=500),
+    offset: int = Query(0, ge=0),
+    db: Session = Depends(get_db),
+):
+    if sort is not None and sort not in crud.PRODUCT_SORTS:
+        raise HTTPException(status_code=400, detail=f"sort must be one of {', '.join(crud.PRODUCT_SORTS)}")
+
+    # answered from the cached catalog version when possible, before any query
+    version = caching.catalog_version(db)
+    etag = caching.list_etag(version, request)
+    if caching.is_not_modified(request, etag):
+        return caching.not_modified("products.list", etag)
+    response.headers.update(caching.cache_headers("products.list", etag))
+
+    # plain id-ordered pages come straight from the mapped catalog snapshot
+    plain = not (popular or sort or in_stock or min_price is not None or max_price is not None)
+    if snapshot.ENABLED and plain and len(category or ()) <= 1:
+        view = snapshot.reader.view(db, version)
+        body = view.page(offset, limit, category[0] if category else None) if view else None
+        if body is not None:
+            return Response(body, headers=dict(response.headers), media_type="application/json")
+
+    prods = crud.list_products(
+        db, category=category, popular=popular, limit=limit, min_price=min_price,
+        max_price=max_price, in_stock=in_stock, sort=sort, offset=offset,
+    )
     if isinstance(prods, list) and prods and isinstance(prods[0], dict) and "product" in prods[0]:
-        return [p["product"] for p in prods]
+        prods = [p["product"] for p in prods]
+    if fastjson.ENABLED:
+        return fastjson.respond(fastjson.PRODUCT_LIST, prods, response)
     return prods
 
 
+@router.get("/facets", response_model=schemas.ProductFacetsOut)
+def product_facets(
+    request: Request,
+    response: Response,
+    category: Optional[List[str]] = Query(None),
+    min_price: Optional[float] = Query(None, ge=0),
+    max_price: Optional[float] = Query(None, ge=0),
+    in_stock: bool = False,
+    db: Session = Depends(get_db),
+):
+    version = caching.catalog_version(db)
+    etag = caching.list_etag(version, request)
+    if caching.is_not_modified(request, etag):
+        return caching.not_modified("products.facets", etag)
+    response.headers.update(caching.cache_headers("products.facets", etag))
+
+    # the same filters give the same counts until the catalog version moves
+    key = (tuple(sorted(category or ())), min_price, max_price, in_stock)
+    return caching.memoize(
+        "product_facets", version, key,
+        lambda: crud.product_facets(db, category, min_price, max_price, in_stock, FACET_PRICE_BUCKETS),
+    )
+
+
 @router.get("/{product_id}", response_model=schemas.ProductOut)
-def get_product(product_id: int, db: Session = Depends(get_db)):
+def get_product(product_id: int, request: Request, response: Response, db: Session = Depends(get_db)):
+    view = snapshot.reader.view(db, caching.catalog_version(db)) if snapshot.ENABLED else None
+    if view is not None:
+        found = view.product(product_id)
+        if found is None:
+            raise HTTPException(status_code=404, detail="Product not found")
+        body, updated_at = found
+        etag = caching.product_etag(product_id, updated_at)
+        if caching.is_not_modified(request, etag, updated_at):
+            return caching.not_modified("products.detail", etag, updated_at)
+        return Response(body, headers=caching.cache_headers("products.detail", etag, updated_at), media_type="application/json")
+
+    # only the version column is read until we know the client's copy is stale
+    updated_at = db.query(models.Product.updated_at).filter(models.Product.id == product_id).scalar()
+    etag = caching.product_etag(product_id, updated_at)
+    if updated_at is not None and caching.is_not_modified(request, etag, updated_at):
+        return caching.not_modified("products.detail", etag, updated_at)
+
     p = crud.get_product(db, product_id)
     if not p:
         raise HTTPException(status_code=404, detail="Product not found")
+    response.headers.update(caching.cache_headers("products.detail", caching.product_etag(p.id, p.updated_at), p.updated_at))
+    if fastjson.ENABLED:
+        return fastjson.respond(fastjson.PRODUCT, p, response)
     return p
 
 
+@router.get("/{product_id}/related", response_model=List[schemas.RelatedProductOut])
+def related_products(product_id: int, limit: int = Query(recommendations.TOP_K, ge=1, le=recommendations.TOP_K), db: Session = Depends(get_db)):
+    # precomputed top-K list: one primary-key range read, whatever the order history size
+    return [{"product": p, "score": score} for p, score in recommendations.related(db, product_id, limit)]
+
+
 @router.put("/{product_id}", response_model=schemas.ProductOut)
 def update_product(product_id: int, product_in: schemas.ProductCreate, token: str = Depends(oauth2), db: Session = Depends(get_db)):
     payload = get_payload(token)
@@ -0,0 +1,82 @@
+import time
+from datetime import datetime
+from fastapi import APIRouter, Depends, HTTPException, Request
+from fastapi.responses import PlainTextResponse
+from fastapi.security import OAuth2PasswordBearer
+from jose import jwt
+from .. import schemas, profiling
+from ..auth import SECRET_KEY, ALGORITHM
+
+router = APIRouter(prefix="/admin/profile", tags=["admin"])
+oauth2 = OAuth2PasswordBearer(tokenUrl="/token")
+
+
+def get_payload(token: str):
+    try:
+        return jwt.decode(token, SECRET_KEY, algorithms=[ALGORITHM])
+    except Exception:
+        return None
+
+
+def require_manager(token: str = Depends(oauth2)):
+    payload = get_payload(token)
+    if not payload or payload.get("role") != "manager":
+        raise HTTPException(status_code=403, detail="Manager required")
+
+
+def _status(session: dict) -> dict:
+    stacks = profiling.collapsed(session["id"])
+    return {
+        **session,
+        "started_at": datetime.utcfromtimestamp(session["started_at"]),
+        "expires_at": datetime.utcfromtimestamp(session["expires_at"]),
+        "active": session["expires_at"] > time.time(),
+        "workers": profiling.workers(session["id"]),
+        "stacks": len(stacks),
+        "samples": sum(stacks.values()),
+    }
+
+
+def _session_or_404():
+    session = profiling.read_session()
+    if session is None:
+        raise HTTPException(status_code=404, detail="No profiling session")
+    return session
+
+
+@router.post("/", response_model=schemas.ProfileOut, dependencies=[Depends(require_manager)])
+def start_profile(body: schemas.ProfileStart, request: Request):
+    """Profile `sample_rate` of the requests to `routes` (`GET /products/` or a bare path) for `seconds`."""
+    targets, unknown = profiling.resolve(request.app.routes, body.routes)
+    if unknown or not body.routes:
+        raise HTTPException(status_code=400, detail=f"Unknown routes: {unknown}")
+    keys = set().union(*(keys for _, keys in targets))
+    session = profiling.start(keys, body.sample_rate, body.seconds)
+    profiling.profiler.refresh()
+    return _status(session)
+
+
+@router.get("/", response_model=schemas.ProfileOut, dependencies=[Depends(require_manager)])
+def profile_status():
+    return _status(_session_or_404())
+
+
+@router.delete("/", response_model=schemas.ProfileOut, dependencies=[Depends(require_manager)])
+def stop_profile():
+    """End the session early. Other workers write their last samples within a couple of seconds."""
+    _session_or_404()
+    session = profiling.stop()
+    profiling.profiler.refresh()
+    profiling.profiler.shutdown()
+    return _status(session)
+
+
+@router.get("/stacks", response_class=PlainTextResponse, dependencies=[Depends(require_manager)])
+def download_stacks():
+    """Collapsed stacks (`frame;frame;... samples`), for flamegraph.pl, inferno or speedscope."""
+    session = _session_or_404()
+    stacks = profiling.collapsed(session["id"])
+    return PlainTextResponse(
+        "".join(f"{stack} {n}\n" for stack, n in sorted(stacks.items())),
+        headers={"Content-Disposition": f'attachment; filename="profile-{session["id"]}.collapsed"'},
+    )
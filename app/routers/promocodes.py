@@ -5,7 +5,7 @@ from jose import jwt
 
 from ..database import get_db
 from ..auth import SECRET_KEY, ALGORITHM
-from .. import crud, schemas, models   # VERY IMPORTANT
+from .. import crud, schemas, models, ratelimit   # VERY IMPORTANT
 
 router = APIRouter(prefix="/promocodes", tags=["Promo Codes"])
 oauth2 = OAuth2PasswordBearer(tokenUrl="/token")
@@ -39,7 +39,7 @@ def create_promocode(
 #  Apply Promo Code
 # ============================
 
-@router.get("/apply/{code}")
+@router.get("/apply/{code}", dependencies=[Depends(ratelimit.limit("promocodes.apply"))])
 def apply_promocode(
     code: str,
     cart_total: float,
@@ -0,0 +1,85 @@
+from fastapi import APIRouter, Depends, HTTPException, Query
+from sqlalchemy.orm import Session
+from fastapi.security import OAuth2PasswordBearer
+from jose import jwt
+from typing import List, Optional
+from .. import schemas, crud, stores
+from ..database import get_db
+from ..auth import SECRET_KEY, ALGORITHM
+
+router = APIRouter(prefix="/stores", tags=["stores"])
+oauth2 = OAuth2PasswordBearer(tokenUrl="/token")
+
+
+def get_payload(token: str):
+    try:
+        return jwt.decode(token, SECRET_KEY, algorithms=[ALGORITHM])
+    except Exception:
+        return None
+
+
+def _store_or_404(db: Session, store_id: int):
+    store = crud.get_store(db, store_id)
+    if not store:
+        raise HTTPException(status_code=404, detail="Store not found")
+    return store
+
+
+@router.post("/", response_model=schemas.StoreOut)
+def create_store(store: schemas.StoreCreate, token: str = Depends(oauth2), db: Session = Depends(get_db)):
+    payload = get_payload(token)
+    if not payload or payload.get("role") != "manager":
+        raise HTTPException(status_code=403, detail="Manager required")
+    return crud.create_store(db, store)
+
+
+@router.get("/", response_model=List[schemas.StoreOut])
+def list_stores(db: Session = Depends(get_db)):
+    return crud.get_stores(db)
+
+
+@router.get("/{store_id}/products", response_model=List[schemas.StoreProductOut])
+def store_products(
+    store_id: int,
+    category: Optional[str] = None,
+    in_stock: bool = False,
+    after: int = Query(0, ge=0, description="last product id of the previous page"),
+    limit: int = Query(50, ge=1, le=500),
+    db: Session = Depends(get_db)
+):
+    _store_or_404(db, store_id)
+    rows = stores.list_products(db, store_id, category, in_stock, after, limit)
+    return [{"product": p, "stock": stock} for p, stock in rows]
+
+
+@router.get("/{store_id}/low-stock", response_model=List[schemas.StoreProductOut])
+def store_low_stock(
+    store_id: int,
+    threshold: int = stores.LOW_STOCK_THRESHOLD,
+    limit: int = Query(100, ge=1, le=1000),
+    token: str = Depends(oauth2),
+    db: Session = Depends(get_db)
+):
+    payload = get_payload(token)
+    if not payload or payload.get("role") != "manager":
+        raise HTTPException(status_code=403, detail="Manager required")
+    _store_or_404(db, store_id)
+    return [{"product": p, "stock": stock} for p, stock in stores.low_stock(db, store_id, threshold, limit)]
+
+
+@router.put("/{store_id}/stock")
+def set_store_stock(
+    store_id: int,
+    updates: List[schemas.StockUpdate],
+    token: str = Depends(oauth2),
+    db: Session = Depends(get_db)
+):
+    """Set the store's stock for many products at once, e.g. after a delivery or a count."""
+    payload = get_payload(token)
+    if not payload or payload.get("role") != "manager":
+        raise HTTPException(status_code=403, detail="Manager required")
+    _store_or_404(db, store_id)
+    stock_by_id = {u.product_id: u.stock for u in updates}
+    missing = stores.set_stock(db, store_id, stock_by_id)
+    db.commit()
+    return {"updated": len(stock_by_id) - len(missing), "missing": missing}
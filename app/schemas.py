@@ -1,4 +1,4 @@
-from pydantic import BaseModel, EmailStr
+from pydantic import BaseModel, EmailStr, Field, Json
 from typing import Optional, List
 from datetime import datetime
 
@@ -50,6 +50,36 @@ class ProductCreate(ProductBase):
 class ProductOut(ProductBase, ORMModel):
     id: int
     created_at: datetime
+    updated_at: Optional[datetime] = None
+
+
+class CategoryFacet(BaseModel):
+    category: Optional[str]
+    count: int
+
+
+class PriceBucket(BaseModel):
+    min: float
+    max: Optional[float]
+    count: int
+
+
+class PriceRange(BaseModel):
+    min: Optional[float]
+    max: Optional[float]
+
+
+class ProductFacetsOut(BaseModel):
+    total: int
+    in_stock: int
+    price_range: PriceRange
+    categories: List[CategoryFacet]
+    price_buckets: List[PriceBucket]
+
+
+class RelatedProductOut(BaseModel):
+    product: ProductOut
+    score: float
 
 
 # Cart
@@ -73,6 +103,15 @@ class WishlistItemCreate(BaseModel):
     product_id: int
 
 
+# Notification
+class NotificationOut(ORMModel):
+    id: int
+    message: str
+    items: Json[List[dict]]
+    created_at: datetime
+    read_at: Optional[datetime] = None
+
+
 
 
 # Order
@@ -86,9 +125,83 @@ class OrderOut(ORMModel):
     id: int
     total_amount: float
     created_at: datetime
+    store_id: Optional[int] = None
     items: List[OrderItemOut]
 
 
+# Inventory
+class StockUpdate(BaseModel):
+    product_id: int
+    stock: int = Field(ge=0)
+
+
+class ForecastItemOut(BaseModel):
+    product_id: int
+    name: Optional[str]
+    stock: int
+    velocity: float
+    days_of_cover: Optional[float]
+    reorder_qty: int
+
+
+class StockMovementOut(ORMModel):
+    id: int
+    product_id: int
+    kind: str
+    quantity: int
+    order_id: Optional[int] = None
+    store_id: Optional[int] = None
+    created_at: datetime
+
+
+class StockAtOut(BaseModel):
+    product_id: int
+    at: datetime
+    stock: int
+
+
+class StockDriftOut(BaseModel):
+    product_id: int
+    name: str
+    stock: int
+    ledger_stock: int
+    drift: int
+
+
+# Stores
+class StoreCreate(BaseModel):
+    name: str
+
+
+class StoreOut(StoreCreate, ORMModel):
+    id: int
+    created_at: datetime
+
+
+class StoreProductOut(BaseModel):
+    product: ProductOut
+    stock: int
+
+
+# Profiling
+class ProfileStart(BaseModel):
+    routes: List[str]
+    sample_rate: float = Field(0.1, gt=0, le=1)
+    seconds: int = Field(60, ge=1)
+
+
+class ProfileOut(BaseModel):
+    id: str
+    routes: List[str]
+    sample_rate: float
+    started_at: datetime
+    expires_at: datetime
+    active: bool
+    workers: int
+    stacks: int
+    samples: int
+
+
 # PromoCode
 class PromoCodeCreate(BaseModel):
     code: str
@@ -0,0 +1,295 @@
+"""
+Catalog snapshot file, so new workers start warm.
+
+    python -m app.snapshot [--path /tmp/grocery-catalog.snapshot]
+
+The job writes every product, already rendered as `ProductOut` JSON, to one
+file stamped with the catalog version (see caching.py). Workers memory-map it
+at startup. `GET /products/{id}` and plain `GET /products/` pages (optionally
+by a single category) are then answered from the file without touching the
+database. The OS page cache is shared, so every worker on the host reads
+the same pages.
+
+Layout: the JSON bodies back to back, then column arrays sorted by product id
+(ids, offsets, lengths, category codes, updated_at), then a JSON header, then
+a fixed trailer pointing at the header. The arrays are read in place with
+numpy; looking up a product is a binary search over the ids.
+
+The file is used while the catalog version matches its stamp. When the
+version moves, the worker re-reads only the rows updated since the file was
+written (indexed on `updated_at`) and lays them over the file. Updates that
+keep a product's position, like stock and price changes, keep both detail
+and list reads on the file. New products or category changes keep detail
+reads only. Deletes, or more than `CATALOG_SNAPSHOT_MAX_OVERLAY` changed
+rows, send reads back to the database until the job writes a new file. A
+new file (replaced atomically) is picked up within
+`CATALOG_SNAPSHOT_CHECK_INTERVAL` seconds.
+"""
+import argparse
+import json
+import logging
+import mmap
+import os
+import struct
+import tempfile
+import threading
+import time
+from datetime import datetime, timedelta
+
+import numpy as np
+
+from . import caching, fastjson, models
+from .database import SessionLocal
+from .metrics import record_cache
+
+logger = logging.getLogger(__name__)
+
+PATH = os.getenv("CATALOG_SNAPSHOT_PATH", "/tmp/grocery-catalog.snapshot")
+ENABLED = bool(PATH)
+CHECK_INTERVAL = float(os.getenv("CATALOG_SNAPSHOT_CHECK_INTERVAL", 5.0))
+MAX_OVERLAY = int(os.getenv("CATALOG_SNAPSHOT_MAX_OVERLAY", 10_000))
+# rows committed slightly out of updated_at order are still picked up
+OVERLAY_LAG = timedelta(seconds=5)
+
+MAGIC = b"GCATSNP1"
+TRAILER = struct.Struct("<QI8s")  # header offset, header length, magic
+COLUMNS = (("ids", "<i8"), ("offsets", "<u8"), ("lengths", "<u4"), ("categories", "<u4"), ("updated", "<i8"))
+_EPOCH = datetime(1970, 1, 1)
+
+
+def _micros(dt) -> int:
+    return int((dt - _EPOCH) / timedelta(microseconds=1)) if dt else 0
+
+
+def _datetime(micros: int):
+    return _EPOCH + timedelta(microseconds=int(micros)) if micros else None
+
+
+# ---------- writing ----------
+
+def build(db, path: str = PATH, chunk: int = 10_000) -> dict:
+    """Write a snapshot of every product to `path` (atomically). Returns its header."""
+    # version first: anything changed while we read makes the stamp stale, never the reverse
+    caching.invalidate_catalog()
+    version = caching.catalog_version(db)
+
+    columns = {name: [] for name, _ in COLUMNS}
+    categories = {}
+    max_updated = 0
+    directory = os.path.dirname(os.path.abspath(path))
+    fd, tmp = tempfile.mkstemp(prefix=".catalog-", dir=directory)
+    try:
+        with os.fdopen(fd, "wb") as f:
+            offset = 0
+            q = db.query(models.Product).order_by(models.Product.id).yield_per(chunk)
+            for p in q:
+                body = fastjson.PRODUCT.render(p)
+                f.write(body)
+                updated = _micros(p.updated_at)
+                max_updated = max(max_updated, updated)
+                columns["ids"].append(p.id)
+                columns["offsets"].append(offset)
+                columns["lengths"].append(len(body))
+                columns["categories"].append(categories.setdefault(p.category, len(categories)))
+                columns["updated"].append(updated)
+                offset += len(body)
+
+            header = {
+                "version": version,
+                "count": len(columns["ids"]),
+                "max_updated": max_updated,
+                "categories": list(categories),
+                "built_at": datetime.utcnow().isoformat(),
+                "columns": {},
+            }
+            for name, dtype in COLUMNS:
+                offset += f.write(b"\0" * (-offset % 8))
+                header["columns"][name] = offset
+                offset += f.write(np.asarray(columns[name], dtype=dtype).tobytes())
+            raw = json.dumps(header).encode()
+            f.write(raw)
+            f.write(TRAILER.pack(offset, len(raw), MAGIC))
+        os.chmod(tmp, 0o644)
+        os.replace(tmp, path)
+    except BaseException:
+        if os.path.exists(tmp):
+            os.unlink(tmp)
+        raise
+    return header
+
+
+# ---------- reading ----------
+
+class CatalogFile:
+    """One mapped snapshot file. Read-only after construction."""
+
+    def __init__(self, path: str):
+        with open(path, "rb") as f:
+            self.stat = os.fstat(f.fileno())
+            self.mm = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        header_offset, header_length, magic = TRAILER.unpack_from(self.mm, len(self.mm) - TRAILER.size)
+        if magic != MAGIC:
+            raise ValueError(f"{path} is not a catalog snapshot")
+        self.header = json.loads(self.mm[header_offset:header_offset + header_length])
+        count = self.header["count"]
+        for name, dtype in COLUMNS:
+            setattr(self, name, np.frombuffer(self.mm, dtype=dtype, count=count, offset=self.header["columns"][name]))
+        self.version = self.header["version"]
+        self.category_codes = {c: i for i, c in enumerate(self.header["categories"])}
+        self._by_category = {}
+        if hasattr(mmap, "MADV_WILLNEED"):
+            self.mm.madvise(mmap.MADV_WILLNEED)
+
+    def position(self, product_id: int):
+        i = int(np.searchsorted(self.ids, product_id))
+        return i if i < len(self.ids) and self.ids[i] == product_id else None
+
+    def body(self, i: int) -> bytes:
+        start = int(self.offsets[i])
+        return self.mm[start:start + int(self.lengths[i])]
+
+    def positions(self, category=None):
+        """Positions of the products in `category` (all products when None), in id order."""
+        if category is None:
+            return None
+        code = self.category_codes.get(category)
+        if code is None:
+            return np.empty(0, dtype=np.int64)
+        if code not in self._by_category:
+            self._by_category[code] = np.flatnonzero(self.categories == code)
+        return self._by_category[code]
+
+
+class CatalogView:
+    """The file plus rows changed since it was written, valid for one catalog version."""
+
+    def __init__(self, file: CatalogFile, version: str, overlay: dict, reshaped: bool):
+        self.file = file
+        self.version = version
+        self.overlay = overlay  # product id -> (body, updated micros)
+        self.reshaped = reshaped  # products added or moved between categories since the file
+
+    def product(self, product_id: int):
+        """(body, updated_at), or None if the product doesn't exist at this version."""
+        if product_id in self.overlay:
+            body, updated = self.overlay[product_id]
+            return body, _datetime(updated)
+        i = self.file.position(product_id)
+        if i is None:
+            return None
+        return self.file.body(i), _datetime(self.file.updated[i])
+
+    def page(self, offset: int, limit: int, category=None):
+        """JSON array body for a plain id-ordered page, or None if it has to come from the database."""
+        if self.reshaped:
+            return None
+        positions = self.file.positions(category)
+        if positions is None:
+            picked = range(offset, min(offset + limit, len(self.file.ids)))
+        else:
+            picked = positions[offset:offset + limit]
+        ids, overlay = self.file.ids, self.overlay
+        parts = []
+        for i in picked:
+            changed = overlay.get(int(ids[i]))
+            parts.append(changed[0] if changed else self.file.body(i))
+        return b"[" + b",".join(parts) + b"]"
+
+
+class SnapshotReader:
+    def __init__(self, path: str = PATH, check_interval: float = CHECK_INTERVAL, max_overlay: int = MAX_OVERLAY):
+        self.path = path
+        self.check_interval = check_interval
+        self.max_overlay = max_overlay
+        self._lock = threading.Lock()
+        self._file = None
+        self._view = None
+        self._checked = 0.0
+        self._seen_updated = 0  # overlay covers rows updated after this
+        self._stale = False  # the file can't be brought up to date; wait for a new one
+
+    def open(self):
+        """Map the file now (at startup) rather than on the first request."""
+        with self._lock:
+            self._check_file(force=True)
+
+    def _check_file(self, force: bool = False):
+        now = time.monotonic()
+        if not force and now - self._checked < self.check_interval:
+            return
+        self._checked = now
+        try:
+            stat = os.stat(self.path)
+        except OSError:
+            self._file = self._view = None
+            return
+        if self._file is not None and (stat.st_ino, stat.st_mtime_ns) == (self._file.stat.st_ino, self._file.stat.st_mtime_ns):
+            return
+        try:
+            file = CatalogFile(self.path)
+        except (OSError, ValueError, KeyError):
+            logger.exception("could not map catalog snapshot %s", self.path)
+            return
+        self._file = file
+        self._view = CatalogView(file, file.version, {}, False)
+        self._seen_updated = file.header["max_updated"]
+        self._stale = False
+        logger.info("mapped catalog snapshot %s (%s products)", self.path, file.header["count"])
+
+    def view(self, db, version: str):
+        """A view valid for catalog `version`, or None to read from the database."""
+        with self._lock:
+            self._check_file()
+            view = self._view
+            if view is not None and view.version != version and not self._stale:
+                view = self._view = self._refresh(db, view, version)
+        hit = view is not None and view.version == version
+        record_cache("catalog_snapshot", hit)
+        return view if hit else None
+
+    def _refresh(self, db, view: CatalogView, version: str):
+        file = view.file
+        since = _datetime(self._seen_updated) - OVERLAY_LAG if self._seen_updated else _EPOCH
+        rows = db.query(models.Product).filter(models.Product.updated_at >= since).all()
+        overlay = dict(view.overlay)
+        reshaped = view.reshaped
+        for p in rows:
+            updated = _micros(p.updated_at)
+            self._seen_updated = max(self._seen_updated, updated)
+            i = file.position(p.id)
+            if i is None:
+                reshaped = True
+            elif file.header["categories"][file.categories[i]] != p.category:
+                reshaped = True
+            elif updated == file.updated[i]:
+                continue
+            overlay[p.id] = (fastjson.PRODUCT.render(p), updated)
+
+        added = sum(1 for pid in overlay if file.position(pid) is None)
+        count = int(version.partition(".")[0])
+        if count != file.header["count"] + added or len(overlay) > self.max_overlay:
+            # deletes can't be seen through updated_at; too many changes aren't worth holding
+            self._stale = True
+            return view
+        return CatalogView(file, version, overlay, reshaped)
+
+
+reader = SnapshotReader()
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Write the catalog snapshot file workers serve product reads from.")
+    parser.add_argument("--path", default=PATH)
+    args = parser.parse_args(argv)
+    db = SessionLocal()
+    try:
+        started = time.perf_counter()
+        header = build(db, args.path)
+    finally:
+        db.close()
+    print(f"wrote {header['count']} products (version {header['version']}) to {args.path} "
+          f"in {time.perf_counter() - started:.1f}s")
+
+
+if __name__ == "__main__":
+    main()
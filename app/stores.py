@@ -0,0 +1,241 @@
+"""
+Per-store inventory.
+
+`products.stock` stays the online catalog's stock. Each physical store
+keeps its own count in `store_stock`, keyed by `(store_id, product_id)`.
+Every store query is a range scan on a key that starts with `store_id`:
+
+- the listing walks the primary key (store_id, product_id);
+- low stock reads `(store_id, stock, product_id)`.
+
+So a store's queries cost the same however many stores there are.
+
+`store_stock` has no foreign keys, so a store's rows can move to their own
+database. `STORE_DATABASE_URLS` routes stores there, e.g.
+`3=postgresql://host-a/store3,4=postgresql://host-b/store4`. Stores not
+listed use the main database. The catalog (products, orders) always stays
+in the main database, so store queries read stock first and then look up
+the products by id.
+
+Checkout from a store takes stock with a guarded
+`UPDATE ... SET stock = stock - q WHERE stock >= q`. On the main database
+that runs in the order's own transaction. On a separate store database the
+order is flushed first and the store transaction commits next. Only then is
+the order committed. If that last commit fails, the stock is put back.
+
+Store stock changes go to the stock ledger (`ledger.record_store`) and the
+stock event stream with their `store_id`. Both are written through the main
+database session, so they commit with the order or stock update.
+"""
+import logging
+import os
+import threading
+from contextlib import contextmanager
+from datetime import datetime
+
+from fastapi import HTTPException
+from sqlalchemy import update
+from sqlalchemy.orm import Session
+
+from . import events, ledger, models
+from .database import engine as main_engine, make_engine, upsert
+from .events import LOW_STOCK_THRESHOLD
+
+logger = logging.getLogger(__name__)
+
+
+def _parse_urls(raw: str) -> dict:
+    urls = {}
+    for entry in raw.replace(";", ",").split(","):
+        if entry.strip():
+            store_id, _, url = entry.partition("=")
+            urls[int(store_id)] = url.strip()
+    return urls
+
+
+STORE_URLS = _parse_urls(os.getenv("STORE_DATABASE_URLS", ""))
+
+_engines = {}
+_lock = threading.Lock()
+
+
+def engine_for(store_id: int):
+    """The engine holding `store_id`'s stock; stores sharing a URL share an engine."""
+    url = STORE_URLS.get(store_id)
+    if url is None:
+        return main_engine
+    with _lock:
+        if url not in _engines:
+            _engines[url] = make_engine(url)
+        return _engines[url]
+
+
+def store_engines():
+    """Every separate store database, for migrations."""
+    return [engine_for(store_id) for store_id in sorted(STORE_URLS)]
+
+
+@contextmanager
+def stock_session(store_id: int, db: Session):
+    """A session for `store_id`'s stock: `db` itself when the store is in the main database.
+
+    A separate session is committed by the caller and rolled back here on error.
+    """
+    bind = engine_for(store_id)
+    if bind is main_engine:
+        yield db
+        return
+    sdb = Session(bind=bind)
+    try:
+        yield sdb
+    except BaseException:
+        sdb.rollback()
+        raise
+    finally:
+        sdb.close()
+
+
+def _products(db: Session, product_ids, category=None) -> dict:
+    if not product_ids:
+        return {}
+    q = db.query(models.Product).filter(models.Product.id.in_(list(product_ids)))
+    if category:
+        q = q.filter(models.Product.category == category)
+    return {p.id: p for p in q}
+
+
+def list_products(db: Session, store_id: int, category: str = None, in_stock: bool = False,
+                  after: int = 0, limit: int = 50):
+    """[(product, store stock)] by product id, starting after `after` (keyset pagination)."""
+    S = models.StoreStock
+    found = []
+    with stock_session(store_id, db) as sdb:
+        while len(found) < limit:
+            q = sdb.query(S.product_id, S.stock).filter(S.store_id == store_id, S.product_id > after)
+            if in_stock:
+                q = q.filter(S.stock > 0)
+            # a category filter drops rows after the catalog lookup, so read ahead
+            rows = q.order_by(S.product_id).limit(limit * 4 if category else limit).all()
+            if not rows:
+                break
+            products = _products(db, [pid for pid, _ in rows], category)
+            for pid, stock in rows:
+                if pid in products:
+                    found.append((products[pid], stock))
+                    if len(found) == limit:
+                        break
+            after = rows[-1][0]
+    return found
+
+
+def low_stock(db: Session, store_id: int, threshold: int = LOW_STOCK_THRESHOLD, limit: int = 100):
+    """[(product, store stock)] at or below `threshold`, lowest first."""
+    S = models.StoreStock
+    with stock_session(store_id, db) as sdb:
+        rows = (
+            sdb.query(S.product_id, S.stock)
+            .filter(S.store_id == store_id, S.stock <= threshold)
+            .order_by(S.stock, S.product_id).limit(limit).all()
+        )
+    products = _products(db, [pid for pid, _ in rows])
+    return [(products[pid], stock) for pid, stock in rows if pid in products]
+
+
+def _levels(sdb: Session, store_id: int, product_ids, for_update: bool = False) -> dict:
+    S = models.StoreStock
+    q = sdb.query(S.product_id, S.stock).filter(S.store_id == store_id, S.product_id.in_(list(product_ids)))
+    return dict(q.with_for_update() if for_update else q)
+
+
+def _record(db: Session, store_id: int, changed: dict, kind: str = None, order_id: int = None):
+    """Ledger entries and stock events for {product_id: (old stock or None, new stock)}, in `db`."""
+    changed = {pid: (old, new) for pid, (old, new) in changed.items() if old != new}
+    if not changed:
+        return
+    ledger.record_store(db, store_id, {pid: new - (old or 0) for pid, (old, new) in changed.items()}, kind, order_id)
+    names = dict(db.query(models.Product.id, models.Product.name).filter(models.Product.id.in_(list(changed))))
+    for pid, (old, new) in sorted(changed.items()):
+        events.record(db, events.stock_event(pid, names.get(pid), old, new, store_id=store_id))
+
+
+def set_stock(db: Session, store_id: int, stock_by_id: dict):
+    """Upsert the store's stock for the given products; returns the ids not in the catalog.
+
+    A separate store database is committed here; the main one (with the
+    ledger entries and events) by the caller.
+    """
+    known = {pid for (pid,) in db.query(models.Product.id).filter(models.Product.id.in_(list(stock_by_id)))}
+    now = datetime.utcnow()
+    with stock_session(store_id, db) as sdb:
+        old = _levels(sdb, store_id, known, for_update=True)
+        upsert(
+            sdb, models.StoreStock.__table__,
+            [{"store_id": store_id, "product_id": pid, "stock": stock, "updated_at": now}
+             for pid, stock in stock_by_id.items() if pid in known],
+            keys=["store_id", "product_id"], replace=["stock", "updated_at"],
+        )
+        _record(db, store_id, {pid: (old.get(pid), stock) for pid, stock in stock_by_id.items() if pid in known})
+        if sdb is not db:
+            sdb.commit()
+    return sorted(set(stock_by_id) - known)
+
+
+def take(sdb: Session, store_id: int, quantities: dict) -> dict:
+    """Decrement the store's stock for {product_id: quantity}, all or nothing. Caller commits.
+
+    Returns the new stock per product. Raises 400 naming the first product
+    that is short; the caller rolls back.
+    """
+    S = models.StoreStock
+    now = datetime.utcnow()
+    for product_id, quantity in sorted(quantities.items()):  # fixed order, no lock cycles between checkouts
+        taken = sdb.execute(
+            update(S)
+            .where(S.store_id == store_id, S.product_id == product_id, S.stock >= quantity)
+            .values(stock=S.stock - quantity, updated_at=now)
+        ).rowcount
+        if not taken:
+            raise HTTPException(status_code=400, detail=f"Insufficient stock in store for product {product_id}")
+    return _levels(sdb, store_id, quantities)
+
+
+def _give_back(store_id: int, quantities: dict):
+    """Undo `take` on a separate store database after the order failed to commit."""
+    S = models.StoreStock
+    now = datetime.utcnow()
+    sdb = Session(bind=engine_for(store_id))
+    try:
+        for product_id, quantity in sorted(quantities.items()):
+            sdb.execute(
+                update(S)
+                .where(S.store_id == store_id, S.product_id == product_id)
+                .values(stock=S.stock + quantity, updated_at=now)
+            )
+        sdb.commit()
+    except Exception:
+        logger.exception("could not return stock to store %s: %s", store_id, quantities)
+        raise
+    finally:
+        sdb.close()
+
+
+def sell(db: Session, store_id: int, order_id: int, quantities: dict):
+    """Take the store's stock for an order flushed in `db`, then commit both.
+
+    On the main database this is one transaction. A separate store database
+    commits first and the order second, and the stock is returned if the
+    order's commit fails. Either way no order exists without its stock taken.
+    """
+    with stock_session(store_id, db) as sdb:
+        levels = take(sdb, store_id, quantities)
+        _record(db, store_id, {pid: (levels[pid] + q, levels[pid]) for pid, q in quantities.items()},
+                ledger.SALE, order_id)
+        if sdb is not db:
+            sdb.commit()
+    try:
+        db.commit()
+    except Exception:
+        db.rollback()
+        if engine_for(store_id) is not main_engine:
+            _give_back(store_id, quantities)
+        raise
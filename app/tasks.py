@@ -0,0 +1,41 @@
+"""
+Background job handlers. Everything here runs in job workers, off the request
+path; see app/jobs.py.
+"""
+import logging
+
+from . import models, notifications, recommendations, rollups
+from .events import LOW_STOCK_THRESHOLD
+from .jobs import handler
+
+logger = logging.getLogger(__name__)
+
+
+def _alert_low_stock(db, product_ids):
+    low = (
+        db.query(models.Product.id, models.Product.name, models.Product.stock)
+        .filter(models.Product.id.in_(product_ids), models.Product.stock <= LOW_STOCK_THRESHOLD)
+        .all()
+    )
+    for p in low:
+        logger.warning("low stock: product %s (%s) has %s left", p.id, p.name, p.stock)
+
+
+@handler("order.placed", batch=True)
+def order_placed(db, payloads):
+    order_ids = [p["order_id"] for p in payloads]
+    product_ids = {
+        pid for (pid,) in db.query(models.OrderItem.product_id).filter(models.OrderItem.order_id.in_(order_ids))
+    }
+    _alert_low_stock(db, product_ids)
+    rollups.refresh(db, order_ids=order_ids)
+    recommendations.refresh(db, order_ids=order_ids)
+
+
+@handler("product.updated", batch=True)
+def product_updated(db, payloads):
+    changed = {p["product_id"] for p in payloads if "stock" in p.get("changes", {})}
+    if changed:
+        _alert_low_stock(db, changed)
+    # back-in-stock / price-drop alerts for users who wishlisted these products
+    notifications.notify(db, payloads)
@@ -0,0 +1,145 @@
+"""
+Cart write benchmark: database transactions per cart edit, by cart store.
+
+    python -m benchmarks.cart_writes [--users 200] [--edits 20] [--interval 5]
+
+Simulates browsing sessions. Each user makes `--edits` adds/removes spread
+over `--duration` seconds of simulated time, and `--checkout-rate` of them
+check out at the end. The same sequence runs against each `CART_STORE`
+backend. Write-behind stores are flushed every `--interval` simulated
+seconds, as the background flusher would be. The report shows committed
+transactions, time, and whether the final `cart_items` and orders match the
+`db` store exactly.
+"""
+import argparse
+import os
+import random
+import tempfile
+import time
+
+os.environ.setdefault("DATABASE_URL", f"sqlite:///{os.path.join(tempfile.mkdtemp(), 'carts.db')}")
+
+
+def _workload(users, products: int, edits: int, duration: float, checkout_rate: float, seed: int):
+    """[(at, user_id, action, product_id, quantity)] sorted by simulated time."""
+    rng = random.Random(seed)
+    events = []
+    for user_id in users:
+        start = rng.uniform(0, duration * 0.5)
+        at = start
+        held = []
+        for _ in range(edits):
+            at += rng.expovariate(edits / (duration * 0.5))
+            if held and rng.random() < 0.3:
+                events.append((at, user_id, "remove", held.pop(rng.randrange(len(held))), 0))
+            else:
+                pid = rng.randint(1, products)
+                held.append(pid)
+                events.append((at, user_id, "add", pid, rng.randint(1, 3)))
+        if rng.random() < checkout_rate:
+            events.append((at + 1, user_id, "checkout", 0, 0))
+    return sorted(events)
+
+
+def _snapshot(db, models, orders_before: int):
+    carts = sorted(
+        (u, p, q) for u, p, q in db.query(models.CartItem.user_id, models.CartItem.product_id, models.CartItem.quantity)
+    )
+    return carts, db.query(models.Order).count() - orders_before
+
+
+def run(kind: str, events, interval: float, engine, models, cartstore, crud):
+    from sqlalchemy import event
+    from app.database import SessionLocal
+
+    db = SessionLocal()
+    db.query(models.CartItem).delete()
+    db.commit()
+    orders_before = db.query(models.Order).count()
+    db.close()
+
+    path = os.path.join(tempfile.mkdtemp(), "carts.sqlite3")
+    store = (
+        cartstore.WriteBehindCartStore(cartstore.SQLiteCarts(path), interval=interval) if kind == "local"
+        else cartstore.make_store(kind)
+    )
+    commits = [0]
+
+    def count(conn):
+        commits[0] += 1
+
+    event.listen(engine, "commit", count)
+    started = time.perf_counter()
+    next_flush = interval
+    try:
+        for at, user_id, action, product_id, quantity in events:
+            while store.write_behind and at >= next_flush:
+                store.flush()
+                next_flush += interval
+            db = SessionLocal()
+            try:
+                if action == "add":
+                    store.add(db, user_id, product_id, quantity)
+                elif action == "remove":
+                    store.remove(db, user_id, product_id)
+                else:
+                    store.before_checkout(user_id)
+                    items = crud.get_cart_items(db, user_id)
+                    if items:
+                        total = sum(ci.product.price * ci.quantity for ci in items)
+                        crud.create_order(db, user_id, total, items)
+                    store.after_checkout(user_id)
+            finally:
+                db.close()
+        store.stop()  # the shutdown flush
+        elapsed = time.perf_counter() - started
+    finally:
+        event.remove(engine, "commit", count)
+
+    db = SessionLocal()
+    try:
+        snapshot = _snapshot(db, models, orders_before)
+    finally:
+        db.close()
+    return {"commits": commits[0], "seconds": elapsed, "snapshot": snapshot}
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--users", type=int, default=200)
+    parser.add_argument("--products", type=int, default=500)
+    parser.add_argument("--edits", type=int, default=20, help="cart edits per user")
+    parser.add_argument("--duration", type=float, default=600, help="simulated seconds")
+    parser.add_argument("--interval", type=float, default=5, help="simulated seconds between flushes")
+    parser.add_argument("--checkout-rate", type=float, default=0.3)
+    parser.add_argument("--seed", type=int, default=42)
+    args = parser.parse_args(argv)
+
+    from app import cartstore, crud, datagen, models
+    from app.database import engine
+
+    datagen.generate(
+        engine, products=args.products, users=args.users, orders=0,
+        stock=(1_000_000, 1_000_000), seed=args.seed, reset=True, log=lambda *a: None,
+    )
+    from app.database import SessionLocal
+    db = SessionLocal()
+    users = [u for (u,) in db.query(models.User.id).filter(models.User.role == "customer").order_by(models.User.id)]
+    db.close()
+
+    events = _workload(users, args.products, args.edits, args.duration, args.checkout_rate, args.seed)
+    edits = sum(1 for e in events if e[2] != "checkout")
+    print(f"{len(users)} users, {edits} cart edits, {len(events) - edits} checkouts, "
+          f"flush every {args.interval:g}s over {args.duration:g}s")
+    print(f"{'store':<8} {'commits':>8} {'per edit':>9} {'seconds':>8}  same result")
+
+    reference = None
+    for kind in ("db", "memory", "local"):
+        result = run(kind, events, args.interval, engine, models, cartstore, crud)
+        reference = reference or result["snapshot"]
+        print(f"{kind:<8} {result['commits']:>8} {result['commits'] / edits:>9.3f} {result['seconds']:>8.2f}  "
+              f"{result['snapshot'] == reference}")
+
+
+if __name__ == "__main__":
+    main()
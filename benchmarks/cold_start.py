@@ -0,0 +1,88 @@
+"""
+Cold start measurement: spawn a real server process and time how long it takes
+until the first request succeeds.
+
+    python -m benchmarks.cold_start                  # uvicorn, 1 worker
+    python -m benchmarks.cold_start --gunicorn -w 4  # production entrypoint
+
+Prints wall time from spawn to first 200 on /ready, plus the app's own
+`app_startup_seconds` (import duration and import-to-first-request).
+"""
+import argparse
+import json
+import os
+import socket
+import subprocess
+import sys
+import tempfile
+import time
+import urllib.request
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def _free_port() -> int:
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+def _get(url: str):
+    with urllib.request.urlopen(url, timeout=1) as r:
+        return r.status, r.read()
+
+
+def measure(cmd, env, port: int, timeout: float = 60.0) -> dict:
+    spawned = time.perf_counter()
+    proc = subprocess.Popen(cmd, cwd=ROOT, env=env, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+    try:
+        while time.perf_counter() - spawned < timeout:
+            try:
+                status, body = _get(f"http://127.0.0.1:{port}/ready")
+            except OSError:
+                time.sleep(0.005)
+                continue
+            if status == 200:
+                ready = round(time.perf_counter() - spawned, 4)
+                # first_request is recorded once that first response is done, so ask again
+                _, body = _get(f"http://127.0.0.1:{port}/ready")
+                return {"spawn_to_ready_s": ready, "app": json.loads(body)["startup_seconds"]}
+        raise RuntimeError("server did not become ready in time")
+    finally:
+        proc.terminate()
+        proc.wait()
+
+
+def main(argv=None) -> int:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--gunicorn", action="store_true", help="use gunicorn.conf.py instead of plain uvicorn")
+    parser.add_argument("-w", "--workers", type=int, default=1)
+    parser.add_argument("--runs", type=int, default=5)
+    parser.add_argument("--database-url", help="defaults to a migrated temp SQLite file")
+    args = parser.parse_args(argv)
+
+    env = dict(os.environ)
+    tmpdir = tempfile.TemporaryDirectory()
+    env["DATABASE_URL"] = args.database_url or f"sqlite:///{os.path.join(tmpdir.name, 'cold.db')}"
+    subprocess.run([sys.executable, "-m", "app.migrate"], cwd=ROOT, env=env, check=True, stdout=subprocess.DEVNULL)
+
+    results = []
+    for _ in range(args.runs):
+        port = _free_port()
+        if args.gunicorn:
+            env["PORT"] = str(port)
+            env["WEB_CONCURRENCY"] = str(args.workers)
+            cmd = [sys.executable, "-m", "gunicorn", "-c", "gunicorn.conf.py", "app.main:app"]
+        else:
+            cmd = [sys.executable, "-m", "uvicorn", "app.main:app", "--port", str(port), "--workers", str(args.workers)]
+        results.append(measure(cmd, env, port))
+        print(json.dumps(results[-1]))
+
+    spawn = sorted(r["spawn_to_ready_s"] for r in results)
+    print(f"spawn -> first request: min={spawn[0]:.3f}s median={spawn[len(spawn) // 2]:.3f}s max={spawn[-1]:.3f}s")
+    tmpdir.cleanup()
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
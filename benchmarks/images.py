@@ -0,0 +1,97 @@
+"""
+Image serving benchmark: the old `StaticFiles` mount against `ImageFiles`.
+
+    python -m benchmarks.images [--files 50] [--size 200000] [--requests 2000]
+
+Writes `--files` random images through `images.save_upload` and serves the
+directory both ways in-process (httpx over ASGI, so no network is involved).
+Three request patterns are run against each:
+
+- `full`: plain GETs, as a browser with an empty cache does;
+- `revalidate`: GETs with the `If-None-Match` from a previous response, as a
+  browser does when its copy has expired;
+- `range`: `Range` requests for the middle third of each image, as a resumed
+  download or a media player does.
+
+The report shows requests per second, response bytes per request, and the
+status codes seen. With `ImageFiles` a browser mostly never sends the
+`revalidate` request at all, because the response is cacheable for a year.
+"""
+import argparse
+import asyncio
+import io
+import os
+import random
+import tempfile
+import time
+from collections import Counter
+
+import httpx
+from starlette.datastructures import UploadFile
+from starlette.staticfiles import StaticFiles
+
+from app import images
+
+
+def _seed(directory: str, files: int, size: int, seed: int):
+    rng = random.Random(seed)
+    names = []
+    for i in range(files):
+        upload = UploadFile(io.BytesIO(rng.randbytes(size)), filename=f"photo-{i}.jpg")
+        names.append(images.save_upload(upload, directory).rpartition("/")[2])
+    return names
+
+
+async def _run(app, names, pattern: str, requests: int, seed: int, size: int):
+    rng = random.Random(seed)
+    byte_range = f"bytes={size // 3}-{2 * size // 3 - 1}"
+    transport = httpx.ASGITransport(app=app)
+    async with httpx.AsyncClient(transport=transport, base_url="http://bench") as client:
+        etags = {}
+        for name in names:
+            etags[name] = (await client.get(f"/{name}")).headers.get("etag")
+        statuses, sent = Counter(), 0
+        started = time.perf_counter()
+        for _ in range(requests):
+            name = rng.choice(names)
+            headers = {}
+            if pattern == "revalidate" and etags[name]:
+                headers["if-none-match"] = etags[name]
+            elif pattern == "range":
+                headers["range"] = byte_range
+            response = await client.get(f"/{name}", headers=headers)
+            statuses[response.status_code] += 1
+            sent += len(response.content)
+        elapsed = time.perf_counter() - started
+    return {"rps": requests / elapsed, "bytes": sent / requests, "statuses": dict(statuses)}
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--files", type=int, default=50)
+    parser.add_argument("--size", type=int, default=200_000, help="bytes per image")
+    parser.add_argument("--requests", type=int, default=2000, help="requests per pattern")
+    parser.add_argument("--seed", type=int, default=42)
+    args = parser.parse_args(argv)
+    if args.size < 3:
+        parser.error("--size must be at least 3 bytes")
+
+    directory = tempfile.mkdtemp()
+    names = _seed(directory, args.files, args.size, args.seed)
+    apps = {
+        "static": StaticFiles(directory=directory),
+        "images": images.ImageFiles(directory),
+    }
+    print(f"{args.files} images of {args.size} bytes, {args.requests} requests per pattern")
+    print(f"{'app':<7} {'pattern':<11} {'req/s':>8} {'bytes/req':>10}  statuses")
+    for pattern in ("full", "revalidate", "range"):
+        for label, app in apps.items():
+            result = asyncio.run(_run(app, names, pattern, args.requests, args.seed, args.size))
+            print(f"{label:<7} {pattern:<11} {result['rps']:>8.0f} {result['bytes']:>10.0f}  {result['statuses']}")
+    for name in os.listdir(directory):
+        os.unlink(os.path.join(directory, name))
+    os.rmdir(directory)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,277 @@
+"""
+In-process load/latency benchmark.
+
+Drives `app.main:app` through httpx's ASGI transport (no network, no server)
+against a freshly seeded database and reports p50/p95/p99 latency and
+throughput per scenario. Results are compared against `baseline.json`; any
+scenario slower than its threshold makes the run exit with status 1.
+
+    python -m benchmarks.run                      # temp SQLite database
+    python -m benchmarks.run --database-url postgresql://localhost/grocery_bench
+    python -m benchmarks.run --update-baseline    # record new thresholds
+
+The database is dropped and recreated, so only point it at a throwaway DB.
+"""
+import argparse
+import asyncio
+import json
+import os
+import random
+import sys
+import tempfile
+import time
+from datetime import datetime, timedelta
+
+BASELINE_PATH = os.path.join(os.path.dirname(__file__), "baseline.json")
+CATEGORIES = ["Fruits", "Vegetables", "Dairy", "Bakery", "Meat", "Seafood", "Beverages", "Snacks"]
+PROMO_CODE = "BENCH10"
+
+
+# ---------- data ----------
+
+def seed_bench(engine, db, models, users: int, products: int, orders: int, seed: int):
+    """Synthetic catalog and order history plus the promo code used by checkout."""
+    from app import datagen
+
+    datagen.generate(
+        engine, products=products, users=users, orders=orders,
+        stock=(1_000_000, 1_000_000), seed=seed, reset=True, log=lambda *a: None,
+    )
+    db.add(models.PromoCode(
+        code=PROMO_CODE, discount_percent=10, min_order_amount=0,
+        expires_at=datetime.utcnow() + timedelta(days=365),
+    ))
+    db.commit()
+
+
+# ---------- scenarios ----------
+# Each scenario is (prepare, request). `prepare` runs untimed before every
+# request; `request` is the single HTTP call being measured.
+
+async def _nothing(client, ctx, slot):
+    return None
+
+
+async def _login(client, ctx, slot):
+    return await client.post("/auth/token", data={"username": f"user{slot}@example.com", "password": ctx["password"]})
+
+
+async def _products_plain(client, ctx, slot):
+    return await client.get("/products/")
+
+
+async def _products_category(client, ctx, slot):
+    return await client.get("/products/", params={"category": ctx["rng"].choice(CATEGORIES)})
+
+
+async def _products_popular(client, ctx, slot):
+    return await client.get("/products/", params={"popular": "most"})
+
+
+async def _cart_add(client, ctx, slot):
+    body = {"product_id": ctx["rng"].randint(1, ctx["products"]), "quantity": 1}
+    return await client.post("/cart/", json=body, headers=ctx["customer_headers"][slot])
+
+
+async def _fill_cart(client, ctx, slot):
+    for pid in ctx["rng"].sample(range(1, ctx["products"] + 1), 3):
+        await client.post("/cart/", json={"product_id": pid, "quantity": 1}, headers=ctx["customer_headers"][slot])
+
+
+async def _checkout(client, ctx, slot):
+    return await client.post(
+        "/orders/checkout", params={"promo_code": PROMO_CODE}, headers=ctx["customer_headers"][slot]
+    )
+
+
+async def _sales_report(client, ctx, slot):
+    return await client.get("/orders/sales-report", headers=ctx["manager_headers"])
+
+
+SCENARIOS = {
+    "login": (_nothing, _login),
+    "products_list": (_nothing, _products_plain),
+    "products_category": (_nothing, _products_category),
+    "products_popular": (_nothing, _products_popular),
+    "cart_add": (_nothing, _cart_add),
+    "checkout_promo": (_fill_cart, _checkout),
+    "sales_report": (_nothing, _sales_report),
+}
+
+
+# ---------- runner ----------
+
+def percentile(sorted_values, pct: float) -> float:
+    if not sorted_values:
+        return 0.0
+    rank = max(0, min(len(sorted_values) - 1, round(pct / 100 * len(sorted_values) + 0.5) - 1))
+    return sorted_values[rank]
+
+
+async def run_scenario(client, ctx, name: str, requests: int, concurrency: int) -> dict:
+    prepare, request = SCENARIOS[name]
+    remaining = iter(range(requests))
+    latencies, errors = [], 0
+    busy = 0.0
+
+    async def worker(slot):
+        nonlocal errors, busy
+        for _ in remaining:
+            await prepare(client, ctx, slot)
+            start = time.perf_counter()
+            response = await request(client, ctx, slot)
+            elapsed = time.perf_counter() - start
+            busy += elapsed
+            latencies.append(elapsed)
+            if response.status_code >= 400:
+                errors += 1
+
+    wall = time.perf_counter()
+    await asyncio.gather(*(worker(slot) for slot in range(concurrency)))
+    wall = time.perf_counter() - wall
+
+    latencies.sort()
+    return {
+        "requests": len(latencies),
+        "errors": errors,
+        "p50_ms": round(percentile(latencies, 50) * 1000, 2),
+        "p95_ms": round(percentile(latencies, 95) * 1000, 2),
+        "p99_ms": round(percentile(latencies, 99) * 1000, 2),
+        # throughput over time spent in measured calls, so untimed prepare steps don't count
+        "rps": round(len(latencies) / (busy / concurrency), 1) if busy else 0.0,
+        "wall_s": round(wall, 3),
+    }
+
+
+def check_regressions(results: dict, baseline: dict) -> list:
+    failures = []
+    for name, limits in baseline.get("scenarios", {}).items():
+        result = results.get(name)
+        if result is None:
+            continue
+        if result["errors"]:
+            failures.append(f"{name}: {result['errors']} failed requests")
+        if "max_p95_ms" in limits and result["p95_ms"] > limits["max_p95_ms"]:
+            failures.append(f"{name}: p95 {result['p95_ms']}ms > {limits['max_p95_ms']}ms")
+        if "min_rps" in limits and result["rps"] < limits["min_rps"]:
+            failures.append(f"{name}: {result['rps']} req/s < {limits['min_rps']} req/s")
+    return failures
+
+
+def write_baseline(path: str, results: dict, headroom: float, meta: dict):
+    baseline = {
+        "description": "Regression thresholds for benchmarks/run.py. Regenerate with --update-baseline.",
+        "headroom": headroom,
+        "settings": meta,
+        "scenarios": {
+            name: {
+                "max_p95_ms": round(r["p95_ms"] * (1 + headroom), 2),
+                "min_rps": round(r["rps"] / (1 + headroom), 1),
+            }
+            for name, r in results.items()
+        },
+    }
+    with open(path, "w") as f:
+        json.dump(baseline, f, indent=2)
+        f.write("\n")
+
+
+async def _main(args, app, ctx) -> dict:
+    import httpx
+
+    transport = httpx.ASGITransport(app=app)
+    async with httpx.AsyncClient(transport=transport, base_url="http://bench") as client:
+        results = {}
+        for name in args.scenarios:
+            # a short warm-up so first-call imports and pool creation are not measured
+            await run_scenario(client, ctx, name, min(4 * args.concurrency, args.requests), args.concurrency)
+            results[name] = await run_scenario(client, ctx, name, args.requests, args.concurrency)
+            r = results[name]
+            print(
+                f"{name:<20} p50={r['p50_ms']:>8.2f}ms  p95={r['p95_ms']:>8.2f}ms  "
+                f"p99={r['p99_ms']:>8.2f}ms  {r['rps']:>8.1f} req/s  errors={r['errors']}"
+            )
+    return results
+
+
+def main(argv=None) -> int:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--database-url", help="throwaway database to use (default: temp SQLite file)")
+    parser.add_argument("--requests", type=int, default=200, help="measured requests per scenario")
+    parser.add_argument("--concurrency", type=int, default=8)
+    parser.add_argument("--products", type=int, default=500)
+    parser.add_argument("--orders", type=int, default=2000)
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--scenarios", nargs="+", default=list(SCENARIOS), choices=list(SCENARIOS))
+    parser.add_argument("--baseline", default=BASELINE_PATH)
+    parser.add_argument("--update-baseline", action="store_true")
+    parser.add_argument(
+        "--headroom", type=float, default=1.0,
+        help="slack when writing a baseline: p95 may grow and throughput shrink by this factor",
+    )
+    parser.add_argument("--output", help="write raw results as JSON to this path")
+    args = parser.parse_args(argv)
+
+    tmpdir = None
+    if not args.database_url:
+        tmpdir = tempfile.TemporaryDirectory()
+        args.database_url = f"sqlite:///{os.path.join(tmpdir.name, 'bench.db')}"
+    # must be set before the app (and its engine) is imported
+    os.environ["DATABASE_URL"] = args.database_url
+    # the login scenario is one client hammering /auth/token on purpose
+    os.environ.setdefault("RATE_LIMIT_ENABLED", "0")
+
+    from app import models, auth, datagen
+    from app.database import engine, SessionLocal
+    from app.main import app
+
+    db = SessionLocal()
+    try:
+        seed_bench(engine, db, models, args.concurrency, args.products, args.orders, args.seed)
+        customers = (
+            db.query(models.User).filter(models.User.email.like("user%@example.com"))
+            .order_by(models.User.id).all()
+        )
+        manager = db.query(models.User).filter_by(role="manager").first()
+        ctx = {
+            "rng": random.Random(args.seed),
+            "password": datagen.PASSWORD,
+            "products": args.products,
+            "customer_headers": [
+                {"Authorization": "Bearer " + auth.create_access_token({"user_id": u.id, "role": u.role})}
+                for u in customers
+            ],
+            "manager_headers": {
+                "Authorization": "Bearer " + auth.create_access_token({"user_id": manager.id, "role": "manager"})
+            },
+        }
+    finally:
+        db.close()
+
+    results = asyncio.run(_main(args, app, ctx))
+    engine.dispose()
+    if tmpdir:
+        tmpdir.cleanup()
+
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(results, f, indent=2)
+
+    meta = {k: getattr(args, k) for k in ("requests", "concurrency", "products", "orders")}
+    if args.update_baseline:
+        write_baseline(args.baseline, results, args.headroom, meta)
+        print(f"baseline written to {args.baseline}")
+        return 0
+
+    if not os.path.exists(args.baseline):
+        print("no baseline found, skipping regression check")
+        return 0
+    with open(args.baseline) as f:
+        failures = check_regressions(results, json.load(f))
+    for failure in failures:
+        print("REGRESSION", failure)
+    return 1 if failures else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,88 @@
+"""
+Serialization micro-benchmark: cost of turning 1,000 `Product` rows into a
+response body.
+
+    python -m benchmarks.serialization [--products 1000] [--rounds 200]
+
+"default" is what FastAPI does for `response_model=List[ProductOut]`
+(validate, serialize to Python objects, then stdlib json). "fast" is
+`app.fastjson.PRODUCT_LIST.render`. The compression lines show what
+gzip/brotli add on top of the fast path.
+"""
+import argparse
+import asyncio
+import os
+import random
+import time
+from datetime import datetime
+from typing import List
+
+os.environ.setdefault("DATABASE_URL", "sqlite://")
+
+
+def _products(n: int):
+    from app import models
+
+    rng = random.Random(1)
+    now = datetime.utcnow()
+    return [
+        models.Product(
+            id=i, name=f"Product {i}", category=rng.choice(["Fruits", "Dairy", "Bakery"]),
+            price=round(rng.uniform(1, 100), 2), stock=rng.randint(0, 500),
+            image_url=None, created_at=now, updated_at=now,
+        )
+        for i in range(1, n + 1)
+    ]
+
+
+def _timeit(fn, rounds: int) -> float:
+    fn()  # warm-up
+    start = time.perf_counter()
+    for _ in range(rounds):
+        fn()
+    return (time.perf_counter() - start) / rounds
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--products", type=int, default=1000)
+    parser.add_argument("--rounds", type=int, default=200)
+    args = parser.parse_args(argv)
+
+    from fastapi.responses import JSONResponse
+    from fastapi.routing import serialize_response
+    from fastapi.utils import create_model_field
+    from app import schemas, fastjson, compression
+
+    rows = _products(args.products)
+    field = create_model_field(name="Response_list_products", type_=List[schemas.ProductOut], mode="serialization")
+    loop = asyncio.new_event_loop()
+
+    def default_path():
+        content = loop.run_until_complete(serialize_response(field=field, response_content=rows))
+        return JSONResponse(content).body
+
+    def fast_path():
+        return fastjson.PRODUCT_LIST.render(rows)
+
+    assert len(default_path()) > 0 and default_path().replace(b" ", b"") == fast_path().replace(b" ", b"")
+    body = fast_path()
+    per = 1000 / args.products
+    results = [
+        ("default (validate + jsonable + json)", _timeit(default_path, args.rounds)),
+        ("fast (prebuilt TypeAdapter)", _timeit(fast_path, args.rounds)),
+        ("gzip of fast body", _timeit(lambda: compression._compress(body, "gzip"), args.rounds)),
+    ]
+    if compression.brotli is not None:
+        results.append(("brotli of fast body", _timeit(lambda: compression._compress(body, "br"), args.rounds)))
+
+    print(f"{args.products} products, body {len(body)} bytes "
+          f"(gzip {len(compression._compress(body, 'gzip'))} bytes)")
+    for name, seconds in results:
+        print(f"{name:<40} {seconds * per * 1000:8.3f} ms per 1,000 products")
+    print(f"speed-up: {results[0][1] / results[1][1]:.1f}x")
+    loop.close()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,25 @@
+# Production entrypoint:
+#   python -m app.migrate && gunicorn -c gunicorn.conf.py app.main:app
+import multiprocessing
+import os
+
+bind = f"0.0.0.0:{os.getenv('PORT', '8000')}"
+workers = int(os.getenv("WEB_CONCURRENCY", multiprocessing.cpu_count() * 2 + 1))
+worker_class = "uvicorn.workers.UvicornWorker"
+
+# Import the app once in the master; workers are forked with it already loaded
+preload_app = True
+
+timeout = int(os.getenv("GUNICORN_TIMEOUT", 60))
+graceful_timeout = int(os.getenv("GUNICORN_GRACEFUL_TIMEOUT", 30))
+keepalive = 5
+# Recycle workers now and then so slow leaks can't build up
+max_requests = int(os.getenv("GUNICORN_MAX_REQUESTS", 10000))
+max_requests_jitter = max_requests // 10
+
+
+def post_fork(server, worker):
+    # Connections opened in the master must not be shared with forked workers.
+    # close=False leaves the parent's sockets alone and just drops the pool.
+    from app.database import engine
+    engine.dispose(close=False)